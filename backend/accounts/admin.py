@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from lms.search import STUDENT_FIELDS, IndexedSearchMixin
+
 from .models import User
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(IndexedSearchMixin, UserAdmin):
     list_display = ('username', 'email', 'is_teacher', 'is_staff', 'is_active')
-    search_fields = ('username', 'email')
+    search_fields = STUDENT_FIELDS
     ordering = ('username',)
     list_filter = ('is_teacher', 'is_staff', 'is_superuser', 'is_active')
 
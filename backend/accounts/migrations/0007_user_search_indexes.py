@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# Trigram GIN indexes on the expressions Django's icontains/istartswith compile to on
+# PostgreSQL (UPPER(col::text) LIKE ...), used by lms.search and the admin search box.
+# Other databases keep plain LIKE scans.
+COLUMNS = ('username', 'email', 'full_name')
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS accounts_user_{column}_trgm '
+            f'ON accounts_user USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS accounts_user_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_user_address_user_dob_user_full_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
@@ -22,6 +23,37 @@ class User(AbstractUser):
         for badge in applicable_badges:
             UserBadge.objects.get_or_create(user=self, badge=badge)
 
+    def award_xp(self, amount, source=''):
+        """
+        Add XP with a single UPDATE and record an XPAwarded event in the same
+        transaction. Badge checks run in the event consumer, off the request path.
+        """
+        from lms import events
+        with transaction.atomic():
+            User.objects.filter(pk=self.pk).update(
+                xp=F('xp') + amount,
+                level=(F('xp') + amount) / 1000 + 1,  # 1000 XP per level
+            )
+            self.refresh_from_db(fields=['xp', 'level'])
+            events.emit(events.XP_AWARDED, user_id=self.pk, amount=amount, source=source)
+
+    @classmethod
+    def award_xp_many(cls, amounts, source=''):
+        """award_xp() for {user_id: amount}: one UPDATE for everyone and one XPAwarded event per user."""
+        from lms import events
+        amounts = {user_id: amount for user_id, amount in amounts.items() if amount}
+        if not amounts:
+            return
+        added = Case(*[When(pk=user_id, then=Value(amount)) for user_id, amount in amounts.items()], default=Value(0))
+        with transaction.atomic():
+            cls.objects.filter(pk__in=amounts).update(
+                xp=F('xp') + added,
+                level=(F('xp') + added) / 1000 + 1,  # 1000 XP per level
+            )
+            events.emit_many(events.XP_AWARDED, [
+                {'user_id': user_id, 'amount': amount, 'source': source} for user_id, amount in amounts.items()
+            ])
+
     def save(self, *args, **kwargs):
         is_xp_update = False
         if self.pk:
@@ -1,3 +1,28 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from lms.testing import PASSWORD, Endpoint, QueryBudgetMixin
+
+
+def register(d):
+    d.registered = getattr(d, 'registered', 0) + 1
+    return None, reverse('register'), {
+        'email': f'new{d.registered}@example.com', 'username': f'new{d.registered}', 'password': PASSWORD,
+        'full_name': 'New Student', 'school_name': 'Vetri School', 'standard_grade': '8',
+    }
+
+
+ACCOUNTS_ENDPOINTS = [
+    Endpoint('register', 'post', register, max_queries=3),
+    Endpoint('login', 'post', lambda d: (None, reverse('login'), {'email': d.student.email, 'password': PASSWORD}), max_queries=1),
+    Endpoint('profile', 'get', lambda d: (d.student, reverse('profile'), None), max_queries=0),
+    Endpoint('user-list', 'get', lambda d: (d.student, reverse('user-list'), None), max_queries=1, max_ms=3000),
+    Endpoint('token_refresh', 'post', lambda d: (None, reverse('token_refresh'), {'refresh': str(RefreshToken.for_user(d.student))}), max_queries=1),
+]
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AccountsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    url_module = 'accounts.urls'
+    endpoints = ACCOUNTS_ENDPOINTS
@@ -2,12 +2,14 @@
 # Usage: gunicorn lms_backend.wsgi -c gunicorn.conf.py
 
 import multiprocessing
+import os
 
 # Workers: 2 * CPU cores + 1 (recommended by Gunicorn docs)
-workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
 
-# Threads per worker (for I/O-bound Django views)
-threads = 2
+# Threads per worker (for I/O-bound Django views). settings.py sizes each worker's
+# database pool from the same variable, so keep it in the environment, not here.
+threads = int(os.getenv("GUNICORN_THREADS", "2"))
 
 # Worker class: gthread enables threading within each worker
 worker_class = "gthread"
@@ -21,9 +23,11 @@ timeout = 120
 # Graceful timeout: allow 30s for worker to finish current request on restart
 graceful_timeout = 30
 
-# Max requests before worker auto-restarts (prevents memory leaks)
-max_requests = 1000
-max_requests_jitter = 50
+# Max requests before a worker restarts. Restarting throws away the worker's LocMem cache,
+# so check per-worker RSS (admin -> Memory samples, /api/monitoring/memory/) before lowering
+# this; 0 disables restarts.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "50"))
 
 # Logging
 accesslog = "-"  # stdout
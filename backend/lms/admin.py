@@ -1,32 +1,94 @@
+import csv
+
 from django.contrib import admin
+from django.contrib.admin import helpers
 from django.template.response import TemplateResponse
 from django.urls import path
 from django.http import HttpResponseRedirect
 from django.contrib import messages
 from django.utils.html import format_html
+from django.db import transaction
+from django.db.models import Avg, Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import timedelta
 from datetime import date as dt_date
 from .models import (
     Course, Enrollment, Grade, Attendance, AttendanceLog, Badge, UserBadge, 
     Competition, CompetitionParticipant, QuizQuestion, CodingQuestion, 
     EnglishQuestion, MemorySet, MemoryQuestion, CompetitionAttempt, 
-    TeacherCourseAssignment, DailyChallenge, DailyChallengeQuestion, ChallengeSubmission
+    TeacherCourseAssignment, DailyChallenge, DailyChallengeQuestion, ChallengeSubmission,
+    DomainEvent, EventConsumerOffset, Job, AttendanceArchive, AttendanceBitmap, StudentImport, attendance_percentage_subquery, attendance_stats_subqueries
 )
+from . import bitmaps, events, grades, roster
+from .search import IndexedSearchMixin, student_fields
 
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('course_name', 'duration', 'total_classes_completed', 'get_student_count', 'get_avg_attendance', 'created_at')
     fields = ('course_name', 'course_description', 'duration', 'course_image', 'total_classes_completed')
     search_fields = ('course_name',)
-    
-    @admin.display(description='Students')
+    actions = ['bulk_enroll']
+
+    def get_queryset(self, request):
+        # Subqueries rather than Count('enrollments'): a join would put the average into GROUP BY
+        enrollments = Enrollment.objects.filter(course=OuterRef('pk')).order_by().values('course_id')
+        # Mean of the enrollments' percentages, as Course.average_attendance computes it row by row.
+        # Aggregated inline: annotating the percentage first would add it to the GROUP BY.
+        average = Avg(attendance_percentage_subquery('student_id', 'course_id'))
+        return super().get_queryset(request).annotate(
+            student_count=Coalesce(Subquery(enrollments.annotate(n=Count('id')).values('n')), 0),
+            avg_attendance=Coalesce(Subquery(
+                enrollments.filter(attendance__isnull=False).annotate(avg=average).values('avg'),
+            ), Value(0.0)),
+        )
+
+    @admin.display(description='Students', ordering='student_count')
     def get_student_count(self, obj):
-        return obj.total_students if hasattr(obj, 'enrollments') else 0
+        return obj.student_count
 
-    @admin.display(description='Avg Attendance')
+    @admin.display(description='Avg Attendance', ordering='avg_attendance')
     def get_avg_attendance(self, obj):
-        if hasattr(obj, 'enrollments'):
-            return f"{obj.average_attendance:.1f}%"
-        return "N/A"
+        return f"{obj.avg_attendance:.1f}%"
+
+    @admin.action(description='Enroll students in the selected course…')
+    def bulk_enroll(self, request, queryset):
+        """Intermediate page: paste ids, usernames or emails, or upload a CSV, then enroll them set-based."""
+        courses = list(queryset.order_by().values_list('id', 'course_name')[:2])
+        if len(courses) != 1:
+            self.message_user(request, 'Select exactly one course to enroll students in.', messages.WARNING)
+            return None
+        course_id, course_name = courses[0]
+
+        if 'apply' in request.POST:
+            identifiers = request.POST.get('students', '').split()
+            upload = request.FILES.get('file')
+            if upload is not None:
+                try:
+                    identifiers += roster.read_csv(upload.read())
+                except (UnicodeDecodeError, csv.Error):
+                    self.message_user(request, 'The file must be a UTF-8 CSV.', messages.ERROR)
+                    return None
+            if len(identifiers) > roster.MAX_STUDENTS:
+                self.message_user(request, f'At most {roster.MAX_STUDENTS} students at a time.', messages.ERROR)
+                return None
+            report = roster.enroll_report(course_id, identifiers)
+            self.message_user(
+                request,
+                f'{course_name}: {report["created"]} enrolled, {report["skipped"]} already enrolled, '
+                f'{len(report["unknown"])} not found{": " + ", ".join(report["unknown"][:20]) if report["unknown"] else ""}.',
+                messages.SUCCESS if not report['unknown'] else messages.WARNING,
+            )
+            return None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Enroll students in {course_name}',
+            'opts': self.model._meta,
+            'course_id': course_id,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/lms/bulk_enroll.html', context)
 
 class GradeInline(admin.StackedInline):
     model = Grade
@@ -37,97 +99,117 @@ class AttendanceInline(admin.StackedInline):
     extra = 1
 
 @admin.register(Enrollment)
-class EnrollmentAdmin(admin.ModelAdmin):
+class EnrollmentAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('student', 'course', 'get_grade', 'get_attendance', 'enrollment_date')
     list_filter = ('course', 'enrollment_date')
-    search_fields = ('student__email', 'student__username', 'course__course_name')
+    search_fields = student_fields('student__') + ('course__course_name',)
     inlines = [GradeInline, AttendanceInline]
+    list_select_related = ('student', 'course', 'grade', 'attendance')
 
-    @admin.display(description='Grade')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(attendance_pct=attendance_percentage_subquery('student_id', 'course_id'))
+
+    @admin.display(description='Grade', ordering='grade__grade')
     def get_grade(self, obj):
-        try:
-            return obj.grade.grade if hasattr(obj, 'grade') and obj.grade else "N/A"
-        except:
-            return "Error (DB)"
+        grade = getattr(obj, 'grade', None)
+        return grade.grade if grade is not None and grade.grade else "N/A"
 
-    @admin.display(description='Attendance')
+    @admin.display(description='Attendance', ordering='attendance_pct')
     def get_attendance(self, obj):
-        try:
-            if hasattr(obj, 'attendance') and obj.attendance:
-                return f"{obj.attendance.attendance_percentage:.1f}%"
+        if getattr(obj, 'attendance', None) is None:
             return "N/A"
-        except:
-            return "Error (DB)"
+        return f"{obj.attendance_pct:.1f}%"
 
 @admin.register(Grade)
-class GradeAdmin(admin.ModelAdmin):
-    list_display = ('get_student', 'get_course', 'grade', 'updated_at')
+class GradeAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('get_student', 'get_course', 'grade', 'score', 'rank', 'updated_at')
     list_editable = ('grade',)
     list_filter = ('grade', 'enrollment__course')
-    search_fields = ('enrollment__student__username', 'enrollment__student__email', 'enrollment__course__course_name')
+    search_fields = student_fields('enrollment__student__') + ('enrollment__course__course_name',)
+    list_select_related = ('enrollment__student', 'enrollment__course')
+    readonly_fields = ('score', 'rank')
 
-    @admin.display(description='Student')
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Re-ranked once per request, after every edited row is saved
+        request._regraded_courses = getattr(request, '_regraded_courses', set()) | {obj.enrollment.course_id}
+
+    def _recompute_ranks(self, request):
+        courses = getattr(request, '_regraded_courses', None)
+        if courses:
+            grades.recompute_ranks(courses)
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context=extra_context)
+        self._recompute_ranks(request)
+        return response
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        response = super().changeform_view(request, object_id, form_url, extra_context)
+        self._recompute_ranks(request)
+        return response
+
+    @admin.display(description='Student', ordering='enrollment__student__username')
     def get_student(self, obj):
         return obj.enrollment.student
     
-    @admin.display(description='Course')
+    @admin.display(description='Course', ordering='enrollment__course__course_name')
     def get_course(self, obj):
         return obj.enrollment.course
 
 @admin.register(Attendance)
-class AttendanceAdmin(admin.ModelAdmin):
+class AttendanceAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('get_student', 'get_course', 'get_attended', 'get_total', 'get_percent', 'get_last_log')
     list_filter = ('enrollment__course',)
-    search_fields = ('enrollment__student__username', 'enrollment__student__email', 'enrollment__course__course_name')
+    search_fields = student_fields('enrollment__student__') + ('enrollment__course__course_name',)
+    list_select_related = ('enrollment__student', 'enrollment__course')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(**attendance_stats_subqueries('enrollment__student_id', 'enrollment__course_id'))
 
-    @admin.display(description='Student')
+    @admin.display(description='Student', ordering='enrollment__student__username')
     def get_student(self, obj):
         return obj.enrollment.student
 
-    @admin.display(description='Course')
+    @admin.display(description='Course', ordering='enrollment__course__course_name')
     def get_course(self, obj):
         return obj.enrollment.course
 
-    @admin.display(description='Attended')
+    @admin.display(description='Attended', ordering='present_count')
     def get_attended(self, obj):
-        return obj.attended_classes
+        return obj.present_count
 
-    @admin.display(description='Total')
+    @admin.display(description='Total', ordering='log_count')
     def get_total(self, obj):
-        return obj.total_classes
+        return obj.log_count
 
-    @admin.display(description='%')
+    @admin.display(description='%', ordering='attendance_pct')
     def get_percent(self, obj):
-        try:
-            return f"{obj.attendance_percentage:.1f}%"
-        except:
-            return "0%"
+        return f"{obj.attendance_pct:.1f}%"
 
-    @admin.display(description='Last Log')
+    @admin.display(description='Last Log', ordering='last_log')
     def get_last_log(self, obj):
-        try:
-            return obj.last_log_date or "No Logs"
-        except:
-            return "N/A"
+        return obj.last_log or "No Logs"
 
 @admin.register(AttendanceLog)
-class AttendanceLogAdmin(admin.ModelAdmin):
+class AttendanceLogAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('get_student', 'get_course', 'date', 'get_day', 'colored_status', 'status')
     list_editable   = ('status',)  # inline dropdown edit in the list
     list_filter     = ('enrollment__course', 'status', 'date')
-    search_fields   = ('enrollment__student__username', 'enrollment__student__email', 'enrollment__course__course_name')
+    search_fields   = student_fields('enrollment__student__') + ('enrollment__course__course_name',)
     autocomplete_fields = ['enrollment']
     date_hierarchy  = 'date'
     ordering        = ['-date']
     save_as         = True
     actions         = ['mark_all_present', 'mark_all_absent']
+    list_select_related = ('enrollment__student', 'enrollment__course')
 
     # ── column helpers ──────────────────────────────────────────────────────
-    @admin.display(description='Student')
+    @admin.display(description='Student', ordering='enrollment__student__username')
     def get_student(self, obj):
         return obj.enrollment.student.username
 
-    @admin.display(description='Course')
+    @admin.display(description='Course', ordering='enrollment__course__course_name')
     def get_course(self, obj):
         return obj.enrollment.course.course_name
 
@@ -234,6 +316,55 @@ class AttendanceLogAdmin(admin.ModelAdmin):
         }
         return TemplateResponse(request, 'admin/lms/mark_class_attendance.html', context)
 
+@admin.register(AttendanceArchive)
+class AttendanceArchiveAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('student', 'course', 'month', 'days')
+    list_filter = ('course', 'month')
+    search_fields = student_fields('student__')
+    list_select_related = ('student', 'course')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(AttendanceBitmap)
+class AttendanceBitmapAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('student', 'course', 'term', 'get_percentage', 'get_calendar')
+    list_filter = ('course', 'term')
+    search_fields = student_fields('student__')
+    list_select_related = ('student', 'course')
+    exclude = ('present', 'held')
+
+    @admin.display(description='Attendance %')
+    def get_percentage(self, obj):
+        return f"{bitmaps.percentage(*obj.bits())}%"
+
+    @admin.display(description='Calendar')
+    def get_calendar(self, obj):
+        return bitmaps.encode(*obj.bits())
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(StudentImport)
+class StudentImportAdmin(admin.ModelAdmin):
+    list_display = ('id', 'filename', 'course', 'status', 'total_rows', 'created_count', 'failed_count', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    list_select_related = ('course', 'created_by')
+    exclude = ('source',)
+    ordering = ('-id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(Badge)
 class BadgeAdmin(admin.ModelAdmin):
     list_display = ('name', 'points_required')
@@ -292,10 +423,10 @@ class CompetitionParticipantAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'competition__title')
 
 @admin.register(TeacherCourseAssignment)
-class TeacherCourseAssignmentAdmin(admin.ModelAdmin):
+class TeacherCourseAssignmentAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('teacher', 'course', 'assigned_at')
     list_filter = ('teacher', 'course')
-    search_fields = ('teacher__username', 'teacher__email', 'course__course_name')
+    search_fields = student_fields('teacher__') + ('course__course_name',)
     autocomplete_fields = ['teacher', 'course']
 
 class DailyChallengeQuestionInline(admin.TabularInline):
@@ -303,26 +434,84 @@ class DailyChallengeQuestionInline(admin.TabularInline):
     extra = 1
 
 @admin.register(DailyChallenge)
-class DailyChallengeAdmin(admin.ModelAdmin):
+class DailyChallengeAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('mission', 'course', 'challenge_type', 'deadline', 'reward_xp', 'created_at')
     list_filter = ('course', 'challenge_type', 'deadline')
     search_fields = ('mission', 'course__course_name')
     inlines = [DailyChallengeQuestionInline]
 
 @admin.register(ChallengeSubmission)
-class ChallengeSubmissionAdmin(admin.ModelAdmin):
+class ChallengeSubmissionAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('student', 'challenge', 'status', 'submitted_at')
     list_filter = ('status', 'challenge__course')
-    search_fields = ('student__username', 'challenge__mission')
-    readonly_fields = ('submitted_at',)
+    search_fields = student_fields('student__') + ('challenge__mission',)
+    search_full_text = ('text_response',)
+    readonly_fields = ('submitted_at', 'xp_awarded_at')
     
     def save_model(self, request, obj, form, change):
-        # Auto-award XP if manually approved in admin
-        if change and 'status' in form.changed_data and obj.status == 'approved':
-            # Check if he was not already approved (to avoid double XP)
-            # Actually, standard logic in views handles this, but here let's be safe
-            student = obj.student
-            student.xp += obj.challenge.reward_xp
-            student.level = (student.xp // 1000) + 1
-            student.save()
-        super().save_model(request, obj, form, change)
+        # Auto-award XP if manually approved in admin; like the teachers' review (lms/reviews.py), only the
+        # first approval pays
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if obj.status == 'approved' and ChallengeSubmission.objects.filter(pk=obj.pk, xp_awarded_at__isnull=True).update(xp_awarded_at=timezone.now()):
+                obj.student.award_xp(obj.challenge.reward_xp, source=f'challenge:{obj.challenge_id}')
+                events.emit(events.SUBMISSION_APPROVED, submission_id=obj.id, student_id=obj.student_id, challenge_id=obj.challenge_id)
+
+@admin.register(DomainEvent)
+class DomainEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'payload', 'created_at')
+    list_filter = ('event_type',)
+    readonly_fields = ('event_type', 'payload', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(EventConsumerOffset)
+class EventConsumerOffsetAdmin(admin.ModelAdmin):
+    list_display = ('consumer', 'last_event_id', 'get_lag_events', 'get_lag_seconds', 'updated_at')
+
+    def get_queryset(self, request):
+        # events.consumer_lag() in two subqueries, instead of its queries once per row and column
+        return super().get_queryset(request).annotate(
+            head=Subquery(DomainEvent.objects.order_by('-id').values('id')[:1]),
+            oldest_pending=Subquery(
+                DomainEvent.objects.filter(id__gt=OuterRef('last_event_id')).order_by('id').values('created_at')[:1]
+            ),
+        )
+
+    @admin.display(description='Lag (events)')
+    def get_lag_events(self, obj):
+        return max((obj.head or 0) - obj.last_event_id, 0)
+
+    @admin.display(description='Lag (seconds)')
+    def get_lag_seconds(self, obj):
+        return f"{(timezone.now() - obj.oldest_pending).total_seconds() if obj.oldest_pending else 0:.0f}"
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'priority', 'attempts', 'max_attempts', 'run_at', 'started_at', 'finished_at', 'worker')
+    list_filter = ('status', 'name')
+    search_fields = ('name',)
+    readonly_fields = ('attempts', 'last_error', 'worker', 'created_at', 'started_at', 'finished_at')
+    ordering = ('-id',)
+    actions = ['retry_jobs']
+    change_list_template = 'admin/lms/job/change_list.html'
+
+    @admin.action(description='Retry selected jobs now')
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status='running').update(status='queued', run_at=timezone.now(), attempts=0, last_error='')
+        self.message_user(request, f'{updated} job(s) re-queued.', messages.SUCCESS)
+
+    def changelist_view(self, request, extra_context=None):
+        now = timezone.now()
+        last_hour = now - timedelta(hours=1)
+        stats = Job.objects.aggregate(
+            queued=Count('id', filter=Q(status='queued')),
+            due=Count('id', filter=Q(status='queued', run_at__lte=now)),
+            running=Count('id', filter=Q(status='running')),
+            succeeded_last_hour=Count('id', filter=Q(status='succeeded', finished_at__gte=last_hour)),
+            failed_last_hour=Count('id', filter=Q(status='failed', finished_at__gte=last_hour)),
+        )
+        extra_context = extra_context or {}
+        extra_context['job_stats'] = stats
+        return super().changelist_view(request, extra_context=extra_context)
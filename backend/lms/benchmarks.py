@@ -0,0 +1,114 @@
+"""
+Benchmark scenarios for the hot API paths, run by `manage.py benchmark` against a
+dataset loaded with `manage.py generate_dataset` (see monitoring/benchmark.py).
+
+The actors are picked deterministically from the generated rows: the student
+with the most enrollments, the teacher of the largest course, its roster and the
+most-played quiz. Anything a scenario needs that the dataset does not have (a
+staff user, an open contest attempt) is created inside the rolled-back run.
+"""
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.urls import reverse
+
+from monitoring.benchmark import Scenario
+
+from .dataset import EMAIL_DOMAIN
+from .models import (
+    ChallengeSubmission, Competition, CompetitionAttempt, CompetitionParticipant, Course,
+    DailyAttendanceLog, Enrollment, TeacherCourseAssignment,
+)
+
+User = get_user_model()
+
+CLASS_SIZE = 30
+
+
+def build_context():
+    """The actors every scenario uses; None when no generated dataset is loaded."""
+    generated = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+    student = (
+        generated.filter(is_teacher=False)
+        .annotate(courses=Count('enrollments'))
+        .order_by('-courses', 'id')
+        .first()
+    )
+    if student is None:
+        return None
+
+    course = Course.objects.annotate(students=Count('enrollments')).order_by('-students', 'id').first()
+    teacher = User.objects.get(
+        id=TeacherCourseAssignment.objects.filter(course=course).order_by('id').values_list('teacher_id', flat=True)[0]
+    )
+    quiz = (
+        Competition.objects.filter(mode_type='quiz')
+        .annotate(players=Count('participants'))
+        .order_by('-players', 'id')
+        .first()
+    )
+    staff = User.objects.create(
+        email=f'benchmark-staff@{EMAIL_DOMAIN}', username='benchmark-staff', is_staff=True,
+    )
+    roster = list(
+        Enrollment.objects.filter(course=course).order_by('id').values_list('student_id', flat=True)[:CLASS_SIZE]
+    )
+    return SimpleNamespace(
+        student=student,
+        enrollment=Enrollment.objects.filter(student=student).order_by('id').first(),
+        teacher=teacher,
+        staff=staff,
+        course=course,
+        roster=roster,
+        quiz=quiz,
+        answers={str(q.id): q.correct_option for q in quiz.quiz_questions.all()} if quiz else {},
+        # The newest class day in the data, so rosters and marking hit existing logs
+        date=DailyAttendanceLog.objects.filter(course=course).aggregate(d=Max('date'))['d'],
+    )
+
+
+def dataset_summary():
+    """Row counts stored with each result, so comparisons against a different dataset are flagged."""
+    return {
+        model._meta.label: model.objects.count()
+        for model in (User, Enrollment, DailyAttendanceLog, CompetitionParticipant, ChallengeSubmission)
+    }
+
+
+def teacher_mark_attendance(c):
+    return c.teacher, reverse('teacher-mark-attendance'), {
+        'course_id': c.course.id,
+        'date': str(c.date),
+        'attendance': [{'student_id': sid, 'status': 'present' if i % 5 else 'absent'} for i, sid in enumerate(c.roster)],
+    }
+
+
+def mark_attendance(c):
+    return c.staff, reverse('mark-attendance'), {
+        'student_id': c.student.id, 'course_id': c.enrollment.course_id, 'date': str(c.date + timedelta(days=1)),
+        'status': 'present',
+    }
+
+
+def submit_contest(c):
+    # Rolled back after every iteration, so the same student can submit the same contest again
+    CompetitionAttempt.objects.filter(user=c.student, competition=c.quiz).delete()
+    CompetitionAttempt.objects.create(user=c.student, competition=c.quiz)
+    return c.student, reverse('competition-submit', kwargs={'competition_id': c.quiz.id}), {'answers': c.answers}
+
+
+SCENARIOS = [
+    Scenario('dashboard', 'get', lambda c: (c.student, reverse('dashboard'), None)),
+    Scenario('dashboard', 'get', lambda c: (c.staff, reverse('dashboard'), None), label='dashboard [staff]'),
+    Scenario('course-leaderboard', 'get', lambda c: (c.student, reverse('course-leaderboard') + f'?course_id={c.course.id}', None)),
+    Scenario('course-leaderboard', 'get', lambda c: (c.teacher, reverse('course-leaderboard') + '?course_id=all', None), label='course-leaderboard [all]'),
+    Scenario('competition-leaderboard', 'get', lambda c: (c.student, reverse('competition-leaderboard', kwargs={'competition_id': c.quiz.id}), None)),
+    Scenario('teacher-students', 'get', lambda c: (c.teacher, reverse('teacher-students') + f'?course_id={c.course.id}&date={c.date}', None), label='teacher-students [roster]'),
+    Scenario('teacher-mark-attendance', 'post', teacher_mark_attendance, label=f'teacher-mark-attendance [{CLASS_SIZE}]'),
+    Scenario('mark-attendance', 'post', mark_attendance),
+    Scenario('competition-submit', 'post', submit_contest),
+    Scenario('export-attendance', 'get', lambda c: (c.student, reverse('export-attendance', kwargs={'enrollment_id': c.enrollment.id}), None)),
+    Scenario('export-my-attendance', 'get', lambda c: (c.student, reverse('export-my-attendance'), None)),
+]
@@ -0,0 +1,253 @@
+"""
+Attendance as bitsets, one AttendanceBitmap row per (student, course, term).
+
+A term starts on the first day of ATTENDANCE_BITMAPS['TERM_START_MONTH'] and
+lasts a year; bit i stands for day i of the term. `held` marks the days with a
+log (days the class met), `present` the days the student attended, so:
+- the attendance percentage is popcount(present) / popcount(held);
+- a streak is a run of held days without an absence; the absences are
+  held & ~present, and the loop runs once per absence, not once per day;
+- cohort stats combine a class's bitsets: AND of `present` gives the days
+  everybody attended, OR of `held` the days the class met, and bit-sliced
+  counters add all bitsets at once for per-day headcounts;
+- the calendar is sent as a run-length string (encode()).
+
+The write paths that log attendance (MarkAttendanceView,
+TeacherMarkAttendanceView) call record() in the same transaction, with the
+rows locked, so the bitmaps follow the logs exactly; deleting a log (admin,
+cascades) clears its day through forget() (a post_delete receiver in
+lms/signals.py). Archiving a month (lms/partitions.py) keeps its bits, so term
+stats still cover archived months. `manage.py attendance_bitmaps` rebuilds them from the logs and
+archives, e.g. after changing TERM_START_MONTH.
+"""
+from datetime import date, timedelta
+from functools import reduce
+from itertools import chain
+from operator import and_, or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import AttendanceArchive, AttendanceBitmap, DailyAttendanceLog
+
+DEFAULTS = {
+    'TERM_START_MONTH': 6,
+}
+PRESENT, ABSENT, NO_CLASS = 'P', 'A', '-'
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'ATTENDANCE_BITMAPS', {})}
+
+
+def term_start(day):
+    month = config()['TERM_START_MONTH']
+    return date(day.year if day.month >= month else day.year - 1, month, 1)
+
+
+def position(day):
+    """(term, bit index) of `day`."""
+    term = term_start(day)
+    return term, (day - term).days
+
+
+def day_at(term, index):
+    return term + timedelta(days=index)
+
+
+def to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def build(entries):
+    """
+    Folds (student_id, course_id, date, status) entries into
+    {(student_id, course_id, term): [present, held]}. Later entries win.
+    """
+    bitmaps = {}
+    for student_id, course_id, day, status in entries:
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        term, index = position(day)
+        # Ids may come straight from request data
+        key = (int(student_id), None if course_id is None else int(course_id), term)
+        bits = bitmaps.setdefault(key, [0, 0])
+        bit = 1 << index
+        bits[1] |= bit
+        if status == 'present':
+            bits[0] |= bit
+        else:
+            bits[0] &= ~bit
+    return bitmaps
+
+
+def _locked(keys):
+    """The existing rows for `keys`, locked, by key."""
+    courses = {course_id for _, course_id, _ in keys}
+    course_filter = Q(course_id__in=courses - {None})
+    if None in courses:
+        course_filter |= Q(course__isnull=True)
+    rows = (
+        AttendanceBitmap.objects.select_for_update()
+        .filter(course_filter, student_id__in={k[0] for k in keys}, term__in={k[2] for k in keys})
+    )
+    return {(row.student_id, row.course_id, row.term): row for row in rows if (row.student_id, row.course_id, row.term) in keys}
+
+
+@transaction.atomic
+def record(entries):
+    """Applies logged days to the bitmaps. Call inside the transaction that writes the logs."""
+    changes = build(entries)
+    if not changes:
+        return
+    rows = _locked(changes)
+    missing = [key for key in changes if key not in rows]
+    if missing:
+        # A concurrent writer may create the same rows first; lock whatever exists afterwards
+        AttendanceBitmap.objects.bulk_create(
+            [AttendanceBitmap(student_id=s, course_id=c, term=t) for s, c, t in missing],
+            ignore_conflicts=True,
+        )
+        rows = _locked(changes)
+    for key, (present, held) in changes.items():
+        row = rows[key]
+        old_present, old_held = row.bits()
+        row.present = to_bytes((old_present & ~held) | present)
+        row.held = to_bytes(old_held | held)
+    AttendanceBitmap.objects.bulk_update(rows.values(), ['present', 'held'], batch_size=500)
+
+
+@transaction.atomic
+def forget(entries):
+    """Clears the days of deleted logs, (student_id, course_id, date) entries, from the bitmaps."""
+    changes = build((student_id, course_id, day, 'absent') for student_id, course_id, day in entries)
+    rows = _locked(changes)
+    for key, (_, held) in changes.items():
+        row = rows.get(key)
+        if row is not None:
+            present, old_held = row.bits()
+            row.present = to_bytes(present & ~held)
+            row.held = to_bytes(old_held & ~held)
+    AttendanceBitmap.objects.bulk_update(rows.values(), ['present', 'held'])
+
+
+def _archived_entries(archives):
+    for archive in archives.iterator(chunk_size=1000):
+        for day, status in archive.logs():
+            yield archive.student_id, archive.course_id, day, status
+
+
+def rebuild(student_ids=None):
+    """Recomputes the bitmaps of `student_ids` (default: everyone) from logs and archives. Returns the row count."""
+    logs = DailyAttendanceLog.objects.order_by().values_list('student_id', 'course_id', 'date', 'status')
+    archives = AttendanceArchive.objects.order_by()
+    bitmaps = AttendanceBitmap.objects.all()
+    if student_ids is not None:
+        logs = logs.filter(student_id__in=student_ids)
+        archives = archives.filter(student_id__in=student_ids)
+        bitmaps = bitmaps.filter(student_id__in=student_ids)
+    with transaction.atomic():
+        # Archived months first: a live log for the same day is the newer one
+        built = build(chain(_archived_entries(archives), logs.iterator(chunk_size=10000)))
+        bitmaps.delete()
+        AttendanceBitmap.objects.bulk_create(
+            [
+                AttendanceBitmap(student_id=s, course_id=c, term=t, present=to_bytes(present), held=to_bytes(held))
+                for (s, c, t), (present, held) in built.items()
+            ],
+            batch_size=1000,
+        )
+    return len(built)
+
+
+# =============================================================================
+# Operations on (present, held) ints
+# =============================================================================
+
+def percentage(present, held):
+    held_days = held.bit_count()
+    return round(present.bit_count() * 100 / held_days, 2) if held_days else 0.0
+
+
+def streaks(present, held):
+    """(current, longest) runs of attended class days; days without class do not break a run."""
+    absent = held & ~present
+    longest = start = 0
+    while absent:
+        lowest = absent & -absent
+        longest = max(longest, (held & (lowest - 1) & ~((1 << start) - 1)).bit_count())
+        start = lowest.bit_length()
+        absent ^= lowest
+    current = (held >> start).bit_count()
+    return current, max(longest, current)
+
+
+def _run_length(bits):
+    """Length of the run of equal bits at the bottom of `bits`; None for an endless run of zeros."""
+    if bits & 1:
+        bits = ~bits
+    return (bits & -bits).bit_length() - 1 if bits else None
+
+
+def encode(present, held):
+    """
+    Run-length calendar from the first day of the term to the last class:
+    'P' present, 'A' absent, '-' no class, each followed by its repeat count
+    when above one. 'P5-2P4A' is five days present, two without class, four
+    present and one absent.
+    """
+    parts = []
+    index, end = 0, held.bit_length()
+    while index < end:
+        held_bits, present_bits = held >> index, present >> index
+        run = min(length for length in (_run_length(held_bits), _run_length(present_bits), end - index) if length)
+        code = (PRESENT if present_bits & 1 else ABSENT) if held_bits & 1 else NO_CLASS
+        parts.append(code if run == 1 else f'{code}{run}')
+        index += run
+    return ''.join(parts)
+
+
+def day_counts(bitsets):
+    """
+    How many of `bitsets` have each bit set, as a list indexed by bit. The
+    bitsets are added as bit-sliced binary counters (counter i holds bit i of
+    every day's count), so each bitset costs a few big-int operations.
+    """
+    counters = []
+    for carry in bitsets:
+        for i, counter in enumerate(counters):
+            if not carry:
+                break
+            counters[i], carry = counter ^ carry, counter & carry
+        if carry:
+            counters.append(carry)
+    width = max((counter.bit_length() for counter in counters), default=0)
+    return [sum(((counter >> day) & 1) << i for i, counter in enumerate(counters)) for day in range(width)]
+
+
+def cohort(term, bitmaps):
+    """Class-wide stats for one term from {student_id: (present, held)}."""
+    if not bitmaps:
+        return {'students': 0, 'class_days': 0, 'full_attendance_days': 0, 'percentage': 0.0, 'days': []}
+    presents = [present for present, _ in bitmaps.values()]
+    helds = [held for _, held in bitmaps.values()]
+    class_days = reduce(or_, helds)
+    present_counts = day_counts(presents)
+    held_counts = day_counts(helds)
+    present_days = sum(present.bit_count() for present in presents)
+    held_days = sum(held.bit_count() for held in helds)
+    return {
+        'students': len(bitmaps),
+        'class_days': class_days.bit_count(),
+        'full_attendance_days': reduce(and_, presents).bit_count(),
+        'percentage': round(present_days * 100 / held_days, 2) if held_days else 0.0,
+        'days': [
+            {
+                'date': str(day_at(term, index)),
+                'logged': held_counts[index],
+                'present': present_counts[index] if index < len(present_counts) else 0,
+            }
+            for index in range(class_days.bit_length()) if class_days >> index & 1
+        ],
+    }
@@ -0,0 +1,522 @@
+"""
+Deterministic synthetic dataset at production cardinalities, for profiling and benchmarks.
+
+    python manage.py generate_dataset --scale 1     # ~5k students, ~1.2M rows
+    python manage.py generate_dataset --scale 10    # ~50k students, ~12M rows
+
+Every table is drawn from its own RNG seeded with (--seed, table name), so a
+run against an empty database always produces the same rows regardless of
+batch size. Primary keys are assigned here rather than by the database, which
+lets children reference their parents without reading anything back; rows go
+in with COPY on PostgreSQL and batched executemany() INSERTs in their own
+transactions everywhere else (bulk_create's model instances and per-batch SQL
+compilation dominate at these sizes). Sequences are reset at the end.
+
+Generated users have an @dataset.invalid email and generated courses and
+competitions a "Dataset " prefix, which is how --flush finds them again.
+"""
+import csv
+import io
+import json
+import random
+import time
+from collections import Counter
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from . import bitmaps, grades, partitions
+from .models import (
+    Attendance, AttendanceArchive, AttendanceBitmap, Badge, ChallengeSubmission, CodingQuestion, Competition, CompetitionAttempt,
+    CompetitionParticipant, Course, DailyAttendanceLog, DailyChallenge, DailyChallengeQuestion,
+    Enrollment, Grade, MemoryQuestion, MemorySet, QuizQuestion, TeacherCourseAssignment, UserBadge,
+)
+
+User = get_user_model()
+
+EMAIL_DOMAIN = 'dataset.invalid'
+NAME_PREFIX = 'Dataset '
+PASSWORD = 'DatasetPass123!'
+
+# Rows per unit of --scale
+PER_SCALE = {
+    'students': 5000,
+    'teachers': 12,
+    'courses': 6,
+    'competitions': 20,
+}
+
+COURSE_TOPICS = [
+    'Abacus', 'Mental Maths', 'Spoken English', 'Phonics', 'Handwriting', 'Vedic Maths',
+    'Coding Basics', 'Robotics', 'Chess', 'Drawing', 'Memory Skills', 'Public Speaking',
+]
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Arjun', 'Divya', 'Harini', 'Karthik', 'Kavya', 'Meera', 'Nikhil', 'Priya',
+    'Rahul', 'Sanjay', 'Shreya', 'Surya', 'Tara', 'Vetri', 'Vikram', 'Yamini', 'Anand', 'Lakshmi',
+]
+LAST_NAMES = ['Kumar', 'Raj', 'Iyer', 'Nair', 'Reddy', 'Sharma', 'Pillai', 'Menon', 'Das', 'Rao']
+SCHOOLS = ['Vidya Mandir', 'DAV Public School', 'St. Joseph', 'Kendriya Vidyalaya', 'PSBB', 'Chettinad Vidyashram']
+MODES = ['quiz', 'coding', 'memory']
+OPTIONS = 'ABCD'
+
+
+def _copy_value(value):
+    if value is None:
+        return r'\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, bytes):
+        return '\\x' + value.hex()  # bytea hex format
+    return value
+
+
+def _adapter(field):
+    """Python value -> DB parameter for executemany(), chosen once per column."""
+    kind = field.get_internal_type()
+    if kind == 'DateTimeField':
+        return connection.ops.adapt_datetimefield_value
+    if kind == 'DateField':
+        return connection.ops.adapt_datefield_value
+    if kind == 'JSONField':
+        return lambda value: None if value is None else json.dumps(value)
+    return lambda value: value
+
+
+class DatasetGenerator:
+    def __init__(self, scale=1, seed=42, end_date=None, days=730, batch_size=10000, use_copy=None, log=None):
+        self.scale = scale
+        self.seed = seed
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(days=days)
+        self.batch_size = batch_size
+        self.use_copy = connection.vendor == 'postgresql' if use_copy is None else use_copy
+        self.log = log or (lambda message: None)
+        self.counts = {}
+        self._next_ids = {}
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+
+    def rng(self, table):
+        return random.Random(f'{self.seed}:{table}')
+
+    def allocate_id(self, model):
+        """Next primary key for `model`, continuing after whatever is already in the table."""
+        if model not in self._next_ids:
+            self._next_ids[model] = (model.objects.aggregate(m=Max('pk'))['m'] or 0) + 1
+        pk = self._next_ids[model]
+        self._next_ids[model] += 1
+        return pk
+
+    def load(self, model, rows):
+        """Insert an iterable of {attname: value} dicts; unspecified columns get the field default."""
+        fields = model._meta.concrete_fields
+        defaults = {f.attname: f.get_default() for f in fields}
+        columns = [f.attname for f in fields]
+        adapters = [_adapter(f) for f in fields]
+        batch_size = self.batch_size * 10 if self.use_copy else self.batch_size
+        started = time.perf_counter()
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                total += self._flush(model, columns, defaults, adapters, batch)
+                batch = []
+        if batch:
+            total += self._flush(model, columns, defaults, adapters, batch)
+        self.counts[model._meta.label] = self.counts.get(model._meta.label, 0) + total
+        elapsed = time.perf_counter() - started
+        self.log(f"  {model._meta.label:<28} {total:>10,} rows  {elapsed:6.1f}s")
+        return total
+
+    def _flush(self, model, columns, defaults, adapters, batch):
+        with transaction.atomic():
+            if self.use_copy:
+                self._copy(model, columns, defaults, batch)
+            else:
+                self._insert(model, columns, defaults, adapters, batch)
+        return len(batch)
+
+    def _insert(self, model, columns, defaults, adapters, batch):
+        quote = connection.ops.quote_name
+        sql = (
+            f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(quote(c) for c in columns)}) '
+            f'VALUES ({", ".join(["%s"] * len(columns))})'
+        )
+        params = [
+            [adapt(row[c] if c in row else defaults[c]) for c, adapt in zip(columns, adapters)]
+            for row in batch
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+    def _copy(self, model, columns, defaults, batch):
+        quote = connection.ops.quote_name
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            writer.writerow([_copy_value(row[c] if c in row else defaults[c]) for c in columns])
+        sql = (
+            f'COPY {quote(model._meta.db_table)} ({", ".join(quote(c) for c in columns)}) '
+            f"FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        )
+        with connection.cursor() as cursor:
+            buffer.seek(0)
+            if hasattr(cursor.cursor, 'copy_expert'):
+                cursor.cursor.copy_expert(sql, buffer)  # psycopg2
+            else:
+                with cursor.cursor.copy(sql) as copy:  # psycopg 3
+                    copy.write(buffer.getvalue())
+
+    def reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(no_style(), list(self._next_ids))
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def at(self, day, hour=10, minute=0):
+        return datetime.combine(day, dt_time(hour, minute), tzinfo=dt_timezone.utc)
+
+    def random_day(self, rng, start=None, end=None):
+        start = start or self.start_date
+        end = end or self.end_date
+        return start + timedelta(days=rng.randint(0, max((end - start).days, 0)))
+
+    # -------------------------------------------------------------------------
+    # Tables
+    # -------------------------------------------------------------------------
+
+    def run(self):
+        started = time.perf_counter()
+        self.log(
+            f"Generating scale {self.scale} (seed {self.seed}, {self.start_date} to {self.end_date}) "
+            f"with {'COPY' if self.use_copy else 'batched INSERTs'}:"
+        )
+        self.generate_courses()
+        self.generate_users()
+        self.generate_teacher_assignments()
+        self.generate_enrollments()
+        self.generate_attendance_logs()
+        self.generate_competitions()
+        self.generate_competition_activity()
+        self.generate_daily_challenges()
+        self.generate_submissions()
+        self.generate_badges()
+        self.reset_sequences()
+        elapsed = time.perf_counter() - started
+        total = sum(self.counts.values())
+        self.log(f"Loaded {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s).")
+        return self.counts
+
+    def generate_courses(self):
+        rng = self.rng('courses')
+        self.courses = []
+        rows = []
+        for i in range(PER_SCALE['courses'] * self.scale):
+            pk = self.allocate_id(Course)
+            # Each course meets on three fixed weekdays
+            meets_on = sorted(rng.sample(range(6), 3))
+            self.courses.append((pk, meets_on))
+            rows.append({
+                'id': pk,
+                'course_name': f"{NAME_PREFIX}{COURSE_TOPICS[i % len(COURSE_TOPICS)]} {i // len(COURSE_TOPICS) + 1}",
+                'course_description': 'Generated for profiling and benchmarks.',
+                'duration': f"{rng.choice([3, 6, 9, 12])} Months",
+                'total_classes_completed': rng.randint(0, 120),
+                'course_progress': rng.randint(0, 100),
+                'created_at': self.at(self.start_date),
+            })
+        self.load(Course, rows)
+
+    def generate_users(self):
+        rng = self.rng('users')
+        password = make_password(PASSWORD, salt=f'dataset{self.seed}')
+        self.teacher_ids = []
+        self.students = []  # (pk, joined day, xp)
+
+        def rows():
+            for i in range(PER_SCALE['teachers'] * self.scale):
+                pk = self.allocate_id(User)
+                self.teacher_ids.append(pk)
+                yield {
+                    'id': pk, 'username': f'dsteacher{i}', 'email': f'teacher{i}@{EMAIL_DOMAIN}',
+                    'password': password, 'is_teacher': True, 'full_name': f'Teacher {i}',
+                    'date_joined': self.at(self.start_date),
+                }
+            for i in range(PER_SCALE['students'] * self.scale):
+                pk = self.allocate_id(User)
+                joined = self.random_day(rng, end=self.end_date - timedelta(days=30))
+                # Long tail: most students have a few hundred XP, a handful have thousands
+                xp = min(int(rng.paretovariate(1.6) * 120) - 120, 25000)
+                self.students.append((pk, joined, xp))
+                yield {
+                    'id': pk, 'username': f'dsstudent{i}', 'email': f'student{i}@{EMAIL_DOMAIN}',
+                    'password': password, 'xp': xp, 'level': xp // 1000 + 1,
+                    'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    'parent_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    'school_name': rng.choice(SCHOOLS),
+                    'standard_grade': f'Grade {rng.randint(1, 10)}',
+                    'dob': date(rng.randint(2008, 2019), rng.randint(1, 12), rng.randint(1, 28)),
+                    'date_joined': self.at(joined, rng.randint(8, 20), rng.randint(0, 59)),
+                    'last_login': self.at(self.random_day(rng, start=joined), rng.randint(8, 20)),
+                }
+
+        self.load(User, rows())
+
+    def generate_teacher_assignments(self):
+        rows = []
+        for i, (course_id, _) in enumerate(self.courses):
+            for teacher_id in {self.teacher_ids[i % len(self.teacher_ids)], self.teacher_ids[(i + 1) % len(self.teacher_ids)]}:
+                rows.append({
+                    'id': self.allocate_id(TeacherCourseAssignment), 'teacher_id': teacher_id, 'course_id': course_id,
+                    'assigned_at': self.at(self.start_date),
+                })
+        self.load(TeacherCourseAssignment, rows)
+
+    def generate_enrollments(self):
+        rng = self.rng('enrollments')
+        self.enrollments = []  # (pk, student, course index, start day)
+        for student_id, joined, _ in self.students:
+            for course_index in sorted(rng.sample(range(len(self.courses)), rng.choices([1, 2, 3], [60, 30, 10])[0])):
+                start = self.random_day(rng, start=joined, end=min(joined + timedelta(days=90), self.end_date))
+                self.enrollments.append((self.allocate_id(Enrollment), student_id, course_index, start))
+
+        self.load(Enrollment, (
+            {
+                'id': pk, 'student_id': student_id, 'course_id': self.courses[course_index][0],
+                'enrollment_date': self.at(start, 9), 'manual_progress': rng.randint(0, 100),
+            }
+            for pk, student_id, course_index, start in self.enrollments
+        ))
+        # Enrollment.save() creates these; bulk inserts have to do it themselves
+        self.load(Attendance, ({'id': self.allocate_id(Attendance), 'enrollment_id': pk} for pk, *_ in self.enrollments))
+        letters = [rng.choice('AABBBCCD') for _ in self.enrollments]
+        # Stored ranks, as grades.recompute_ranks() would write them: 1 + the course's better scores
+        counts = {}
+        for (_, _, course_index, _), letter in zip(self.enrollments, letters):
+            counts.setdefault(course_index, Counter())[grades.SCALE[letter]] += 1
+        self.load(Grade, (
+            {
+                'id': self.allocate_id(Grade), 'enrollment_id': pk, 'grade': letter, 'score': grades.SCALE[letter],
+                'rank': 1 + sum(n for value, n in counts[course_index].items() if value > grades.SCALE[letter]),
+                'updated_at': self.at(self.end_date),
+            }
+            for (pk, _, course_index, _), letter in zip(self.enrollments, letters)
+        ))
+
+    def generate_attendance_logs(self):
+        rng = self.rng('attendance')
+        # The bitmaps are built alongside, rather than read back from the logs afterwards
+        built = {}
+
+        def rows():
+            for _, student_id, course_index, start in self.enrollments:
+                course_id, meets_on = self.courses[course_index]
+                presence = rng.uniform(0.6, 0.98)
+                day = start
+                while day <= self.end_date:
+                    if day.weekday() in meets_on:
+                        present = rng.random() < presence
+                        term, index = bitmaps.position(day)
+                        bits = built.setdefault((student_id, course_id, term), [0, 0])
+                        bits[1] |= 1 << index
+                        if present:
+                            bits[0] |= 1 << index
+                        yield {
+                            'id': self.allocate_id(DailyAttendanceLog), 'student_id': student_id, 'course_id': course_id,
+                            'date': day, 'status': 'present' if present else 'absent',
+                        }
+                    day += timedelta(days=1)
+
+        # Months before the partitioned table's first partition would all land in its default partition
+        if partitions.is_partitioned():
+            partitions.ensure_partitions(self.start_date, self.end_date)
+        self.load(DailyAttendanceLog, rows())
+        self.load(AttendanceBitmap, (
+            {
+                'id': self.allocate_id(AttendanceBitmap), 'student_id': student_id, 'course_id': course_id, 'term': term,
+                'present': bitmaps.to_bytes(present), 'held': bitmaps.to_bytes(held),
+            }
+            for (student_id, course_id, term), (present, held) in built.items()
+        ))
+
+    def generate_competitions(self):
+        rng = self.rng('competitions')
+        self.competitions = []  # (pk, mode, start, question count)
+        competitions, quiz, coding, memory_sets, memory = [], [], [], [], []
+        for i in range(PER_SCALE['competitions'] * self.scale):
+            pk = self.allocate_id(Competition)
+            mode = MODES[i % len(MODES)]
+            start = self.random_day(rng)
+            course = rng.choice(self.courses)[0] if rng.random() < 0.7 else None
+            competitions.append({
+                'id': pk, 'title': f'{NAME_PREFIX}{mode.title()} Challenge {i + 1}',
+                'description': 'Generated competition.', 'mode_type': mode, 'course_id': course,
+                'time_limit': rng.choice([10, 15, 20, 30]),
+                'start_date': self.at(start), 'end_date': self.at(start + timedelta(days=rng.choice([1, 3, 7, 14]))),
+                'reward_xp': rng.choice([50, 100, 150, 200]), 'created_at': self.at(start - timedelta(days=2)),
+            })
+            if mode == 'quiz':
+                questions = 5
+                quiz.extend({
+                    'id': self.allocate_id(QuizQuestion), 'competition_id': pk, 'question_text': f'Quiz {i + 1} question {q + 1}',
+                    'option_a': 'One', 'option_b': 'Two', 'option_c': 'Three', 'option_d': 'Four',
+                    'correct_option': rng.choice(OPTIONS),
+                } for q in range(questions))
+            elif mode == 'coding':
+                questions = 3
+                coding.extend({
+                    'id': self.allocate_id(CodingQuestion), 'competition_id': pk, 'problem_text': f'Problem {q + 1}',
+                    'correct_answer': str(rng.randint(1, 1000)), 'xp_value': 10,
+                } for q in range(questions))
+            else:
+                questions = 0
+                for s in range(2):
+                    set_pk = self.allocate_id(MemorySet)
+                    memory_sets.append({'id': set_pk, 'competition_id': pk, 'words_list': rng.sample(COURSE_TOPICS, 5)})
+                    memory.extend({
+                        'id': self.allocate_id(MemoryQuestion), 'memory_set_id': set_pk, 'question': f'Set {s + 1} question {q + 1}',
+                        'option_a': 'One', 'option_b': 'Two', 'option_c': 'Three', 'option_d': 'Four',
+                        'correct_option': rng.choice(OPTIONS),
+                    } for q in range(3))
+                    questions += 3
+            self.competitions.append((pk, mode, start, questions))
+
+        self.load(Competition, competitions)
+        self.load(QuizQuestion, quiz)
+        self.load(CodingQuestion, coding)
+        self.load(MemorySet, memory_sets)
+        self.load(MemoryQuestion, memory)
+
+    def generate_competition_activity(self):
+        rng = self.rng('competition_activity')
+        picks = []
+        for student_id, joined, _ in self.students:
+            eligible = [c for c in self.competitions if c[2] >= joined]
+            for pk, mode, start, questions in rng.sample(eligible, min(len(eligible), rng.randint(0, 8))):
+                correct = rng.randint(0, questions)
+                picks.append((student_id, pk, start, questions, correct, rng.random() < 0.9))
+
+        self.load(CompetitionParticipant, (
+            {
+                'id': self.allocate_id(CompetitionParticipant), 'user_id': student_id, 'competition_id': pk,
+                'score': correct * 10, 'correct_answers': correct, 'total_questions': questions,
+                'joined_at': self.at(start, 11),
+            }
+            for student_id, pk, start, questions, correct, _ in picks
+        ))
+        self.load(CompetitionAttempt, (
+            {
+                'id': self.allocate_id(CompetitionAttempt), 'user_id': student_id, 'competition_id': pk,
+                'start_time': self.at(start, 11), 'end_time': self.at(start, 11, 20) if completed else None,
+                'score': correct * 10 if completed else 0, 'correct_answers': correct if completed else 0,
+                'total_questions': questions, 'is_completed': completed,
+            }
+            for student_id, pk, start, questions, correct, completed in picks
+        ))
+
+    def generate_daily_challenges(self):
+        rng = self.rng('daily_challenges')
+        self.challenges = {}  # course index -> [(pk, type, day, question count)]
+        challenges, questions = [], []
+        for course_index, (course_id, meets_on) in enumerate(self.courses):
+            self.challenges[course_index] = []
+            # One challenge a week, on the course's first class day
+            day = self.start_date + timedelta(days=(meets_on[0] - self.start_date.weekday()) % 7)
+            while day <= self.end_date:
+                pk = self.allocate_id(DailyChallenge)
+                kind = 'quiz' if rng.random() < 0.25 else 'mission'
+                count = 3 if kind == 'quiz' else 0
+                challenges.append({
+                    'id': pk, 'course_id': course_id, 'mission': f'Week of {day:%d %b %Y}: practice and share your work.',
+                    'challenge_type': kind, 'deadline': self.at(day + timedelta(days=2), 23, 59),
+                    'reward_xp': rng.choice([20, 50, 100]), 'created_at': self.at(day, 8),
+                })
+                questions.extend({
+                    'id': self.allocate_id(DailyChallengeQuestion), 'challenge_id': pk, 'question_text': f'Question {q + 1}',
+                    'option_a': 'One', 'option_b': 'Two', 'option_c': 'Three', 'option_d': 'Four',
+                    'correct_option': rng.choice(OPTIONS),
+                } for q in range(count))
+                self.challenges[course_index].append((pk, kind, day, count))
+                day += timedelta(days=7)
+        self.load(DailyChallenge, challenges)
+        self.load(DailyChallengeQuestion, questions)
+
+    def generate_submissions(self):
+        rng = self.rng('submissions')
+        recent = self.end_date - timedelta(days=14)
+
+        def rows():
+            for _, student_id, course_index, start in self.enrollments:
+                for pk, kind, day, count in self.challenges[course_index]:
+                    if day < start or rng.random() >= 0.2:
+                        continue
+                    score = rng.randint(0, count)
+                    if kind == 'quiz':
+                        status = 'approved'
+                    elif day >= recent:
+                        status = 'pending'
+                    else:
+                        status = rng.choices(['approved', 'correction', 'pending'], [80, 15, 5])[0]
+                    submitted_at = self.at(day + timedelta(days=rng.randint(0, 2)), rng.randint(15, 21))
+                    yield {
+                        'id': self.allocate_id(ChallengeSubmission), 'challenge_id': pk, 'student_id': student_id,
+                        'text_response': None if kind == 'quiz' else 'Generated response.',
+                        'status': status, 'feedback': 'Good effort.' if status == 'correction' else None,
+                        'quiz_score': score if kind == 'quiz' else 0, 'total_quiz_questions': count,
+                        'submitted_at': submitted_at,
+                        'xp_awarded_at': submitted_at if status == 'approved' else None,
+                    }
+
+        self.load(ChallengeSubmission, rows())
+
+    def generate_badges(self):
+        """UserBadge rows for whatever badges exist, as check_badges() would have awarded them."""
+        badges = list(Badge.objects.order_by('id').values_list('id', 'points_required'))
+        if not badges:
+            return
+        self.load(UserBadge, (
+            {'id': self.allocate_id(UserBadge), 'user_id': student_id, 'badge_id': badge_id, 'earned_at': self.at(joined, 12)}
+            for student_id, joined, xp in self.students
+            for badge_id, points in badges
+            if xp >= points
+        ))
+
+
+def flush():
+    """Delete everything a previous run generated. Children first, so each DELETE stays a single statement."""
+    users = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+    courses = Course.objects.filter(course_name__startswith=NAME_PREFIX)
+    competitions = Competition.objects.filter(title__startswith=NAME_PREFIX)
+    deleted = {}
+    with transaction.atomic():
+        # Without signals: the post_delete receiver would load every log to clear bitmaps deleted next anyway
+        logs = DailyAttendanceLog.objects.filter(student__in=users)
+        deleted[DailyAttendanceLog._meta.label] = logs._raw_delete(logs.db)
+        for queryset in [
+            AttendanceArchive.objects.filter(student__in=users),
+            AttendanceBitmap.objects.filter(student__in=users),
+            ChallengeSubmission.objects.filter(student__in=users),
+            CompetitionAttempt.objects.filter(user__in=users),
+            CompetitionParticipant.objects.filter(user__in=users),
+            UserBadge.objects.filter(user__in=users),
+            competitions,
+            courses,
+            users,
+        ]:
+            for label, count in queryset.delete()[1].items():
+                deleted[label] = deleted.get(label, 0) + count
+    return deleted
@@ -0,0 +1,191 @@
+"""
+Transactional outbox for derived state (caches, counters, badges).
+
+Write paths call `emit()` inside the same `transaction.atomic()` block as the
+change itself, so an event exists if and only if the change was committed.
+`process_batch()` (driven by `manage.py process_events`) reads events in id
+order, hands them to the registered handlers and advances the consumer offset
+in the same transaction, which makes processing at-least-once and replayable.
+
+Ids are handed out when a row is inserted, not when its transaction commits,
+so a long transaction (a bulk enroll, a student import chunk) can commit id 41
+after id 42 is already visible. The offset moves on regardless, but every id
+it passes without seeing is kept in the offset's `gaps`, and each batch looks
+them up again: an event that shows up late is handled then, out of order, so
+handlers must not depend on the order across batches. An id still missing
+after GAP_RETENTION is taken to be a rolled-back insert and forgotten;
+GAP_RETENTION is far longer than any write transaction is allowed to run.
+
+The handlers delete cache keys and grant badges, so they must be idempotent.
+Cache deletes in the consumer only reach the web workers when the cache is
+shared between processes (CACHES in settings), and badges are only granted
+while the consumer runs. So with EVENTS['INLINE_HANDLERS'] (by default: when
+the cache is not shared, e.g. LocMemCache and runserver) the process that
+emits an event also runs its handlers once its transaction commits, as the
+writes did before the outbox; the consumer, if running, handles it again.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from monitoring.cache import cache_is_shared
+
+from .models import DomainEvent, EventConsumerOffset
+
+ATTENDANCE_MARKED = 'attendance_marked'
+ATTENDANCE_CHANGED = 'attendance_changed'
+XP_AWARDED = 'xp_awarded'
+SUBMISSION_APPROVED = 'submission_approved'
+ENROLLMENT_CREATED = 'enrollment_created'
+
+DEFAULT_CONSUMER = 'default'
+GAP_RETENTION = timedelta(hours=1)
+MAX_GAPS = 10000
+DEFAULTS = {
+    'INLINE_HANDLERS': None,   # None: when the cache is not shared
+}
+
+_handlers = defaultdict(list)
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'EVENTS', {})}
+
+
+def inline_handlers():
+    inline = config()['INLINE_HANDLERS']
+    return not cache_is_shared() if inline is None else inline
+
+
+def emit(event_type, **payload):
+    """Append one event. Call inside the transaction that makes the change."""
+    event = DomainEvent.objects.create(event_type=event_type, payload=payload)
+    _dispatch_on_commit([event])
+    return event
+
+
+def emit_many(event_type, payloads):
+    """Append many events of one type with a single INSERT."""
+    events = DomainEvent.objects.bulk_create(
+        [DomainEvent(event_type=event_type, payload=p) for p in payloads]
+    )
+    _dispatch_on_commit(events)
+    return events
+
+
+def _dispatch(events):
+    """Hands `events` to the handlers, grouped by type but in order inside each group."""
+    grouped = defaultdict(list)
+    for event in events:
+        grouped[event.event_type].append(event)
+    for event_type, batch in grouped.items():
+        for handler in _handlers.get(event_type, []):
+            handler(batch)
+
+
+def _dispatch_on_commit(events):
+    if events and inline_handlers():
+        # robust: a failing handler is logged and must not fail a request whose change is committed
+        transaction.on_commit(partial(_dispatch, events), robust=True)
+
+
+def handles(*event_types):
+    """Register a handler. Handlers receive a list of events of one type, in id order."""
+    def decorator(func):
+        for event_type in event_types:
+            _handlers[event_type].append(func)
+        return func
+    return decorator
+
+
+def _track_gaps(gaps, last_event_id, events, now, gap_retention):
+    """`gaps` with the ids `events` skip over added and the expired ones dropped."""
+    gaps = dict(gaps)
+    expected = last_event_id + 1
+    for event in events:
+        gaps.update((str(missing), now.isoformat()) for missing in range(expected, event.id))
+        expected = event.id + 1
+    expired = now - gap_retention
+    kept = sorted((int(pk), seen) for pk, seen in gaps.items() if datetime.fromisoformat(seen) > expired)
+    # Lowest ids first out: they have waited longest
+    return {str(pk): seen for pk, seen in kept[-MAX_GAPS:]}
+
+
+def process_batch(consumer=DEFAULT_CONSUMER, batch_size=500, gap_retention=GAP_RETENTION):
+    """Process the next batch for `consumer`, with the events that filled a gap. Returns the number handled."""
+    with transaction.atomic():
+        offset, _ = EventConsumerOffset.objects.get_or_create(consumer=consumer)
+        # Lock the offset row so two consumers with the same name never interleave
+        offset = EventConsumerOffset.objects.select_for_update().get(pk=offset.pk)
+
+        late = list(DomainEvent.objects.filter(id__in=[int(pk) for pk in offset.gaps]).order_by('id')) if offset.gaps else []
+        events = list(DomainEvent.objects.filter(id__gt=offset.last_event_id).order_by('id')[:batch_size])
+        gaps = {pk: seen for pk, seen in offset.gaps.items() if int(pk) not in {event.id for event in late}}
+        gaps = _track_gaps(gaps, offset.last_event_id, events, timezone.now(), gap_retention)
+        if not late and not events and gaps == offset.gaps:
+            return 0
+
+        _dispatch(late + events)
+
+        if events:
+            offset.last_event_id = events[-1].id
+        offset.gaps = gaps
+        offset.save(update_fields=['last_event_id', 'gaps', 'updated_at'])
+        return len(late) + len(events)
+
+
+def replay_from(event_id, consumer=DEFAULT_CONSUMER):
+    """Rewind `consumer` so the next batch starts at `event_id`."""
+    EventConsumerOffset.objects.update_or_create(
+        consumer=consumer, defaults={'last_event_id': max(event_id - 1, 0), 'gaps': {}}
+    )
+
+
+def consumer_lag(consumer=DEFAULT_CONSUMER):
+    """How far `consumer` is behind the head of the outbox."""
+    offset, gaps = EventConsumerOffset.objects.filter(consumer=consumer).values_list('last_event_id', 'gaps').first() or (0, {})
+    pending = DomainEvent.objects.filter(id__gt=offset).aggregate(
+        head=Max('id'), oldest=Min('created_at'),
+    )
+    head = pending['head'] or offset
+    oldest = pending['oldest']
+    return {
+        'consumer': consumer,
+        'offset': offset,
+        'head': head,
+        'lag_events': head - offset,
+        'gaps': len(gaps),
+        'lag_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
+
+
+# =============================================================================
+# Handlers
+# =============================================================================
+
+@handles(ATTENDANCE_MARKED, ATTENDANCE_CHANGED)
+def invalidate_attendance_stats(events):
+    """Drop the cached per-(student, course) stats used by Attendance properties."""
+    keys = {f"attendance_stats_{e.payload['student_id']}_{e.payload.get('course_id')}" for e in events}
+    cache.delete_many(list(keys))
+
+
+@handles(XP_AWARDED, SUBMISSION_APPROVED)
+def invalidate_gamification(events):
+    user_ids = {e.payload.get('user_id') or e.payload.get('student_id') for e in events}
+    cache.delete_many([f'gamification_{uid}' for uid in user_ids])
+
+
+@handles(XP_AWARDED)
+def award_xp_badges(events):
+    """Grant XP-threshold badges once per user per batch instead of on every save."""
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    for user in User.objects.filter(id__in={e.payload['user_id'] for e in events}):
+        user.check_badges()
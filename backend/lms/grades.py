@@ -0,0 +1,126 @@
+"""
+Course grades on a numeric scale, with a stored rank per enrollment.
+
+Grade.grade keeps the letter teachers enter; Grade.score is its place on
+SCALE (higher is better), so ordering by score ranks 'A+' above 'A', which
+ordering the letters does not. Grade.rank is the enrollment's rank in its
+course by score, ties sharing a rank (1, 2, 2, 4), NULL while ungraded.
+
+Ranks are written by recompute_ranks(): one UPDATE ... FROM with RANK() OVER
+(PARTITION BY course ORDER BY score DESC) per batch of grade changes,
+touching only the rows whose rank moved. save() (the teacher's grade sheet)
+and GradeAdmin call it once per batch, and deleting a graded row (or its
+enrollment) re-ranks its course (lms/signals.py), so readers such as the
+dashboard just read Grade.rank. Grade.clean() and Grade.save() refuse
+grades off SCALE.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Enrollment, Grade
+
+SCALE = {
+    'O': 10,
+    'A+': 9,
+    'A': 8,
+    'B+': 7,
+    'B': 6,
+    'C+': 5,
+    'C': 4,
+    'D': 3,
+    'E': 2,
+    'F': 0,
+}
+
+
+def normalize(grade):
+    """'a+ ' -> 'A+'; blank -> None."""
+    grade = (grade or '').strip().upper()
+    return grade or None
+
+
+def score(grade):
+    """The scale value of `grade`, None when ungraded or off the scale."""
+    return SCALE.get(normalize(grade))
+
+
+def recompute_ranks(course_ids):
+    """Re-ranks every graded enrollment of `course_ids` in one statement. Returns the rows whose rank changed."""
+    course_ids = sorted({int(course_id) for course_id in course_ids})
+    if not course_ids:
+        return 0
+    quote = connection.ops.quote_name
+    grade_table, enrollment_table, rank = quote(Grade._meta.db_table), quote(Enrollment._meta.db_table), quote('rank')
+    with connection.cursor() as cursor:
+        # Ungraded rows sort last, so they never push a graded one down, and get NULL
+        cursor.execute(
+            f'UPDATE {grade_table} SET {rank} = ranked.new_rank FROM ('
+            f'  SELECT g.id, CASE WHEN g.score IS NULL THEN NULL ELSE'
+            f'    RANK() OVER (PARTITION BY e.course_id ORDER BY g.score IS NULL, g.score DESC) END AS new_rank'
+            f'  FROM {grade_table} g JOIN {enrollment_table} e ON e.id = g.enrollment_id'
+            f'  WHERE e.course_id IN ({", ".join(["%s"] * len(course_ids))})'
+            f') AS ranked '
+            f'WHERE {grade_table}.id = ranked.id AND {grade_table}.{rank} IS DISTINCT FROM ranked.new_rank',
+            course_ids,
+        )
+        return cursor.rowcount
+
+
+def parse(rows):
+    """
+    {student_id: grade} from [{student_id, grade}] rows; a blank grade clears
+    it. ValueError for a malformed row or a grade off the scale.
+    """
+    entries = {}
+    for row in rows:
+        try:
+            student_id = int(row['student_id'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Each row needs a student_id and a grade.")
+        grade = normalize(row.get('grade'))
+        if grade is not None and grade not in SCALE:
+            raise ValueError(f"Unknown grade '{row.get('grade')}'; use one of {', '.join(SCALE)}.")
+        entries[student_id] = grade
+    return entries
+
+
+def sheet(course_id):
+    """Grades of `course_id` in rank order, ungraded last, in one query."""
+    rows = (
+        Grade.objects.filter(enrollment__course_id=course_id)
+        .order_by('rank', 'enrollment__student__username')
+        .values_list('enrollment__student_id', 'enrollment__student__username', 'enrollment__student__full_name', 'grade', 'score', 'rank')
+    )
+    students = [
+        {'student_id': sid, 'username': username, 'full_name': full_name, 'grade': grade, 'score': value, 'rank': rank}
+        for sid, username, full_name, grade, value, rank in rows
+    ]
+    # NULL ranks sort first on some databases and last on others
+    students.sort(key=lambda student: student['rank'] is None)
+    return {'course_id': int(course_id), 'scale': SCALE, 'students': students}
+
+
+def save(course_id, entries):
+    """
+    Applies {student_id: grade} to the course's Grade rows with one
+    bulk_update, then re-ranks the course once. Students not enrolled are
+    skipped. Returns (grades changed, student ids skipped).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Grade.objects.select_for_update(of=('self',))
+            .filter(enrollment__course_id=course_id, enrollment__student_id__in=entries)
+            .select_related('enrollment').only('id', 'grade', 'score', 'enrollment__student_id')
+        )
+        changed = []
+        for row in rows:
+            grade = entries[row.enrollment.student_id]
+            if row.grade != grade:
+                row.grade, row.score, row.updated_at = grade, score(grade), now
+                changed.append(row)
+        Grade.objects.bulk_update(changed, ['grade', 'score', 'updated_at'], batch_size=500)
+        if changed:
+            recompute_ranks([course_id])
+    skipped = sorted(set(entries) - {row.enrollment.student_id for row in rows})
+    return len(changed), skipped
@@ -0,0 +1,293 @@
+"""
+Bulk student import from CSV, for onboarding a whole school at once.
+
+StudentImportView stores the upload on a StudentImport and queues the
+lms.import_students job, which calls run(). The password hashes alone are
+minutes of CPU for a few thousand students at the default PBKDF2 strength,
+so none of it happens on a web worker. Per chunk of CHUNK_SIZE rows:
+- each row is validated with the registration fields
+  (StudentImportRowSerializer); usernames and emails already taken, in the
+  database or earlier in the file, are found with one query per chunk;
+- passwords are hashed by a pool of HASH_WORKERS threads. hashlib's PBKDF2
+  releases the GIL, so the hashes run on every core without forking the
+  job worker; any other hasher (THREADED_HASHERS) gets one thread, since
+  threads would only take turns on the GIL. Rows without a password get an
+  unusable one (the student sets it through a password reset) and cost no
+  hashing;
+- the users go in with one bulk_create and, when the import names a
+  course, are enrolled with roster.enroll(), in one transaction per chunk.
+
+PASSWORD_ITERATIONS, when set, hashes the imported passwords with fewer
+PBKDF2 iterations. Django re-hashes a password at full strength on the
+first successful login (the hasher's must_update()), so the weaker hash
+only lasts until the student signs in; leave it at 0 unless the import time
+matters more. It is never taken below MIN_PASSWORD_ITERATIONS, and a warning
+is logged for every import that uses it. Each row ends up in the report, a CSV with its result.
+"""
+import copy
+import csv
+import io
+import logging
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import roster
+from .models import StudentImport
+from .serializers import StudentImportRowSerializer
+
+DEFAULTS = {
+    'HASH_WORKERS': 0,          # 0: one per CPU
+    'PASSWORD_ITERATIONS': 0,   # 0: the hasher's own
+}
+CHUNK_SIZE = 500
+MAX_ROWS = 20000
+COLUMNS = tuple(StudentImportRowSerializer.Meta.fields)
+REQUIRED_COLUMNS = ('email', 'username')
+REPORT_COLUMNS = ('row', 'email', 'username', 'result', 'user_id', 'detail')
+
+# Hashers that run in C with the GIL released (hashlib.pbkdf2_hmac); the others hash on one thread
+THREADED_HASHERS = ('pbkdf2_sha256', 'pbkdf2_sha1')
+MIN_PASSWORD_ITERATIONS = 100_000
+
+CREATED, FAILED = 'created', 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'STUDENT_IMPORT', {})}
+
+
+def hash_workers(hasher):
+    if hasher.algorithm not in THREADED_HASHERS:
+        return 1
+    return config()['HASH_WORKERS'] or os.cpu_count() or 1
+
+
+def password_hasher():
+    """The default hasher, with PASSWORD_ITERATIONS when set, lower than its own and the hasher has iterations."""
+    hasher = get_hasher()
+    iterations = config()['PASSWORD_ITERATIONS']
+    if not iterations or not hasattr(hasher, 'iterations'):
+        return hasher
+    if iterations < MIN_PASSWORD_ITERATIONS:
+        logger.warning("PASSWORD_ITERATIONS=%s is below the minimum; using %s", iterations, MIN_PASSWORD_ITERATIONS)
+        iterations = MIN_PASSWORD_ITERATIONS
+    if iterations >= hasher.iterations:
+        return hasher
+    logger.warning(
+        "Hashing imported passwords with %s %s iterations instead of %s, until each student's first login",
+        iterations, hasher.algorithm, hasher.iterations,
+    )
+    hasher = copy.copy(hasher)
+    hasher.iterations = iterations
+    return hasher
+
+
+# =============================================================================
+# Reading uploads
+# =============================================================================
+
+def _count_rows(text):
+    """Checks the header of CSV `text`; returns the number of data rows. ValueError when unusable."""
+    reader = csv.reader(io.StringIO(text))
+    header = [cell.strip().lower() for cell in next(reader, [])]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"The CSV needs a header row with {', '.join(REQUIRED_COLUMNS)} columns (missing: {', '.join(missing)}).")
+    rows = sum(1 for row in reader if any(cell.strip() for cell in row))
+    if not rows:
+        raise ValueError("The CSV has no student rows.")
+    if rows > MAX_ROWS:
+        raise ValueError(f"At most {MAX_ROWS} students per import.")
+    return rows
+
+
+def read_upload(data):
+    """(CSV text, row count) from uploaded bytes."""
+    try:
+        text = data.decode('utf-8-sig')
+        return text, _count_rows(text)
+    except (UnicodeDecodeError, csv.Error):
+        raise ValueError("file must be a UTF-8 CSV.")
+
+
+def rows_to_csv(rows):
+    """(CSV text, row count) from a list of row objects, e.g. a JSON request body."""
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError("students must be a list of objects, or upload a CSV file.")
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows({key: '' if value is None else value for key, value in row.items()} for row in rows)
+    text = out.getvalue()
+    return text, _count_rows(text)
+
+
+def _rows(text):
+    """(CSV line number, row dict) for the data rows, with header names lower-cased and blanks skipped."""
+    reader = csv.reader(io.StringIO(text))
+    header = [cell.strip().lower() for cell in next(reader, [])]
+    for row in reader:
+        if any(cell.strip() for cell in row):
+            values = {column: value.strip() for column, value in zip(header, row) if column in COLUMNS}
+            yield reader.line_num, {column: value for column, value in values.items() if value != ''}
+
+
+# =============================================================================
+# Importing
+# =============================================================================
+
+def _errors(errors):
+    return '; '.join(f"{field}: {' '.join(str(message) for message in messages)}" for field, messages in errors.items())
+
+
+class _Chunk:
+    """One chunk of rows on its way into the database; `report` collects a result per row."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.valid = {}    # line -> validated data
+        self.report = {}   # line -> report row
+
+    def fail(self, line, data, detail):
+        self.report[line] = {
+            'row': line, 'email': data.get('email', ''), 'username': data.get('username', ''),
+            'result': FAILED, 'user_id': '', 'detail': detail,
+        }
+        self.valid.pop(line, None)
+
+
+def _validate(chunk, seen):
+    User = get_user_model()
+    for line, row in chunk.rows:
+        serializer = StudentImportRowSerializer(data=row)
+        if not serializer.is_valid():
+            chunk.fail(line, row, _errors(serializer.errors))
+            continue
+        data = dict(serializer.validated_data)
+        # As create_user() would store them, so the checks below match the unique constraints
+        data['email'] = User.objects.normalize_email(data['email'])
+        data['username'] = User.normalize_username(data['username'])
+        if data['email'] in seen['email']:
+            chunk.fail(line, data, "email: appears earlier in the file.")
+        elif data['username'] in seen['username']:
+            chunk.fail(line, data, "username: appears earlier in the file.")
+        else:
+            chunk.valid[line] = data
+        seen['email'].add(data['email'])
+        seen['username'].add(data['username'])
+
+
+def _drop_taken(chunk):
+    """Fails the valid rows whose email or username is already taken, with one query."""
+    User = get_user_model()
+    emails = {data['email'] for data in chunk.valid.values()}
+    usernames = {data['username'] for data in chunk.valid.values()}
+    taken_emails, taken_usernames = set(), set()
+    for email, username in User.objects.filter(Q(email__in=emails) | Q(username__in=usernames)).values_list('email', 'username'):
+        taken_emails.add(email)
+        taken_usernames.add(username)
+    for line, data in list(chunk.valid.items()):
+        if data['email'] in taken_emails:
+            chunk.fail(line, data, "email: a user with this email already exists.")
+        elif data['username'] in taken_usernames:
+            chunk.fail(line, data, "username: a user with this username already exists.")
+
+
+def _insert(chunk, hashes, course_id):
+    User = get_user_model()
+    lines = list(chunk.valid)
+    users = [User(**{**chunk.valid[line], 'password': hashes[line]}) for line in lines]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=CHUNK_SIZE)
+        if any(user.pk is None for user in users):
+            # Backends that do not return ids from a bulk insert
+            ids = dict(User.objects.filter(email__in=[user.email for user in users]).values_list('email', 'id'))
+            for user in users:
+                user.pk = ids[user.email]
+        enrolled = roster.enroll(course_id, [user.pk for user in users]) if course_id else {}
+    for line, user in zip(lines, users):
+        details = []
+        if not chunk.valid[line].get('password'):
+            details.append("no password: set one with a password reset")
+        if user.pk in enrolled:
+            details.append("enrolled")
+        chunk.report[line] = {
+            'row': line, 'email': user.email, 'username': user.username,
+            'result': CREATED, 'user_id': user.pk, 'detail': '; '.join(details),
+        }
+
+
+def import_chunk(chunk, course_id, seen, pool, hasher):
+    """Validates, hashes and inserts one chunk. Returns its report rows in file order."""
+    _validate(chunk, seen)
+    _drop_taken(chunk)
+    lines = list(chunk.valid)
+    passwords = [chunk.valid[line].get('password') or None for line in lines]
+    hashes = dict(zip(lines, pool.map(partial(make_password, hasher=hasher), passwords)))
+    try:
+        _insert(chunk, hashes, course_id)
+    except IntegrityError:
+        # Someone registered one of these students since the check; check again and retry once
+        _drop_taken(chunk)
+        _insert(chunk, hashes, course_id)
+    return [chunk.report[line] for line in sorted(chunk.report)]
+
+
+def run(import_id):
+    """Imports the rows of StudentImport `import_id`, updating its progress after each chunk."""
+    record = StudentImport.objects.get(pk=import_id)
+    StudentImport.objects.filter(pk=record.pk).update(status='running', started_at=timezone.now())
+    report = io.StringIO()
+    writer = csv.DictWriter(report, fieldnames=REPORT_COLUMNS)
+    writer.writeheader()
+    seen = {'email': set(), 'username': set()}
+    processed = created = failed = 0
+    hasher = password_hasher()
+    rows = _rows(record.source)
+    try:
+        with ThreadPoolExecutor(max_workers=hash_workers(hasher)) as pool:
+            while chunk_rows := list(islice(rows, CHUNK_SIZE)):
+                results = import_chunk(_Chunk(chunk_rows), record.course_id, seen, pool, hasher)
+                writer.writerows(results)
+                processed += len(results)
+                created += sum(1 for result in results if result['result'] == CREATED)
+                failed = processed - created
+                StudentImport.objects.filter(pk=record.pk).update(
+                    processed_rows=processed, created_count=created, failed_count=failed,
+                )
+    except Exception:
+        StudentImport.objects.filter(pk=record.pk).update(
+            status='failed', error=traceback.format_exc(), report=report.getvalue(), finished_at=timezone.now(),
+        )
+        raise
+    StudentImport.objects.filter(pk=record.pk).update(
+        status='succeeded', report=report.getvalue(), finished_at=timezone.now(),
+    )
+
+
+def summary(record):
+    return {
+        'id': record.id,
+        'status': record.status,
+        'course_id': record.course_id,
+        'filename': record.filename,
+        'total_rows': record.total_rows,
+        'processed_rows': record.processed_rows,
+        'created': record.created_count,
+        'failed': record.failed_count,
+        'error': record.error.strip().splitlines()[-1] if record.error else '',
+        'created_at': record.created_at,
+        'finished_at': record.finished_at,
+    }
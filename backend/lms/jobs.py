@@ -0,0 +1,176 @@
+"""
+Postgres-backed job queue (no broker needed).
+
+    from lms import jobs
+
+    @jobs.job('lms.backfill_badges')
+    def backfill_badges():
+        ...
+
+    jobs.enqueue('lms.backfill_badges', priority=5)
+
+Workers (`manage.py runworker`) claim rows with SELECT ... FOR UPDATE SKIP LOCKED,
+so any number of worker processes can share the table without double-running a job.
+Failed jobs are retried with exponential backoff until `max_attempts` is reached.
+While a job runs, its worker bumps heartbeat_at every HEARTBEAT_INTERVAL; a job
+whose heartbeat stops for STALE_AFTER belongs to a dead worker and is put back
+by requeue_stale(), however long a live run takes. The outcome of a run is only
+recorded while the row is still that run's (same attempt), so a run that was
+presumed dead cannot overwrite the retry's result.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 3600
+# How often runworker marks its running jobs as alive
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+# A running job without a heartbeat for this long is assumed to belong to a dead worker
+STALE_AFTER = timedelta(minutes=5)
+# How often runworker looks for such jobs
+SWEEP_INTERVAL = timedelta(minutes=1)
+
+_registry = {}
+
+
+def job(name):
+    """Register a function as a job handler under `name`."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, priority=0, run_at=None, max_attempts=3, **kwargs):
+    if name not in _registry:
+        raise ValueError(f"Unknown job '{name}'.")
+    return Job.objects.create(
+        name=name,
+        kwargs=kwargs,
+        priority=priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def claim(worker_id):
+    """Atomically take the next due job, or return None."""
+    with transaction.atomic():
+        job_row = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_at__lte=timezone.now())
+            .order_by('-priority', 'run_at', 'id')
+            .first()
+        )
+        if job_row is None:
+            return None
+        # The status guard keeps this safe on backends without row locks (SQLite in tests)
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_row.pk, status='queued').update(
+            status='running', worker=worker_id, started_at=now, heartbeat_at=now, attempts=job_row.attempts + 1,
+        )
+        if not claimed:
+            return None
+    job_row.refresh_from_db()
+    return job_row
+
+
+def heartbeat(job_ids):
+    """Marks the running jobs `job_ids` as alive, with one UPDATE. Returns the rows touched."""
+    if not job_ids:
+        return 0
+    return Job.objects.filter(pk__in=job_ids, status='running').update(heartbeat_at=timezone.now())
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def run(job_row):
+    """Execute a claimed job and record the outcome."""
+    func = _registry.get(job_row.name)
+    # Still this run's row: not requeued as stale and claimed again meanwhile
+    this_run = Job.objects.filter(pk=job_row.pk, status='running', attempts=job_row.attempts)
+    try:
+        if func is None:
+            raise LookupError(f"No handler registered for '{job_row.name}'.")
+        func(**job_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s #%s failed (attempt %s/%s)", job_row.name, job_row.id, job_row.attempts, job_row.max_attempts)
+        if job_row.attempts < job_row.max_attempts:
+            this_run.update(
+                status='queued', run_at=timezone.now() + backoff(job_row.attempts), last_error=error, worker='',
+            )
+        else:
+            this_run.update(status='failed', finished_at=timezone.now(), last_error=error)
+        return False
+
+    this_run.update(status='succeeded', finished_at=timezone.now())
+    return True
+
+
+def requeue_stale():
+    """
+    Put jobs abandoned by crashed workers back on the queue. The abandoned run
+    counts as an attempt (claim() already counted it), so a job that keeps
+    killing its worker ends up failed instead of looping forever.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', heartbeat_at__lt=now - STALE_AFTER)
+    error = f"Abandoned: no heartbeat for {STALE_AFTER}, the worker is assumed dead."
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status='failed', finished_at=now, last_error=error)
+    requeued = stale.update(status='queued', worker='', run_at=now, last_error=error)
+    if failed:
+        logger.warning("Failed %s abandoned job(s) out of attempts", failed)
+    return requeued
+
+
+# =============================================================================
+# Built-in jobs
+# =============================================================================
+
+@job('lms.backfill_badges')
+def backfill_badges(min_xp=0):
+    """Grant every XP-threshold badge a user qualifies for."""
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    for user in User.objects.filter(xp__gte=min_xp).iterator(chunk_size=500):
+        user.check_badges()
+
+
+@job('lms.process_events')
+def process_events(consumer='default', batch_size=500):
+    from . import events
+    while events.process_batch(consumer=consumer, batch_size=batch_size):
+        pass
+
+
+@job('lms.maintain_attendance_partitions')
+def maintain_attendance_partitions():
+    """Pre-create DailyAttendanceLog partitions and archive expired months (ATTENDANCE_PARTITIONS)."""
+    from . import partitions
+    partitions.maintain(log=logger.info)
+
+
+@job('lms.prune_attendance_sync_ops')
+def prune_attendance_sync_ops():
+    """Forget offline-sync acks past their retention (lms.sync.OP_RETENTION)."""
+    from . import sync
+    logger.info("Pruned %s attendance sync acks", sync.prune_ops())
+
+
+@job('lms.import_students')
+def import_students(import_id):
+    """Run a staff student import (lms/imports.py); queued by StudentImportView."""
+    from . import imports
+    imports.run(import_id)
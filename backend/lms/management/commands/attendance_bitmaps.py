@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lms import bitmaps
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-term attendance bitmaps from the daily logs and archives (see lms/bitmaps.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', type=int, action='append', dest='students',
+                            help="Only rebuild this student's bitmaps (repeatable).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = bitmaps.rebuild(options['students'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {count} attendance bitmaps in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,49 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms import partitions
+
+
+def month_arg(value):
+    return date.fromisoformat(f'{value}-01')
+
+
+class Command(BaseCommand):
+    help = "Pre-create monthly DailyAttendanceLog partitions and archive old months (see lms/partitions.py)."
+
+    def add_arguments(self, parser):
+        conf = partitions.config()
+        parser.add_argument('--months-ahead', type=int, default=conf['MONTHS_AHEAD'],
+                            help="Future months that must have a partition.")
+        parser.add_argument('--archive-after-months', type=int, default=conf['ARCHIVE_AFTER_MONTHS'],
+                            help="Archive months older than this many months; 0 archives nothing.")
+        parser.add_argument('--archive', type=month_arg, metavar='YYYY-MM', action='append', default=[],
+                            help="Archive this month now (repeatable).")
+        parser.add_argument('--list', action='store_true', help="Print the partitions and archived months and exit.")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            if partitions.is_partitioned():
+                months = partitions.partitions()
+                self.stdout.write(f"{len(months)} partitions: {', '.join(f'{m:%Y-%m}' for m in months)}")
+            else:
+                self.stdout.write(f"{partitions.TABLE} is not partitioned on this database.")
+            archived = partitions.AttendanceArchive.objects.order_by('month').values_list('month', flat=True).distinct()
+            self.stdout.write(f"Archived months: {', '.join(f'{m:%Y-%m}' for m in archived) or 'none'}")
+            return
+
+        if options['months_ahead'] < 0 or options['archive_after_months'] < 0:
+            raise CommandError("--months-ahead and --archive-after-months cannot be negative.")
+        for month in options['archive']:
+            try:
+                archived, logs = partitions.archive_month(month)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f"Archived {month:%Y-%m}: {logs} logs into {archived} archive rows")
+        partitions.maintain(
+            months_ahead=options['months_ahead'],
+            archive_after_months=options['archive_after_months'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS("Attendance partitions are up to date."))
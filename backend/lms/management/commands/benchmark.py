@@ -0,0 +1,69 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from lms import benchmarks
+from monitoring import benchmark
+
+
+class Command(BaseCommand):
+    help = "Benchmark the hot API paths in-process and compare against a stored baseline (see lms/benchmarks.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--warm-cache', action='store_true', help="Keep the cache between calls instead of clearing it.")
+        parser.add_argument('--only', action='append', default=[], help="Scenario label to run (repeatable).")
+        parser.add_argument('--output', help="Write the results as JSON, e.g. to use as the next baseline.")
+        parser.add_argument('--compare', metavar='BASELINE', help="Baseline JSON to compare against.")
+        parser.add_argument('--threshold', type=float, default=10.0, help="Percent growth that counts as a regression.")
+        parser.add_argument('--fail-on-regression', action='store_true', help="Exit non-zero when anything regressed.")
+
+    def handle(self, *args, **options):
+        scenarios = benchmarks.SCENARIOS
+        if options['only']:
+            scenarios = [s for s in scenarios if str(s) in options['only']]
+            unknown = set(options['only']) - {str(s) for s in scenarios}
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        baseline = benchmark.load(options['compare']) if options['compare'] else None
+
+        # Measure the production request path: no DEBUG query log, no N+1 detector, profiler, slow-query capture or memory sampling,
+        # no throttling of the benchmark's own back-to-back calls, no per-request log lines
+        logging.getLogger('monitoring.requests').setLevel(logging.WARNING)
+        with override_settings(DEBUG=False, NPLUSONE={'ENABLED': False}, PROFILER={'ENABLED': False},
+                               SLOW_QUERIES={'ENABLED': False}, MEMORY={'ENABLED': False},
+                               ADMISSION={'ENABLED': False}, ALLOWED_HOSTS=['testserver']):
+            dataset = benchmarks.dataset_summary()
+            runner = benchmark.Runner(
+                scenarios, benchmarks.build_context, iterations=options['iterations'], warmup=options['warmup'],
+                warm_cache=options['warm_cache'], log=self.stdout.write,
+            )
+            self.stdout.write(f"Benchmarking {len(scenarios)} scenarios x {options['iterations']} iterations:")
+            try:
+                results = runner.run()
+            except benchmark.BenchmarkError as exc:
+                raise CommandError(str(exc))
+        current = benchmark.report(
+            results, dataset=dataset, iterations=options['iterations'], warm_cache=options['warm_cache'],
+        )
+
+        if options['output']:
+            benchmark.save(current, options['output'])
+            self.stdout.write(f"Wrote {options['output']}.")
+
+        if baseline is None:
+            return
+        lines, regressions = benchmark.compare(baseline, current, threshold=options['threshold'] / 100)
+        self.stdout.write('')
+        self.stdout.write(f"Compared with {options['compare']} ({baseline.get('git_commit') or 'unknown commit'}):")
+        for line in lines:
+            self.stdout.write(self.style.ERROR(line) if line.endswith('REGRESSION') else line)
+        if regressions:
+            message = f"{len(regressions)} regression(s) beyond {options['threshold']:g}%."
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("No regressions."))
@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms import dataset
+
+
+class Command(BaseCommand):
+    help = "Load a deterministic, production-sized synthetic dataset (see lms/dataset.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1, help=f"Multiplier; 1 = {dataset.PER_SCALE['students']:,} students.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--days', type=int, default=730, help="Days of history ending at --end-date.")
+        parser.add_argument('--end-date', type=date.fromisoformat, help="Last day of history (YYYY-MM-DD, default today).")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows per transaction (x10 per COPY).")
+        parser.add_argument('--no-copy', action='store_true', help="Use batched INSERTs even on PostgreSQL.")
+        parser.add_argument('--flush', action='store_true', help="Delete a previously generated dataset first.")
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1:
+            raise CommandError("--scale must be at least 1.")
+
+        if options['flush']:
+            deleted = dataset.flush()
+            self.stdout.write("Flushed: " + ", ".join(f"{label}={count:,}" for label, count in deleted.items()))
+        elif dataset.User.objects.filter(email__endswith=f'@{dataset.EMAIL_DOMAIN}').exists():
+            raise CommandError("A generated dataset is already loaded; pass --flush to replace it.")
+
+        generator = dataset.DatasetGenerator(
+            scale=options['scale'],
+            seed=options['seed'],
+            end_date=options['end_date'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            use_copy=False if options['no_copy'] else None,
+            log=self.stdout.write,
+        )
+        generator.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Students log in as student<N>@{dataset.EMAIL_DOMAIN} / {dataset.PASSWORD}."
+        ))
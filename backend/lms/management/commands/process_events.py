@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lms import events
+
+
+class Command(BaseCommand):
+    help = "Drain the DomainEvent outbox into caches, counters and badges."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', default=events.DEFAULT_CONSUMER)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting when caught up.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when caught up (with --loop).")
+        parser.add_argument('--replay-from', type=int, help="Rewind the consumer to this event id before processing.")
+        parser.add_argument('--lag', action='store_true', help="Print consumer lag and exit.")
+
+    def handle(self, *args, **options):
+        consumer = options['consumer']
+
+        if options['lag']:
+            lag = events.consumer_lag(consumer)
+            self.stdout.write(
+                f"{lag['consumer']}: offset={lag['offset']} head={lag['head']} "
+                f"lag={lag['lag_events']} events / {lag['lag_seconds']:.1f}s gaps={lag['gaps']}"
+            )
+            return
+
+        if options['replay_from'] is not None:
+            events.replay_from(options['replay_from'], consumer=consumer)
+            self.stdout.write(f"Rewound '{consumer}' to event #{options['replay_from']}.")
+
+        total = 0
+        while True:
+            processed = events.process_batch(consumer=consumer, batch_size=options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} event(s) for '{consumer}'."))
@@ -0,0 +1,97 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from lms import jobs
+from monitoring import pool as db_pool
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the lms_job table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=int(os.getenv('WORKER_CONCURRENCY', '2')),
+                            help="Number of jobs to run in parallel (threads).")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no due jobs are left.")
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        stop = threading.Event()
+        slots = threading.BoundedSemaphore(concurrency)
+        running, running_lock = set(), threading.Lock()
+        stopped = threading.Event()
+        # The settings size the pool for gunicorn's threads; here the main loop, the heartbeat and every
+        # job thread each hold a connection at once
+        db_pool.size_for(concurrency + 2)
+
+        def shutdown(signum, frame):
+            self.stdout.write("Shutting down after running jobs finish...")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        def execute(job_row):
+            try:
+                jobs.run(job_row)
+            finally:
+                with running_lock:
+                    running.discard(job_row.id)
+                close_old_connections()
+                slots.release()
+
+        def beat():
+            # A thread of its own: the main loop blocks while every slot is busy
+            while not stopped.wait(jobs.HEARTBEAT_INTERVAL.total_seconds()):
+                with running_lock:
+                    job_ids = list(running)
+                try:
+                    jobs.heartbeat(job_ids)
+                except Exception as exc:
+                    self.stderr.write(f"Heartbeat failed: {exc}")
+                finally:
+                    close_old_connections()
+
+        def sweep():
+            try:
+                requeued = jobs.requeue_stale()
+            finally:
+                close_old_connections()
+            if requeued:
+                self.stdout.write(f"Re-queued {requeued} stale job(s).")
+            return time.monotonic() + jobs.SWEEP_INTERVAL.total_seconds()
+
+        next_sweep = sweep()
+        heart = threading.Thread(target=beat, name='runworker-heartbeat', daemon=True)
+        heart.start()
+        self.stdout.write(f"Worker {worker_id} started with concurrency={concurrency}.")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while not stop.is_set():
+                if time.monotonic() >= next_sweep:
+                    next_sweep = sweep()
+                slots.acquire()
+                job_row = jobs.claim(worker_id)
+                close_old_connections()
+                if job_row is None:
+                    slots.release()
+                    if options['burst']:
+                        break
+                    stop.wait(options['interval'])
+                    continue
+                with running_lock:
+                    running.add(job_row.id)
+                pool.submit(execute, job_row)
+            # leaving the block waits for in-flight jobs
+        stopped.set()
+        heart.join()
+
+        self.stdout.write(self.style.SUCCESS("Worker stopped."))
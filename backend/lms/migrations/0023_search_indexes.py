@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# Search indexes for lms.search on PostgreSQL (see accounts 0007 for the user columns):
+# trigram GIN on the UPPER(col::text) expressions of icontains/istartswith, and a GIN
+# index on the tsvector that SearchVector(text_response, config='simple') compiles to.
+TRIGRAM = (
+    ('lms_course', 'course_name'),
+    ('lms_dailychallenge', 'mission'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in TRIGRAM:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+            f'ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS lms_challengesubmission_text_fts ON lms_challengesubmission '
+        "USING gin (to_tsvector('simple'::regconfig, COALESCE(text_response, '')))"
+    )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in TRIGRAM:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS lms_challengesubmission_text_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_user_search_indexes'),
+        ('lms', '0022_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,74 @@
+from datetime import date
+
+from django.db import migrations
+
+# PostgreSQL only: rebuild lms_dailyattendancelog as a table range-partitioned by date,
+# one partition per month plus a default one (see lms/partitions.py). The rows are copied,
+# so on a large table run this in a maintenance window. The primary key becomes
+# (id, date) because a partitioned table's unique keys must contain the partition key;
+# ids still come from one sequence and stay unique. The model is unchanged. Reversing
+# keeps the partitioned table, which Django uses like the plain one.
+TABLE = 'lms_dailyattendancelog'
+LEGACY = 'lms_dailyattendancelog_unpartitioned'
+SEQUENCE = 'lms_dailyattendancelog_id_part_seq'
+MONTHS_AHEAD = 3
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(date), COALESCE(MAX(id), 0) FROM {TABLE}')
+        first, max_id = cursor.fetchone()
+
+    execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY}')
+    execute(f'CREATE TABLE {TABLE} (LIKE {LEGACY}) PARTITION BY RANGE (date)')
+    execute(f'CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    execute(f"SELECT setval('{SEQUENCE}', {max_id + 1}, false)")
+    execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+    execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey_part PRIMARY KEY (id, date)')
+    execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_student_course_date_uniq UNIQUE (student_id, course_id, date)')
+    execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_student_id_fk_part FOREIGN KEY (student_id) '
+        f'REFERENCES accounts_user (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_course_id_fk_part FOREIGN KEY (course_id) '
+        f'REFERENCES lms_course (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    execute(f'CREATE INDEX {TABLE}_course_id_part ON {TABLE} (course_id)')
+    execute(f'CREATE INDEX {TABLE}_status_part ON {TABLE} (status)')
+
+    execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+    today = date.today().replace(day=1)
+    month = (first or today).replace(day=1)
+    while month <= add_months(today, MONTHS_AHEAD):
+        end = add_months(month, 1)
+        execute(
+            f"CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        month = end
+
+    execute(
+        f'INSERT INTO {TABLE} (id, date, status, student_id, course_id) '
+        f'SELECT id, date, status, student_id, course_id FROM {LEGACY}'
+    )
+    execute(f'DROP TABLE {LEGACY}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0024_attendancearchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:32
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_duplicate_enrollments(apps, schema_editor):
+    # Double submits enrolled some students twice. Keep the copy with a grade (else the first),
+    # move the others' attendance logs and progress onto it, then drop them
+    Enrollment = apps.get_model('lms', 'Enrollment')
+    Grade = apps.get_model('lms', 'Grade')
+    AttendanceLog = apps.get_model('lms', 'AttendanceLog')
+    duplicates = (
+        Enrollment.objects.values('student_id', 'course_id')
+        .annotate(copies=Count('id')).filter(copies__gt=1)
+    )
+    for row in duplicates:
+        copies = list(Enrollment.objects.filter(student_id=row['student_id'], course_id=row['course_id']).order_by('id'))
+        graded = list(
+            Grade.objects.filter(enrollment__in=copies).exclude(grade__isnull=True).exclude(grade='')
+            .order_by('-updated_at').values_list('enrollment_id', flat=True)
+        )
+        keep = next(copy for copy in copies if copy.id == graded[0]) if graded else copies[0]
+        others = [copy.id for copy in copies if copy.id != keep.id]
+        logged = set(AttendanceLog.objects.filter(enrollment=keep).values_list('date', flat=True))
+        for log in AttendanceLog.objects.filter(enrollment_id__in=others).order_by('-id'):
+            if log.date not in logged:
+                AttendanceLog.objects.filter(id=log.id).update(enrollment=keep)
+                logged.add(log.date)
+        progress = max(copy.manual_progress for copy in copies)
+        if progress != keep.manual_progress:
+            Enrollment.objects.filter(id=keep.id).update(manual_progress=progress)
+        Enrollment.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0027_attendance_sync'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_enrollments, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='enrollment',
+            unique_together={('student', 'course')},
+        ),
+    ]
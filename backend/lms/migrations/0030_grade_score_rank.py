@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:40
+
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import Rank, Trim, Upper
+
+# lms.grades.SCALE when this migration was written
+SCALE = {'O': 10, 'A+': 9, 'A': 8, 'B+': 7, 'B': 6, 'C+': 5, 'C': 4, 'D': 3, 'E': 2, 'F': 0}
+
+
+def score_and_rank_grades(apps, schema_editor):
+    Grade = apps.get_model('lms', 'Grade')
+    graded = Grade.objects.annotate(letter=Upper(Trim('grade')))
+    for letter, score in SCALE.items():
+        graded.filter(letter=letter).update(score=score)
+    ranked = (
+        Grade.objects.filter(score__isnull=False)
+        .annotate(new_rank=Window(Rank(), partition_by=F('enrollment__course_id'), order_by=F('score').desc()))
+        .values_list('id', 'new_rank')
+    )
+    Grade.objects.bulk_update([Grade(id=pk, rank=rank) for pk, rank in ranked], ['rank'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0029_studentimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grade',
+            name='rank',
+            field=models.PositiveIntegerField(blank=True, help_text='Rank in the course by score, kept by lms.grades.recompute_ranks', null=True),
+        ),
+        migrations.AddField(
+            model_name='grade',
+            name='score',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='The grade on lms.grades.SCALE; higher is better', null=True),
+        ),
+        migrations.RunPython(score_and_rank_grades, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0030_grade_score_rank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='challengesubmission',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['challenge', 'submitted_at', 'id'], name='lms_submission_pending_idx'),
+        ),
+    ]
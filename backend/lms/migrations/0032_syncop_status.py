@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0031_submission_pending_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancesyncop',
+            name='status',
+            field=models.CharField(blank=True, help_text="The server's status, on stale acks", max_length=10),
+        ),
+    ]
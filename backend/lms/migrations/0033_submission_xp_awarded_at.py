@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:05
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_paid_submissions(apps, schema_editor):
+    # Every approved submission has had its XP
+    ChallengeSubmission = apps.get_model('lms', 'ChallengeSubmission')
+    ChallengeSubmission.objects.filter(status='approved').update(xp_awarded_at=F('submitted_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0032_syncop_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengesubmission',
+            name='xp_awarded_at',
+            field=models.DateTimeField(blank=True, help_text="When the challenge's XP was paid; it is paid once", null=True),
+        ),
+        migrations.RunPython(mark_paid_submissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0033_submission_xp_awarded_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventconsumeroffset',
+            name='gaps',
+            field=models.JSONField(blank=True, default=dict, help_text='Ids below last_event_id not seen yet: {id: first missed at}'),
+        ),
+    ]
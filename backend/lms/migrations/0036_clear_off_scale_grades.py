@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:02
+
+from django.db import migrations
+
+
+def clear_off_scale_grades(apps, schema_editor):
+    # 0030 scored every grade on the scale; the rest (e.g. '85', 'Pass') would make Grade.save() raise,
+    # so they become ungraded and teachers re-enter them on the scale
+    Grade = apps.get_model('lms', 'Grade')
+    Grade.objects.filter(score__isnull=True, grade__isnull=False).update(grade=None, rank=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0035_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_off_scale_grades, migrations.RunPython.noop),
+    ]
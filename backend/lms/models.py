@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from django.core.cache import cache
-from django.db.models import Count, Q
+from django.core.exceptions import ValidationError
+from django.db.models import Avg, Case, Count, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 
 class Course(models.Model):
     course_name = models.CharField(max_length=255)
@@ -40,12 +43,18 @@ class Enrollment(models.Model):
     enrollment_date = models.DateTimeField(auto_now_add=True)
     manual_progress = models.IntegerField(default=0, help_text="Manually entered progress percentage (0-100)")
 
+    class Meta:
+        unique_together = ('student', 'course')
+
     def save(self, *args, **kwargs):
+        from . import events
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-        if is_new:
-            Attendance.objects.get_or_create(enrollment=self)
-            Grade.objects.get_or_create(enrollment=self)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                Attendance.objects.get_or_create(enrollment=self)
+                Grade.objects.get_or_create(enrollment=self)
+                events.emit(events.ENROLLMENT_CREATED, enrollment_id=self.pk, student_id=self.student_id, course_id=self.course_id)
 
     def __str__(self):
         return f"{self.student.email} enrolled in {self.course.course_name}"
@@ -53,8 +62,24 @@ class Enrollment(models.Model):
 class Grade(models.Model):
     enrollment = models.OneToOneField(Enrollment, on_delete=models.CASCADE, related_name='grade')
     grade = models.CharField(max_length=10, blank=True, null=True)
+    score = models.PositiveSmallIntegerField(null=True, blank=True, help_text="The grade on lms.grades.SCALE; higher is better")
+    rank = models.PositiveIntegerField(null=True, blank=True, help_text="Rank in the course by score, kept by lms.grades.recompute_ranks")
     updated_at = models.DateTimeField(auto_now=True)
 
+    def clean(self):
+        from . import grades
+        grade = grades.normalize(self.grade)
+        if grade is not None and grade not in grades.SCALE:
+            raise ValidationError({'grade': f"Unknown grade '{self.grade}'; use one of {', '.join(grades.SCALE)}."})
+
+    def save(self, *args, **kwargs):
+        from . import grades
+        self.grade = grades.normalize(self.grade)
+        self.score = grades.score(self.grade)
+        if self.grade is not None and self.score is None:
+            raise ValueError(f"Unknown grade '{self.grade}'; use one of {', '.join(grades.SCALE)}.")
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Grade for {self.enrollment}: {self.grade}"
 
@@ -63,6 +88,11 @@ class Attendance(models.Model):
 
     def _get_cached_stats(self):
         """Single query + cache for all attendance stats. Avoids 3 separate COUNT queries."""
+        if hasattr(self, '_prefetched_stats'):
+            return self._prefetched_stats
+        if hasattr(self, 'log_count'):
+            # Annotated with attendance_stats_subqueries()
+            return {'total': self.log_count, 'present': self.present_count, 'last_date': self.last_log}
         student_id = self.enrollment.student_id
         course_id = self.enrollment.course_id
         cache_key = f'attendance_stats_{student_id}_{course_id}'
@@ -110,11 +140,69 @@ class Attendance(models.Model):
         stats = self._get_cached_stats()
         return f"Attendance Summary for {self.enrollment}: {stats['present']}/{stats['total']}"
 
+def prefetch_attendance_stats(enrollments):
+    """
+    Fill the stats of many `enrollment.attendance` rows with one grouped query,
+    instead of two queries per row in Attendance._get_cached_stats.
+    Expects `attendance` to be select_related on the enrollments.
+    """
+    enrollments = [e for e in enrollments if hasattr(e, 'attendance')]
+    if not enrollments:
+        return
+    rows = DailyAttendanceLog.objects.filter(
+        student_id__in={e.student_id for e in enrollments},
+        course_id__in={e.course_id for e in enrollments},
+    ).values('student_id', 'course_id').annotate(
+        total=Count('id'),
+        present=Count('id', filter=Q(status='present')),
+        last_date=models.Max('date'),
+    )
+    stats = {(r['student_id'], r['course_id']): r for r in rows}
+    for enrollment in enrollments:
+        row = stats.get((enrollment.student_id, enrollment.course_id))
+        enrollment.attendance._prefetched_stats = {
+            'total': row['total'] if row else 0,
+            'present': row['present'] if row else 0,
+            'last_date': row['last_date'] if row else None,
+        }
+
+def _logs_for(student_ref, course_ref):
+    return DailyAttendanceLog.objects.filter(
+        student_id=OuterRef(student_ref), course_id=OuterRef(course_ref),
+    ).order_by().values('student_id')
+
+
+def attendance_percentage_subquery(student_ref, course_ref):
+    """
+    Percentage of present logs for the (student, course) the outer row points at,
+    0 without logs, like Attendance.attendance_percentage. Sortable and filterable.
+    """
+    present = Avg(Case(When(status='present', then=Value(100.0)), default=Value(0.0), output_field=FloatField()))
+    return Coalesce(Subquery(_logs_for(student_ref, course_ref).annotate(pct=present).values('pct')), Value(0.0))
+
+
+def attendance_stats_subqueries(student_ref, course_ref):
+    """
+    Annotations with the attendance stats of the outer row's (student, course):
+    log_count, present_count, last_log and attendance_pct. An Attendance annotated
+    with them answers its stat properties without further queries.
+    """
+    logs = _logs_for(student_ref, course_ref)
+    return {
+        'log_count': Coalesce(Subquery(logs.annotate(n=Count('id')).values('n')), 0),
+        'present_count': Coalesce(Subquery(logs.annotate(n=Count('id', filter=Q(status='present'))).values('n')), 0),
+        'last_log': Subquery(logs.annotate(last=models.Max('date')).values('last')),
+        'attendance_pct': attendance_percentage_subquery(student_ref, course_ref),
+    }
+
 class DailyAttendanceLog(models.Model):
     student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_attendance_logs')
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='daily_attendance_logs', null=True, blank=True)
     date = models.DateField()
     status = models.CharField(max_length=10, choices=[('present', 'Present'), ('absent', 'Absent')], default='present', db_index=True)
+    # Bumped on every write; marked_at is when the status was taken (the device's clock for synced marks)
+    version = models.PositiveIntegerField(default=1)
+    marked_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ('student', 'course', 'date')
@@ -123,6 +211,72 @@ class DailyAttendanceLog(models.Model):
     def __str__(self):
         return f"{self.student.username} - {self.date}: {self.status}"
 
+class AttendanceArchive(models.Model):
+    """
+    One month of a student's DailyAttendanceLog rows for a course, folded into a
+    day string when the month is archived (lms/partitions.py): character d-1 is
+    'P' (present), 'A' (absent) or '-' (no log) for day d of the month.
+    """
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='attendance_archives')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='attendance_archives', null=True, blank=True)
+    month = models.DateField(help_text="First day of the archived month")
+    days = models.CharField(max_length=31)
+
+    class Meta:
+        unique_together = ('student', 'course', 'month')
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.student_id} - {self.month:%Y-%m}: {self.days}"
+
+    def logs(self):
+        """(date, status) for each logged day of the month."""
+        return [
+            (self.month.replace(day=day), ARCHIVE_STATUSES[code])
+            for day, code in enumerate(self.days, start=1) if code in ARCHIVE_STATUSES
+        ]
+
+ARCHIVE_CODES = {'present': 'P', 'absent': 'A'}
+ARCHIVE_STATUSES = {code: status for status, code in ARCHIVE_CODES.items()}
+
+class AttendanceSyncOp(models.Model):
+    """An attendance operation already applied by the offline sync (lms/sync.py), with the ack it got."""
+    teacher = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='attendance_sync_ops')
+    op_id = models.CharField(max_length=64)
+    result = models.CharField(max_length=10)
+    version = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, blank=True, help_text="The server's status, on stale acks")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('teacher', 'op_id')
+
+    def __str__(self):
+        return f"{self.teacher_id} - {self.op_id}: {self.result}"
+
+class AttendanceBitmap(models.Model):
+    """
+    A student's DailyAttendanceLog rows for a course and term as two bitsets
+    (lms/bitmaps.py): bit i of `held` is set when day i of the term has a log,
+    bit i of `present` when that log is 'present'. Little-endian bytes.
+    """
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='attendance_bitmaps')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='attendance_bitmaps', null=True, blank=True)
+    term = models.DateField(help_text="First day of the term")
+    present = models.BinaryField(default=b'')
+    held = models.BinaryField(default=b'')
+
+    class Meta:
+        unique_together = ('student', 'course', 'term')
+        ordering = ['-term']
+
+    def __str__(self):
+        return f"{self.student_id} - {self.course_id} - {self.term}"
+
+    def bits(self):
+        """(present, held) as ints."""
+        return int.from_bytes(self.present, 'little'), int.from_bytes(self.held, 'little')
+
 # Keep for legacy if needed, or remove later
 class AttendanceLog(models.Model):
     enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name='attendance_logs')
@@ -325,9 +479,99 @@ class ChallengeSubmission(models.Model):
     quiz_score = models.IntegerField(default=0, help_text="Number of correct answers if type is quiz")
     total_quiz_questions = models.IntegerField(default=0)
     submitted_at = models.DateTimeField(auto_now_add=True)
+    xp_awarded_at = models.DateTimeField(null=True, blank=True, help_text="When the challenge's XP was paid; it is paid once")
 
     class Meta:
         unique_together = ('challenge', 'student')
+        indexes = [
+            # The teachers' review queue (lms/reviews.py): pending submissions per challenge, oldest first
+            models.Index(fields=['challenge', 'submitted_at', 'id'], condition=Q(status='pending'), name='lms_submission_pending_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.username} - {self.challenge}"
+
+class DomainEvent(models.Model):
+    """Outbox row written in the same transaction as the change it describes (see lms/events.py)."""
+    EVENT_CHOICES = [
+        ('attendance_marked', 'Attendance Marked'),
+        ('attendance_changed', 'Attendance Changed'),
+        ('xp_awarded', 'XP Awarded'),
+        ('submission_approved', 'Submission Approved'),
+        ('enrollment_created', 'Enrollment Created'),
+    ]
+    event_type = models.CharField(max_length=50, choices=EVENT_CHOICES, db_index=True)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.event_type}"
+
+class EventConsumerOffset(models.Model):
+    """Last DomainEvent id processed by a named consumer. Rewind it to replay."""
+    consumer = models.CharField(max_length=100, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    gaps = models.JSONField(default=dict, blank=True, help_text="Ids below last_event_id not seen yet: {id: first missed at}")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.consumer} @ {self.last_event_id}"
+
+class Job(models.Model):
+    """Background job row, claimed by `manage.py runworker` (see lms/jobs.py)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    name = models.CharField(max_length=100, db_index=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    priority = models.IntegerField(default=0, help_text="Higher runs first")
+    run_at = models.DateTimeField(default=timezone.now, help_text="Not picked up before this time")
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    last_error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the worker running it")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'], name='lms_job_dequeue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+class StudentImport(models.Model):
+    """A staff CSV import of students, run by the lms.import_students job (lms/imports.py)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='student_imports')
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True, help_text="Enroll the imported students")
+    filename = models.CharField(max_length=255, blank=True)
+    source = models.TextField(help_text="The uploaded CSV")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    report = models.TextField(blank=True, help_text="Per-row results as CSV")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Student import #{self.id} ({self.status})"
@@ -0,0 +1,251 @@
+"""
+Monthly partitions and archival for DailyAttendanceLog.
+
+On PostgreSQL the table is range-partitioned by `date`, one partition per
+month (lms_dailyattendancelog_pYYYYMM) plus a default partition for dates no
+partition covers yet (migration 0025). A date filter (the daily roster, a
+register month) only touches the partitions it covers; per-student queries
+probe each partition's (student, course, date) index. `manage.py
+attendance_partitions` (or the lms.maintain_attendance_partitions job) keeps
+MONTHS_AHEAD future partitions in place, moving any rows the default
+partition caught for a month into that month's new partition.
+
+Months older than ARCHIVE_AFTER_MONTHS can be archived: each (student, course)
+month becomes one AttendanceArchive row with a day string, and the month's
+partition is detached and dropped (rows are deleted where the table is not
+partitioned, e.g. SQLite). Archived months drop out of the live attendance
+stats; attendance_history() reads live and archived rows for exports.
+
+Registers and offline syncs can still write to past dates, so a month is only
+archived once it ended WRITE_WINDOW_DAYS ago, and writes to it are locked out
+(LOCK TABLE ... SHARE ROW EXCLUSIVE on its partition) from the read until the
+partition is dropped, so a late write cannot slip in between and be lost.
+"""
+import re
+from datetime import date, timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import ARCHIVE_CODES, AttendanceArchive, DailyAttendanceLog
+
+TABLE = DailyAttendanceLog._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+
+DEFAULTS = {
+    'MONTHS_AHEAD': 3,
+    'ARCHIVE_AFTER_MONTHS': 0,   # 0: never archive automatically
+    'WRITE_WINDOW_DAYS': 31,     # months that ended more recently are never archived
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'ATTENDANCE_PARTITIONS', {})}
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partitions():
+    """Months that have their own partition, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s)', [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def create_partition(month):
+    """Adds the partition for `month`, taking over rows the default partition holds for it."""
+    name, start, end = partition_name(month), month.isoformat(), add_months(month, 1).isoformat()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s)', [start, end])
+        if not cursor.fetchone()[0]:
+            cursor.execute(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{start}') TO ('{end}')")
+            return
+        # PARTITION OF would fail on the default's rows: move them into a table, then attach it
+        cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved', [start, end],
+        )
+        cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+
+
+def ensure_partitions(first, last):
+    """Creates the missing partitions for every month from `first` to `last`; returns the months created."""
+    existing = set(partitions())
+    created = []
+    month = month_start(first)
+    while month <= month_start(last):
+        if month not in existing:
+            create_partition(month)
+            created.append(month)
+        month = add_months(month, 1)
+    return created
+
+
+def in_write_window(month, today=None):
+    """True while `month` may still get attendance writes, see WRITE_WINDOW_DAYS."""
+    today = today or date.today()
+    return add_months(month, 1) > today - timedelta(days=config()['WRITE_WINDOW_DAYS'])
+
+
+def _lock_month(month, partitioned):
+    """Blocks writes to `month`'s rows until the transaction ends; reads carry on."""
+    if connection.vendor != 'postgresql':
+        # SQLite: once this transaction has read, no other writer can commit before it does
+        return
+    if not partitioned:
+        table = TABLE
+    elif month in partitions():
+        table = partition_name(month)
+    else:
+        table = DEFAULT_PARTITION
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+
+
+def archive_month(month, today=None):
+    """
+    Folds one month of logs into AttendanceArchive rows, then removes the month
+    from the live table. Returns (archive rows written, logs archived).
+    ValueError for a month still inside the write window.
+    """
+    if in_write_window(month, today):
+        raise ValueError(f"{month:%Y-%m} ended less than {config()['WRITE_WINDOW_DAYS']} days ago; it can still be edited.")
+    start, end = month, add_months(month, 1)
+    days = {}
+    logs = 0
+    partitioned = is_partitioned()
+    with transaction.atomic():
+        _lock_month(month, partitioned)
+        rows = (
+            DailyAttendanceLog.objects.filter(date__gte=start, date__lt=end)
+            .order_by().values_list('student_id', 'course_id', 'date', 'status')
+        )
+        for student_id, course_id, day, status in rows.iterator(chunk_size=10000):
+            codes = days.setdefault((student_id, course_id), bytearray(b'-' * 31))
+            codes[day.day - 1] = ord(ARCHIVE_CODES.get(status, '-'))
+            logs += 1
+        # Logs that arrived after the month was first archived are merged into its archive rows
+        for archive in AttendanceArchive.objects.filter(month=month):
+            codes = days.get((archive.student_id, archive.course_id))
+            if codes is None:
+                continue
+            for i, code in enumerate(archive.days):
+                if codes[i] == ord('-'):
+                    codes[i] = ord(code)
+        AttendanceArchive.objects.bulk_create(
+            [
+                AttendanceArchive(student_id=student_id, course_id=course_id, month=month, days=codes.decode().rstrip('-'))
+                for (student_id, course_id), codes in days.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['student', 'course', 'month'],
+            update_fields=['days'],
+        )
+        if partitioned and month in partitions():
+            with connection.cursor() as cursor:
+                # DETACH waits for every query on the table and blocks new ones meanwhile; give up instead
+                cursor.execute("SET LOCAL lock_timeout = '10s'")
+                cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {partition_name(month)}')
+                cursor.execute(f'DROP TABLE {partition_name(month)}')
+        else:
+            # A plain DELETE like the dropped partition: the month's bits stay in the bitmaps, which the
+            # post_delete receiver (lms/signals.py) would clear, and no row is loaded
+            month_logs = DailyAttendanceLog.objects.filter(date__gte=start, date__lt=end)
+            month_logs._raw_delete(month_logs.db)
+    return len(days), logs
+
+
+def archivable_months(before):
+    """Months before `before` that still have live logs, oldest first."""
+    if is_partitioned():
+        months = [m for m in partitions() if m < before]
+        # Rows the default partition caught for old months
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT date_trunc('month', date)::date FROM {DEFAULT_PARTITION} WHERE date < %s", [before],
+            )
+            months += [row[0] for row in cursor.fetchall()]
+        return sorted(set(months))
+    oldest = DailyAttendanceLog.objects.filter(date__lt=before).order_by('date').values_list('date', flat=True).first()
+    if oldest is None:
+        return []
+    months, month = [], month_start(oldest)
+    while month < before:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def maintain(today=None, months_ahead=None, archive_after_months=None, log=None):
+    """Pre-creates future partitions and archives expired months, per ATTENDANCE_PARTITIONS."""
+    conf = config()
+    today = today or date.today()
+    months_ahead = conf['MONTHS_AHEAD'] if months_ahead is None else months_ahead
+    archive_after_months = conf['ARCHIVE_AFTER_MONTHS'] if archive_after_months is None else archive_after_months
+    log = log or (lambda message: None)
+
+    if is_partitioned():
+        created = ensure_partitions(month_start(today), add_months(month_start(today), months_ahead))
+        log(f"Partitions created: {', '.join(f'{m:%Y-%m}' for m in created) or 'none'}")
+    else:
+        log(f"{TABLE} is not partitioned on this database; skipping partition creation.")
+
+    if archive_after_months:
+        cutoff = add_months(month_start(today), -archive_after_months)
+        for month in archivable_months(cutoff):
+            if in_write_window(month, today):
+                log(f"Not archiving {month:%Y-%m} yet: it is still inside the write window.")
+                continue
+            archived, logs = archive_month(month, today)
+            log(f"Archived {month:%Y-%m}: {logs} logs into {archived} archive rows")
+
+
+def attendance_history(student_id, course_id=None):
+    """
+    Every (date, course_id, status) of a student, live and archived, oldest
+    first. Optionally limited to one course.
+    """
+    live = DailyAttendanceLog.objects.filter(student_id=student_id)
+    archived = AttendanceArchive.objects.filter(student_id=student_id)
+    if course_id is not None:
+        live = live.filter(course_id=course_id)
+        archived = archived.filter(course_id=course_id)
+    history = [
+        (day, archive.course_id, status)
+        for archive in archived
+        for day, status in archive.logs()
+    ]
+    history.extend(live.order_by().values_list('date', 'course_id', 'status'))
+    return sorted(history, key=itemgetter(0))
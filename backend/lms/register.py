@@ -0,0 +1,147 @@
+"""
+The class register: a course's roster against a range of dates.
+
+grid() reads the range from the AttendanceBitmap rows of the course (one row
+per student and term, lms/bitmaps.py), shifts each into the range and writes
+one status string per student: 'P' present, 'A' absent, '-' no log, one
+character per day from `start`. Per-day totals are bit-sliced counts over all
+students' bitsets, per-student totals popcounts. Archived months are included,
+since their bits stay in the bitmaps.
+
+save() is the write path for course attendance (the register grid,
+TeacherMarkAttendanceView and the offline sync): the affected logs are
+locked, then one INSERT ... ON CONFLICT upsert writes them with the next
+version, followed by the outbox events and the bitmap update, in one
+transaction.
+"""
+from calendar import monthrange
+from datetime import timedelta
+
+from django.db import transaction
+
+from . import bitmaps, events
+from .bitmaps import ABSENT, NO_CLASS, PRESENT
+from .models import AttendanceBitmap, DailyAttendanceLog, Enrollment
+
+# A quarter; a month is the usual view
+MAX_DAYS = 92
+STATUSES = {PRESENT: 'present', ABSENT: 'absent'}
+
+
+def month_end(day):
+    return day.replace(day=monthrange(day.year, day.month)[1])
+
+
+def _terms(start, end):
+    term, last = bitmaps.term_start(start), bitmaps.term_start(end)
+    terms = [term]
+    while term < last:
+        term = term.replace(year=term.year + 1)
+        terms.append(term)
+    return terms
+
+
+def _shift(bits, offset, mask):
+    return (bits << offset if offset >= 0 else bits >> -offset) & mask
+
+
+def grid(course_id, start, end):
+    """The register of `course_id` from `start` to `end` (inclusive), roster in username order."""
+    days = (end - start).days + 1
+    mask = (1 << days) - 1
+    roster = list(
+        Enrollment.objects.filter(course_id=course_id).order_by('student__username')
+        .values_list('student_id', 'student__username', 'student__full_name')
+    )
+    bits = {}
+    rows = AttendanceBitmap.objects.filter(course_id=course_id, term__in=_terms(start, end)).values_list(
+        'student_id', 'term', 'present', 'held',
+    )
+    for student_id, term, present, held in rows:
+        offset = (term - start).days
+        student_bits = bits.setdefault(student_id, [0, 0])
+        student_bits[0] |= _shift(int.from_bytes(present, 'little'), offset, mask)
+        student_bits[1] |= _shift(int.from_bytes(held, 'little'), offset, mask)
+
+    students, presents, absents = [], [], []
+    for student_id, username, full_name in roster:
+        present, held = bits.get(student_id, (0, 0))
+        absent = held & ~present
+        presents.append(present)
+        absents.append(absent)
+        students.append({
+            'student_id': student_id,
+            'username': username,
+            'full_name': full_name,
+            'days': ''.join(
+                (PRESENT if present >> i & 1 else ABSENT) if held >> i & 1 else NO_CLASS for i in range(days)
+            ),
+            'present': present.bit_count(),
+            'absent': absent.bit_count(),
+        })
+    present_per_day = bitmaps.day_counts(presents)
+    absent_per_day = bitmaps.day_counts(absents)
+    return {
+        'course_id': int(course_id),
+        'from': str(start),
+        'to': str(end),
+        'students': students,
+        'present_per_day': present_per_day + [0] * (days - len(present_per_day)),
+        'absent_per_day': absent_per_day + [0] * (days - len(absent_per_day)),
+    }
+
+
+def parse(start, rows):
+    """(student_id, date, status) for each 'P'/'A' in grid rows [{student_id, days}]; '-' leaves a day alone."""
+    entries = []
+    for row in rows:
+        for i, code in enumerate(row['days'][:MAX_DAYS]):
+            if code in STATUSES:
+                entries.append((int(row['student_id']), start + timedelta(days=i), STATUSES[code]))
+    return entries
+
+
+def save(entries):
+    """
+    Upserts (student_id, course_id, date, status, marked_at) logs, any number
+    of courses at once; later entries for the same log win. Returns
+    {(student_id, course_id, date): version} for the logs written.
+    """
+    latest = {
+        (student_id, course_id, day): (status, marked_at)
+        for student_id, course_id, day, status, marked_at in entries
+    }
+    if not latest:
+        return {}
+    with transaction.atomic():
+        # Locked, so concurrent writers of the same log take turns and versions never repeat
+        existing = {
+            (student_id, course_id, day): version
+            for student_id, course_id, day, version in DailyAttendanceLog.objects.select_for_update().filter(
+                student_id__in={key[0] for key in latest},
+                course_id__in={key[1] for key in latest},
+                date__in={key[2] for key in latest},
+            ).order_by().values_list('student_id', 'course_id', 'date', 'version')
+        }
+        versions = {key: existing.get(key, 0) + 1 for key in latest}
+        DailyAttendanceLog.objects.bulk_create(
+            [
+                DailyAttendanceLog(
+                    student_id=student_id, course_id=course_id, date=day, status=status,
+                    marked_at=marked_at, version=versions[student_id, course_id, day],
+                )
+                for (student_id, course_id, day), (status, marked_at) in latest.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['student', 'course', 'date'],
+            update_fields=['status', 'marked_at', 'version'],
+        )
+        marked, changed = [], []
+        for (student_id, course_id, day), (status, _) in latest.items():
+            payload = {'student_id': student_id, 'course_id': course_id, 'date': str(day), 'status': status}
+            (changed if (student_id, course_id, day) in existing else marked).append(payload)
+        events.emit_many(events.ATTENDANCE_MARKED, marked)
+        events.emit_many(events.ATTENDANCE_CHANGED, changed)
+        bitmaps.record((student_id, course_id, day, status) for (student_id, course_id, day), (status, _) in latest.items())
+    return versions
@@ -0,0 +1,167 @@
+"""
+The teachers' review queue for daily challenge submissions.
+
+queue() pages through the submissions of a teacher's courses pending first:
+pending ones oldest first (first come, first reviewed), then the reviewed
+ones newest first. Pages are keyset-paginated on (submitted_at, id), so a
+page deep into the queue costs the same as the first; the pending part is
+read from the partial index lms_submission_pending_idx, which only holds
+pending rows and stays small however many submissions have been reviewed.
+
+review() applies many decisions in one transaction: the submissions are
+locked, written with one bulk_update, and XP is added with one UPDATE
+carrying each student's total (User.award_xp_many). XP is paid once per
+submission: the first approval stamps xp_awarded_at, and approving it again
+(after a correction or a resubmission) finds the stamp and pays nothing. The
+quiz auto-approval and the admin follow the same rule.
+"""
+import base64
+import json
+from collections import Counter
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import events
+from .models import ChallengeSubmission, TeacherCourseAssignment
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_REVIEWS = 500
+
+PENDING, APPROVED, CORRECTION = 'pending', 'approved', 'correction'
+REVIEWED = 'reviewed'
+DECISIONS = (APPROVED, CORRECTION)
+
+
+def encode_cursor(phase, submission=None):
+    position = [submission.submitted_at.isoformat(), submission.id] if submission else None
+    return base64.urlsafe_b64encode(json.dumps([phase, position]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(phase, (submitted_at, id) or None) from a cursor; ValueError when it is not one of ours."""
+    try:
+        phase, position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if phase not in (PENDING, REVIEWED):
+            raise ValueError
+        if position is not None:
+            position = (datetime.fromisoformat(position[0]), int(position[1]))
+        return phase, position
+    except (TypeError, ValueError, IndexError, UnicodeError):
+        raise ValueError("Invalid cursor.")
+
+
+def queue(course_ids, cursor=None, limit=PAGE_SIZE, pending_only=False):
+    """
+    One page of the review queue of `course_ids`: {pending, results, next},
+    `pending` the number waiting in total and `next` the cursor of the
+    following page, None on the last one.
+    """
+    submissions = (
+        ChallengeSubmission.objects.filter(challenge__course_id__in=course_ids)
+        .select_related('challenge', 'challenge__course', 'student')
+    )
+    phase, position = decode_cursor(cursor) if cursor else (PENDING, None)
+    page, next_cursor = [], None
+
+    if phase == PENDING:
+        pending = submissions.filter(status=PENDING).order_by('submitted_at', 'id')
+        if position:
+            submitted_at, pk = position
+            pending = pending.filter(Q(submitted_at__gt=submitted_at) | Q(submitted_at=submitted_at, id__gt=pk))
+        page = list(pending[:limit + 1])
+        if len(page) > limit:
+            page, next_cursor = page[:limit], encode_cursor(PENDING, page[limit - 1])
+        phase, position = REVIEWED, None
+
+    if next_cursor is None and not pending_only:
+        reviewed = submissions.exclude(status=PENDING).order_by('-submitted_at', '-id')
+        if position:
+            submitted_at, pk = position
+            reviewed = reviewed.filter(Q(submitted_at__lt=submitted_at) | Q(submitted_at=submitted_at, id__lt=pk))
+        room = limit - len(page)
+        more = list(reviewed[:room + 1])
+        if len(more) > room:
+            more = more[:room]
+            next_cursor = encode_cursor(REVIEWED, more[-1] if more else None)
+        page += more
+
+    return {
+        'pending': ChallengeSubmission.objects.filter(status=PENDING, challenge__course_id__in=course_ids).count(),
+        'results': page,
+        'next': next_cursor,
+    }
+
+
+def parse(items):
+    """
+    {submission_id: (status, feedback)} from [{submission_id, status, feedback}]
+    items; later items for the same submission win. A missing feedback keeps
+    the current one. ValueError for a malformed item.
+    """
+    decisions = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("Each review must be an object.")
+        try:
+            submission_id = int(item['submission_id'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Each review needs a submission_id.")
+        if item.get('status') not in DECISIONS:
+            raise ValueError(f"status must be one of {', '.join(DECISIONS)}.")
+        decisions[submission_id] = (item['status'], item.get('feedback'))
+    if len(decisions) > MAX_REVIEWS:
+        raise ValueError(f"At most {MAX_REVIEWS} submissions per request.")
+    return decisions
+
+
+def review(teacher, decisions):
+    """
+    Applies {submission_id: (status, feedback)} for `teacher`, skipping
+    submissions that do not exist or belong to courses the teacher is not
+    assigned to. Returns {reviewed, approved, xp_awarded, not_found, not_authorized}.
+    """
+    User = get_user_model()
+    courses = set(TeacherCourseAssignment.objects.filter(teacher=teacher).values_list('course_id', flat=True))
+    with transaction.atomic():
+        rows = list(
+            ChallengeSubmission.objects.select_for_update(of=('self',)).filter(id__in=decisions)
+            .values_list(
+                'id', 'status', 'feedback', 'student_id', 'challenge_id', 'challenge__course_id', 'challenge__reward_xp',
+                'xp_awarded_at',
+            )
+        )
+        allowed = [row for row in rows if row[5] in courses]
+        # Approved now and never paid
+        approved = [row for row in allowed if decisions[row[0]][0] == APPROVED and row[7] is None]
+        paid_at = timezone.now()
+        ChallengeSubmission.objects.bulk_update(
+            [
+                ChallengeSubmission(
+                    id=pk, status=decisions[pk][0], feedback=feedback if decisions[pk][1] is None else decisions[pk][1],
+                    xp_awarded_at=xp_awarded_at or (paid_at if decisions[pk][0] == APPROVED else None),
+                )
+                for pk, _, feedback, _, _, _, _, xp_awarded_at in allowed
+            ],
+            ['status', 'feedback', 'xp_awarded_at'],
+            batch_size=500,
+        )
+        xp = Counter()
+        for _, _, _, student_id, _, _, reward_xp, _ in approved:
+            xp[student_id] += reward_xp
+        User.award_xp_many(xp, source='challenge-review')
+        events.emit_many(events.SUBMISSION_APPROVED, [
+            {'submission_id': pk, 'student_id': student_id, 'challenge_id': challenge_id}
+            for pk, _, _, student_id, challenge_id, _, _, _ in approved
+        ])
+    return {
+        'reviewed': len(allowed),
+        'approved': len(approved),
+        'xp_awarded': sum(xp.values()),
+        'not_found': sorted(set(decisions) - {row[0] for row in rows}),
+        'not_authorized': sorted(row[0] for row in rows if row[5] not in courses),
+    }
@@ -0,0 +1,106 @@
+"""
+Set-based enrollment, for a whole class at term start as well as a single
+student.
+
+enroll() writes a batch of enrollments with one conditional INSERT ... ON
+CONFLICT (student, course) DO NOTHING RETURNING per 500 students, so students
+already in the course are skipped by the database instead of an existence
+check per student, and the new rows' ids come back without another read.
+Their Attendance and Grade rows follow as two bulk_create(ignore_conflicts)
+statements, and one ENROLLMENT_CREATED event per enrollment goes to the
+outbox, all in one transaction. Enrollment.save() (the admin form) still
+does the same work row by row.
+
+Students are named by id, username or email, as a list or a CSV upload
+(resolve_students(), read_csv()).
+"""
+import csv
+import io
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import events
+from .models import Attendance, Enrollment, Grade
+
+BATCH_SIZE = 500
+MAX_STUDENTS = 5000
+CSV_COLUMNS = ('student_id', 'id', 'username', 'email', 'student')
+
+
+def enroll(course_id, student_ids):
+    """
+    Enrolls `student_ids` in `course_id`, skipping students already enrolled.
+    Returns {student_id: enrollment_id} for the enrollments created.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    created = {}
+    if not student_ids:
+        return created
+    quote = connection.ops.quote_name
+    enrolled_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for start in range(0, len(student_ids), BATCH_SIZE):
+                batch = student_ids[start:start + BATCH_SIZE]
+                cursor.execute(
+                    f'INSERT INTO {quote(Enrollment._meta.db_table)} (student_id, course_id, enrollment_date, manual_progress) '
+                    f'VALUES {", ".join(["(%s, %s, %s, 0)"] * len(batch))} '
+                    f'ON CONFLICT (student_id, course_id) DO NOTHING RETURNING id, student_id',
+                    [value for student_id in batch for value in (student_id, course_id, enrolled_at)],
+                )
+                created.update((student_id, pk) for pk, student_id in cursor.fetchall())
+        Attendance.objects.bulk_create(
+            [Attendance(enrollment_id=pk) for pk in created.values()], batch_size=BATCH_SIZE, ignore_conflicts=True,
+        )
+        Grade.objects.bulk_create(
+            [Grade(enrollment_id=pk) for pk in created.values()], batch_size=BATCH_SIZE, ignore_conflicts=True,
+        )
+        events.emit_many(events.ENROLLMENT_CREATED, [
+            {'enrollment_id': pk, 'student_id': student_id, 'course_id': course_id}
+            for student_id, pk in created.items()
+        ])
+    return created
+
+
+def read_csv(data):
+    """
+    Student identifiers from CSV bytes: the student_id/username/email column
+    when there is a header row, otherwise the first column.
+    """
+    rows = [row for row in csv.reader(io.StringIO(data.decode('utf-8-sig'))) if any(cell.strip() for cell in row)]
+    column = 0
+    if rows:
+        header = [cell.strip().lower() for cell in rows[0]]
+        named = [i for i, cell in enumerate(header) if cell in CSV_COLUMNS]
+        if named:
+            column, rows = named[0], rows[1:]
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+
+def resolve_students(identifiers):
+    """Maps ids, usernames and emails to user ids in one query. Returns (user ids, unknown identifiers)."""
+    keys = [str(identifier).strip() for identifier in identifiers]
+    ids = {int(key) for key in keys if key.isdigit()}
+    names = {key for key in keys if not key.isdigit()}
+    found = {}
+    users = get_user_model().objects.filter(Q(id__in=ids) | Q(username__in=names) | Q(email__in=names))
+    for pk, username, email in users.values_list('id', 'username', 'email'):
+        found[str(pk)] = found[username] = found[email] = pk
+    resolved, unknown = [], []
+    for key in keys:
+        if key in found:
+            resolved.append(found[key])
+        else:
+            unknown.append(key)
+    return resolved, unknown
+
+
+def enroll_report(course_id, identifiers):
+    """enroll() for ids, usernames or emails; returns {created, skipped, unknown}."""
+    student_ids, unknown = resolve_students(identifiers)
+    student_ids = list(dict.fromkeys(student_ids))
+    created = enroll(course_id, student_ids)
+    return {'created': len(created), 'skipped': len(student_ids) - len(created), 'unknown': unknown}
@@ -7,7 +7,8 @@ from .models import (
     CompetitionAttempt, TeacherCourseAssignment, DailyChallenge, ChallengeSubmission,
     DailyChallengeQuestion
 )
-from accounts.serializers import UserSerializer
+from accounts.serializers import RegisterSerializer, UserSerializer
+from django.contrib.auth.validators import UnicodeUsernameValidator
 
 class CourseSerializer(serializers.ModelSerializer):
     class Meta:
@@ -88,7 +89,7 @@ class UserBadgeSerializer(serializers.ModelSerializer):
 
 class CompetitionSerializer(serializers.ModelSerializer):
     reward_badge = BadgeSerializer(read_only=True)
-    participant_count = serializers.IntegerField(source='participants.count', read_only=True)
+    participant_count = serializers.SerializerMethodField()
     is_joined = serializers.SerializerMethodField()
     is_completed = serializers.SerializerMethodField()
 
@@ -97,13 +98,23 @@ class CompetitionSerializer(serializers.ModelSerializer):
         model = Competition
         fields = ('id', 'title', 'description', 'category', 'course', 'course_name', 'mode_type', 'external_link', 'time_limit', 'start_date', 'end_date', 'reward_xp', 'reward_badge', 'participant_count', 'is_joined', 'is_completed')
 
+    def get_participant_count(self, obj):
+        # CompetitionListView annotates the count; fall back to a COUNT for single objects
+        if hasattr(obj, 'participant_total'):
+            return obj.participant_total
+        return obj.participants.count()
+
     def get_is_joined(self, obj):
+        if 'joined_competition_ids' in self.context:
+            return obj.id in self.context['joined_competition_ids']
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.participants.filter(user=request.user).exists()
         return False
 
     def get_is_completed(self, obj):
+        if 'completed_competition_ids' in self.context:
+            return obj.id in self.context['completed_competition_ids']
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.competitionattempt_set.filter(user=request.user, is_completed=True).exists()
@@ -168,13 +179,18 @@ class CompetitionAttemptSerializer(serializers.ModelSerializer):
 
 class TeacherCourseAssignmentSerializer(serializers.ModelSerializer):
     course_name = serializers.CharField(source='course.course_name', read_only=True)
-    student_count = serializers.IntegerField(source='course.total_students', read_only=True)
+    student_count = serializers.SerializerMethodField()
     course_progress = serializers.IntegerField(source='course.course_progress', read_only=True)
     
     class Meta:
         model = TeacherCourseAssignment
         fields = ('id', 'course', 'course_name', 'student_count', 'course_progress')
 
+    def get_student_count(self, obj):
+        if hasattr(obj, 'student_total'):
+            return obj.student_total
+        return obj.course.total_students
+
 class TeacherStudentSerializer(serializers.ModelSerializer):
     student_details = serializers.SerializerMethodField()
     course_name = serializers.CharField(source='course.course_name', read_only=True)
@@ -273,3 +289,17 @@ class ChallengeSubmissionSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChallengeSubmission
         fields = '__all__'
+
+class StudentImportRowSerializer(RegisterSerializer):
+    """
+    One row of a student import (lms/imports.py): the registration fields with
+    an optional password. Uniqueness of email and username is checked per
+    chunk of rows by the import, not with a query per row.
+    """
+    password = serializers.CharField(write_only=True, required=False, allow_blank=True)
+
+    class Meta(RegisterSerializer.Meta):
+        extra_kwargs = {
+            'email': {'validators': []},
+            'username': {'validators': [UnicodeUsernameValidator()]},
+        }
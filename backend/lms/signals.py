@@ -1,7 +1,8 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.cache import cache
-from .models import Course
+from . import bitmaps, grades
+from .models import Course, DailyAttendanceLog, Enrollment, Grade
 
 @receiver(post_save, sender=Course)
 @receiver(post_delete, sender=Course)
@@ -13,3 +14,27 @@ def clear_course_cache(sender, instance, **kwargs):
     """
     cache.clear()
     print(f"Cache cleared due to change in Course: {instance.course_name}")
+
+
+@receiver(post_delete, sender=Grade)
+def rerank_after_delete(sender, instance, **kwargs):
+    """
+    Re-rank the course when a graded row goes, directly or with its enrollment:
+    the students below it move up. The enrollment row is still there here, since
+    Django deletes the grades of a cascade before the enrollments.
+    """
+    if instance.score is None:
+        return
+    course_id = Enrollment.objects.filter(id=instance.enrollment_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        grades.recompute_ranks([course_id])
+
+
+@receiver(post_delete, sender=DailyAttendanceLog)
+def forget_deleted_attendance(sender, instance, **kwargs):
+    """
+    Clear a deleted log's day from the student's bitmap (admin delete, a cascade),
+    so registers and term stats stop counting it. Bulk deletes that mean to keep
+    the bits (archiving) or drop the bitmaps too (dataset reset) skip signals.
+    """
+    bitmaps.forget([(instance.student_id, instance.course_id, instance.date)])
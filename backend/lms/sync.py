@@ -0,0 +1,182 @@
+"""
+Offline attendance sync for teachers.
+
+A device marks attendance while offline and later sends its queued
+operations in one request:
+
+    {"ops": [{"op_id": "<unique per device>", "course_id": 3, "student_id": 17,
+              "date": "2026-10-19", "status": "present", "ts": "2026-10-19T09:02:11Z"}, ...]}
+
+- Operations already applied (same teacher and op_id, AttendanceSyncOp)
+  get the ack they got the first time, so a retried batch is a no-op. A
+  retry racing the original loses on the unique (teacher, op_id), rolls
+  back and replays the acks the original stored.
+- Conflicts are last-writer-wins on `ts`, the time the device took the
+  mark: an operation older than the log's marked_at is acked 'stale' with
+  the server's status. Timestamps ahead of the server clock by more than
+  MAX_CLOCK_SKEW count as now, so a device with a wrong clock cannot
+  overrule every later mark.
+- Everything else is written by register.save() in one transaction: one
+  locked read, one upsert, the events and the bitmap update, however many
+  courses and dates the batch covers.
+
+Each operation gets an ack {op, result, version}; result is 'applied',
+'stale' or 'rejected' (with an error). Applied and stale acks are kept
+for OP_RETENTION so retries see the same answer; prune_ops() removes
+older ones.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import register
+from .models import AttendanceSyncOp, DailyAttendanceLog, Enrollment, TeacherCourseAssignment
+
+MAX_OPS = 2000
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+OP_RETENTION = timedelta(days=30)
+STATUSES = ('present', 'absent')
+
+APPLIED, STALE, REJECTED = 'applied', 'stale', 'rejected'
+
+
+class SyncOp:
+    __slots__ = ('op_id', 'student_id', 'course_id', 'date', 'status', 'ts')
+
+    def __init__(self, op_id, student_id, course_id, date, status, ts):
+        self.op_id = op_id
+        self.student_id = student_id
+        self.course_id = course_id
+        self.date = date
+        self.status = status
+        self.ts = ts
+
+    @property
+    def key(self):
+        return self.student_id, self.course_id, self.date
+
+
+def parse_op(raw, now):
+    """A SyncOp from one request item; ValueError with the reason when it is malformed."""
+    if not isinstance(raw, dict):
+        raise ValueError("Operation must be an object.")
+    op_id = str(raw.get('op_id') or '')
+    if not op_id or len(op_id) > 64:
+        raise ValueError("op_id is required (at most 64 characters).")
+    try:
+        student_id, course_id = int(raw['student_id']), int(raw['course_id'])
+        day = parse_date(str(raw['date']))
+        ts = parse_datetime(str(raw['ts']))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("student_id, course_id, date and ts are required.")
+    if day is None or ts is None:
+        raise ValueError("date must be YYYY-MM-DD and ts an ISO 8601 timestamp.")
+    if raw.get('status') not in STATUSES:
+        raise ValueError("status must be 'present' or 'absent'.")
+    if timezone.is_naive(ts):
+        ts = timezone.make_aware(ts, dt_timezone.utc)
+    if ts > now + MAX_CLOCK_SKEW:
+        ts = now
+    return SyncOp(op_id, student_id, course_id, day, raw['status'], ts)
+
+
+def sync(teacher, raw_ops):
+    """Applies a batch of operations for `teacher`; returns one ack per operation, in request order."""
+    now = timezone.now()
+    acks = [None] * len(raw_ops)
+    ops = {}   # index -> SyncOp
+    for index, raw in enumerate(raw_ops):
+        try:
+            ops[index] = parse_op(raw, now)
+        except ValueError as exc:
+            acks[index] = {'op': raw.get('op_id') if isinstance(raw, dict) else None, 'result': REJECTED, 'error': str(exc)}
+    try:
+        _apply(teacher, ops, acks)
+    except IntegrityError:
+        # A concurrent retry of the same op_ids committed first and this one rolled back: replay its acks
+        _apply(teacher, ops, acks)
+    return acks
+
+
+@transaction.atomic
+def _apply(teacher, ops, acks):
+    """Acks the parsed `ops` ({index: SyncOp}) into `acks`, writing the winners."""
+    done = {
+        op_id: (result, version, status)
+        for op_id, result, version, status in AttendanceSyncOp.objects.filter(
+            teacher=teacher, op_id__in={op.op_id for op in ops.values()},
+        ).values_list('op_id', 'result', 'version', 'status')
+    }
+    courses = set(
+        TeacherCourseAssignment.objects.filter(teacher=teacher, course_id__in={op.course_id for op in ops.values()})
+        .values_list('course_id', flat=True)
+    )
+    enrolled = set(
+        Enrollment.objects.filter(
+            course_id__in=courses, student_id__in={op.student_id for op in ops.values()},
+        ).values_list('student_id', 'course_id')
+    )
+
+    pending = {}   # index -> op to resolve
+    seen = set()
+    for index, op in ops.items():
+        if op.op_id in done:
+            result, version, status = done[op.op_id]
+            acks[index] = {'op': op.op_id, 'result': result, 'version': version}
+            if result == STALE:
+                acks[index]['status'] = status
+        elif op.op_id in seen:
+            acks[index] = {'op': op.op_id, 'result': REJECTED, 'error': "Duplicate op_id in this batch."}
+        elif op.course_id not in courses:
+            acks[index] = {'op': op.op_id, 'result': REJECTED, 'error': "Not assigned to this course."}
+        elif (op.student_id, op.course_id) not in enrolled:
+            acks[index] = {'op': op.op_id, 'result': REJECTED, 'error': "Student is not enrolled in this course."}
+        else:
+            pending[index] = op
+        seen.add(op.op_id)
+    if not pending:
+        return
+
+    # Last writer wins: the newest operation per log, against the log's own marked_at
+    newest = {}
+    for op in pending.values():
+        if op.key not in newest or op.ts >= newest[op.key].ts:
+            newest[op.key] = op
+    # Locked until the batch commits, so a concurrent write cannot slip in between check and upsert
+    current = {
+        (student_id, course_id, day): (status, marked_at, version)
+        for student_id, course_id, day, status, marked_at, version in DailyAttendanceLog.objects.select_for_update().filter(
+            student_id__in={key[0] for key in newest},
+            course_id__in={key[1] for key in newest},
+            date__in={key[2] for key in newest},
+        ).order_by().values_list('student_id', 'course_id', 'date', 'status', 'marked_at', 'version')
+    }
+    winners = [
+        op for key, op in newest.items()
+        if key not in current or current[key][1] is None or op.ts >= current[key][1]
+    ]
+    versions = register.save((op.student_id, op.course_id, op.date, op.status, op.ts) for op in winners)
+
+    records = []
+    for index, op in pending.items():
+        if newest[op.key] is op and op.key in versions:
+            ack = {'op': op.op_id, 'result': APPLIED, 'version': versions[op.key]}
+        elif op.key in versions:
+            # Superseded by a newer operation in the same batch
+            ack = {'op': op.op_id, 'result': STALE, 'version': versions[op.key], 'status': newest[op.key].status}
+        else:
+            status, _, version = current[op.key]
+            ack = {'op': op.op_id, 'result': STALE, 'version': version, 'status': status}
+        acks[index] = ack
+        records.append(AttendanceSyncOp(
+            teacher=teacher, op_id=op.op_id, result=ack['result'], version=ack['version'], status=ack.get('status', ''),
+        ))
+    # A concurrent retry of the same op_id fails here and rolls back; sync() then replays the stored acks
+    AttendanceSyncOp.objects.bulk_create(records, batch_size=1000)
+
+
+def prune_ops(older_than=OP_RETENTION):
+    """Forgets acks older than `older_than`; returns the number removed."""
+    return AttendanceSyncOp.objects.filter(created_at__lt=timezone.now() - older_than).delete()[0]
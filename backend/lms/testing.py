@@ -0,0 +1,290 @@
+"""
+Helpers shared by the test suites: a realistic seeded dataset and per-endpoint
+query/latency budgets.
+
+Each app's tests.py lists an `Endpoint` for every URL name in its urls.py.
+`QueryBudgetMixin` runs all of them against a small dataset, grows the
+dataset (students, enrollments, logs, attempts, submissions) and runs them
+again. A test fails when an endpoint exceeds its query budget or latency
+ceiling, or when its query count changes with the number of rows — the
+signature of an N+1 — and every call runs under the strict N+1 detector.
+Failures print the captured SQL grouped by shape.
+
+    python manage.py test accounts lms
+    DATABASE_URL=sqlite:///budget.db python manage.py test accounts lms   # without Postgres
+"""
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from monitoring.nplusone import detect_n_plus_one
+from monitoring.sql import is_savepoint, normalize
+
+from . import bitmaps, grades
+from .models import (
+    Attendance, Badge, ChallengeSubmission, CodingQuestion, Competition, CompetitionAttempt,
+    CompetitionParticipant, Course, DailyAttendanceLog, DailyChallenge, DailyChallengeQuestion,
+    Enrollment, Grade, MemoryQuestion, MemorySet, QuizQuestion, TeacherCourseAssignment, UserBadge,
+)
+
+User = get_user_model()
+
+PASSWORD = 'BudgetPass123!'
+SMALL_SCALE = 10
+LARGE_SCALE = int(os.getenv('QUERY_BUDGET_LARGE_SCALE', '1000'))
+# Multiply every latency ceiling, e.g. on slow CI machines
+LATENCY_FACTOR = float(os.getenv('QUERY_BUDGET_LATENCY_FACTOR', '1.0'))
+
+
+# =============================================================================
+# Dataset
+# =============================================================================
+
+def seed_dataset(students=SMALL_SCALE, days=5):
+    """Courses, a teacher, a staff user, competitions, challenges and `students` enrolled students."""
+    data = SimpleNamespace(days=days, student_count=0)
+    data.password_hash = make_password(PASSWORD)
+
+    data.courses = [
+        Course.objects.create(course_name=f'Course {i}', course_description='Seeded course', duration='3 Months')
+        for i in range(3)
+    ]
+    data.teacher = User.objects.create(
+        email='teacher@example.com', username='teacher', password=data.password_hash, is_teacher=True,
+    )
+    data.staff = User.objects.create(
+        email='staff@example.com', username='staff', password=data.password_hash, is_staff=True,
+    )
+    TeacherCourseAssignment.objects.bulk_create(
+        [TeacherCourseAssignment(teacher=data.teacher, course=c) for c in data.courses]
+    )
+
+    data.badges = Badge.objects.bulk_create([
+        Badge(name='Starter', description='Seeded', points_required=0),
+        Badge(name='Bronze', description='Seeded', points_required=500),
+        Badge(name='Silver', description='Seeded', points_required=1000),
+    ])
+
+    now = timezone.now()
+    data.quiz = Competition.objects.create(
+        title='Quiz', description='Seeded', mode_type='quiz', course=data.courses[0],
+        start_date=now, end_date=now + timedelta(days=7), reward_xp=100, reward_badge=data.badges[1],
+    )
+    QuizQuestion.objects.bulk_create([
+        QuizQuestion(competition=data.quiz, question_text=f'Q{i}', option_a='a', option_b='b',
+                     option_c='c', option_d='d', correct_option='A')
+        for i in range(3)
+    ])
+    data.coding = Competition.objects.create(
+        title='Coding', description='Seeded', mode_type='coding',
+        start_date=now, end_date=now + timedelta(days=7), reward_xp=50,
+    )
+    CodingQuestion.objects.bulk_create([
+        CodingQuestion(competition=data.coding, problem_text=f'P{i}', correct_answer='42') for i in range(2)
+    ])
+    data.memory = Competition.objects.create(
+        title='Memory', description='Seeded', mode_type='memory', course=data.courses[1],
+        start_date=now, end_date=now + timedelta(days=7), reward_xp=80,
+    )
+    for s in range(2):
+        memory_set = MemorySet.objects.create(competition=data.memory, words_list=['apple', 'river', 'stone'])
+        MemoryQuestion.objects.bulk_create([
+            MemoryQuestion(memory_set=memory_set, question=f'M{s}{i}', option_a='a', option_b='b',
+                           option_c='c', option_d='d', correct_option='B')
+            for i in range(2)
+        ])
+    data.competitions = [data.quiz, data.coding, data.memory]
+
+    data.missions = []
+    data.quiz_challenges = []
+    for course in data.courses:
+        data.missions.append(DailyChallenge.objects.create(
+            course=course, mission='Write a paragraph', deadline=now + timedelta(days=1), reward_xp=50,
+        ))
+        quiz_challenge = DailyChallenge.objects.create(
+            course=course, mission='Daily quiz', challenge_type='quiz', deadline=now + timedelta(days=1), reward_xp=20,
+        )
+        DailyChallengeQuestion.objects.bulk_create([
+            DailyChallengeQuestion(challenge=quiz_challenge, question_text=f'D{i}', option_a='a', option_b='b',
+                                   option_c='c', option_d='d', correct_option='C')
+            for i in range(2)
+        ])
+        data.quiz_challenges.append(quiz_challenge)
+
+    add_students(data, students)
+
+    # The student most endpoints are called as: two courses, a badge, activity everywhere
+    data.student = User.objects.get(username='student0')
+    Enrollment.objects.create(student=data.student, course=data.courses[1])
+    UserBadge.objects.create(user=data.student, badge=data.badges[0])
+    data.enrollment = Enrollment.objects.filter(student=data.student, course=data.courses[0]).first()
+    return data
+
+
+def add_students(data, count):
+    """Bulk-insert `count` more students with an enrollment, attendance history, attempts and submissions."""
+    start = data.student_count
+    users = User.objects.bulk_create([
+        User(
+            email=f'student{i}@example.com', username=f'student{i}', password=data.password_hash,
+            xp=(i * 37) % 2000, full_name=f'Student {i}',
+        )
+        for i in range(start, start + count)
+    ])
+    # bulk_create only returns primary keys on some backends
+    users = list(User.objects.filter(username__in=[u.username for u in users]).order_by('id'))
+    data.student_count += count
+
+    enrollments = Enrollment.objects.bulk_create([
+        Enrollment(student=u, course=data.courses[i % len(data.courses)]) for i, u in enumerate(users, start)
+    ])
+    enrollments = list(Enrollment.objects.filter(student__in=users).order_by('id'))
+    Attendance.objects.bulk_create([Attendance(enrollment=e) for e in enrollments])
+    Grade.objects.bulk_create([Grade(enrollment=e, grade='ABC'[e.id % 3], score=grades.score('ABC'[e.id % 3])) for e in enrollments])
+    grades.recompute_ranks({e.course_id for e in enrollments})
+
+    today = date.today()
+    DailyAttendanceLog.objects.bulk_create([
+        DailyAttendanceLog(
+            student_id=e.student_id, course_id=e.course_id, date=today - timedelta(days=d),
+            status='present' if (e.id + d) % 4 else 'absent',
+        )
+        for e in enrollments for d in range(data.days)
+    ], batch_size=500)
+    bitmaps.rebuild([u.id for u in users])
+
+    CompetitionParticipant.objects.bulk_create([
+        CompetitionParticipant(user=u, competition=data.competitions[i % 3], score=(i * 13) % 100,
+                               correct_answers=2, total_questions=3)
+        for i, u in enumerate(users, start)
+    ], batch_size=500)
+    CompetitionAttempt.objects.bulk_create([
+        CompetitionAttempt(user=u, competition=data.competitions[i % 3], score=(i * 13) % 100,
+                           correct_answers=2, total_questions=3, is_completed=True)
+        for i, u in enumerate(users, start)
+    ], batch_size=500)
+    ChallengeSubmission.objects.bulk_create([
+        ChallengeSubmission(
+            challenge=data.missions[i % len(data.courses)], student=u, text_response='Seeded answer',
+            status='approved' if i % 2 else 'pending', xp_awarded_at=timezone.now() if i % 2 else None,
+        )
+        for i, u in enumerate(users, start)
+    ], batch_size=500)
+    return users
+
+
+def make_student(data, course=None, username=None):
+    """A fresh student (optionally enrolled) for endpoints that change state."""
+    data.fresh_count = getattr(data, 'fresh_count', 0) + 1
+    username = username or f'fresh{data.fresh_count}'
+    user = User.objects.create(email=f'{username}@example.com', username=username, password=data.password_hash)
+    if course is not None:
+        Enrollment.objects.create(student=user, course=course)
+    return user
+
+
+# =============================================================================
+# Budgets
+# =============================================================================
+
+@dataclass
+class Endpoint:
+    """
+    One budgeted call. `setup(data)` returns (user, path, payload); user None means anonymous.
+    It runs outside the measured block, so it may create whatever state the call needs.
+    """
+    name: str
+    method: str
+    setup: Callable
+    max_queries: int
+    max_ms: float = 1500
+    scale_invariant: bool = True
+    label: Optional[str] = None
+
+    def __str__(self):
+        return self.label or self.name
+
+
+def describe_queries(queries, limit=15):
+    shapes = Counter(normalize(q['sql']) for q in queries)
+    lines = [f'  {count}x {shape[:300]}' for shape, count in shapes.most_common(limit)]
+    return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """Mix into a TestCase and set `url_module` and `endpoints`."""
+    url_module = None
+    endpoints = ()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+
+    def call(self, endpoint):
+        user, path, payload = endpoint.setup(self.data)
+        client = APIClient(HTTP_HOST='localhost')
+        if user is not None:
+            client.force_authenticate(user)
+        cache.clear()
+        # Without the profiler, slow-query capture and memory sampling, whose periodic reloads and writes
+        # would land in whichever call is measured
+        monitoring_off = override_settings(
+            PROFILER={'ENABLED': False}, SLOW_QUERIES={'ENABLED': False}, MEMORY={'ENABLED': False},
+        )
+        with monitoring_off, CaptureQueriesContext(connection) as ctx, \
+                detect_n_plus_one(str(endpoint), raise_errors=True):
+            start = time.perf_counter()
+            response = getattr(client, endpoint.method)(path, payload, format='json')
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        self.assertLess(
+            response.status_code, 400,
+            f'{endpoint} returned {response.status_code}: {getattr(response, "data", response.content)!r}',
+        )
+        # Savepoints come from the test transaction wrapping nested atomic() blocks, not from the endpoint
+        queries = [q for q in ctx.captured_queries if not is_savepoint(q['sql'])]
+        return queries, elapsed_ms
+
+    def test_every_url_has_a_budget(self):
+        url_names = {p.name for p in import_module(self.url_module).urlpatterns if p.name}
+        budgeted = {e.name for e in self.endpoints}
+        self.assertEqual(set(), url_names - budgeted, f'URLs in {self.url_module} without a query budget')
+        self.assertEqual(set(), budgeted - url_names, 'Budgets for URL names that no longer exist')
+
+    def test_query_budgets_hold_as_rows_grow(self):
+        small = {str(e): self.call(e) for e in self.endpoints}
+        add_students(self.data, LARGE_SCALE - SMALL_SCALE)
+        large = {str(e): self.call(e) for e in self.endpoints}
+
+        for endpoint in self.endpoints:
+            key = str(endpoint)
+            small_queries, _ = small[key]
+            large_queries, elapsed_ms = large[key]
+            with self.subTest(endpoint=key):
+                self.assertLessEqual(
+                    len(large_queries), endpoint.max_queries,
+                    f'{key} issued {len(large_queries)} queries (budget {endpoint.max_queries}):\n'
+                    f'{describe_queries(large_queries)}',
+                )
+                if endpoint.scale_invariant:
+                    self.assertEqual(
+                        len(small_queries), len(large_queries),
+                        f'{key} issued {len(small_queries)} queries with {SMALL_SCALE} students but '
+                        f'{len(large_queries)} with {LARGE_SCALE} (likely N+1):\n{describe_queries(large_queries)}',
+                    )
+                self.assertLessEqual(
+                    elapsed_ms, endpoint.max_ms * LATENCY_FACTOR,
+                    f'{key} took {elapsed_ms:.0f} ms (ceiling {endpoint.max_ms * LATENCY_FACTOR:.0f} ms)',
+                )
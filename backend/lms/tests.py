@@ -0,0 +1,863 @@
+import csv
+import io
+from datetime import date, timedelta
+from importlib import import_module
+from itertools import count
+from types import SimpleNamespace
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from lms_backend import routers
+
+from . import bitmaps, events, grades, imports, jobs, partitions, register, reviews, roster, sync
+from .models import (
+    AttendanceArchive, AttendanceBitmap, ChallengeSubmission, CompetitionAttempt, Course, DailyAttendanceLog, DailyChallenge,
+    DailyChallengeQuestion, DomainEvent, Enrollment, EventConsumerOffset, Grade, Job, StudentImport, TeacherCourseAssignment,
+)
+from .testing import Endpoint, QueryBudgetMixin, make_student
+
+User = get_user_model()
+
+
+def as_student(name, **kwargs):
+    return lambda d: (d.student, reverse(name, kwargs=kwargs), None)
+
+
+def as_teacher(name, query=''):
+    return lambda d: (d.teacher, reverse(name) + query, None)
+
+
+def as_staff(name, query=''):
+    return lambda d: (d.staff, reverse(name) + query, None)
+
+
+def enroll(d):
+    return make_student(d), reverse('enroll'), {'course_id': d.courses[2].id}
+
+
+def bulk_enroll(d):
+    students = [make_student(d).username for _ in range(3)]
+    return d.staff, reverse('bulk-enroll'), {'course_id': d.courses[2].id, 'students': students + [d.student.email]}
+
+
+_imported = count()
+
+
+def import_rows(n):
+    rows = []
+    for _ in range(n):
+        i = next(_imported)
+        rows.append({'email': f'imported{i}@example.com', 'username': f'imported{i}', 'password': 'pass12345', 'full_name': f'Imported {i}'})
+    return rows
+
+
+def student_import(d):
+    students = import_rows(3) + [{'email': d.student.email, 'username': 'taken'}, {'email': 'not-an-email', 'username': 'x'}]
+    return d.staff, reverse('student-import'), {'course_id': d.courses[2].id, 'students': students}
+
+
+def finished_import(d):
+    """An import already run by the job: 5 students, one already registered, all enrolled in a course."""
+    source, total = imports.rows_to_csv(import_rows(4) + [{'email': d.student.email, 'username': 'taken'}])
+    record = StudentImport.objects.create(created_by=d.staff, course=d.courses[2], source=source, total_rows=total)
+    imports.run(record.id)
+    return record
+
+
+def student_import_detail(d):
+    return d.staff, reverse('student-import-detail', kwargs={'import_id': finished_import(d).id}), None
+
+
+def student_import_report(d):
+    return d.staff, reverse('student-import-report', kwargs={'import_id': finished_import(d).id}), None
+
+
+def join_competition(d):
+    return make_student(d), reverse('join-competition', kwargs={'competition_id': d.quiz.id}), None
+
+
+def start_competition(d):
+    return make_student(d), reverse('competition-start', kwargs={'competition_id': d.memory.id}), None
+
+
+def submit_competition(d):
+    student = make_student(d, course=d.courses[1])
+    CompetitionAttempt.objects.create(user=student, competition=d.memory)
+    answers = {str(q.id): 'B' for ms in d.memory.memory_sets.all() for q in ms.questions.all()}
+    return student, reverse('competition-submit', kwargs={'competition_id': d.memory.id}), {'answers': answers}
+
+
+def mark_attendance(d):
+    return d.staff, reverse('mark-attendance'), {
+        'student_id': d.student.id, 'course_id': d.courses[0].id, 'date': str(date.today()), 'status': 'absent',
+    }
+
+
+def teacher_mark_attendance(d):
+    students = Enrollment.objects.filter(course=d.courses[0]).order_by('id').values_list('student_id', flat=True)[:3]
+    return d.teacher, reverse('teacher-mark-attendance'), {
+        'course_id': d.courses[0].id,
+        'date': str(date.today()),
+        'attendance': [{'student_id': sid, 'status': 'present'} for sid in students],
+    }
+
+
+def edit_register(d):
+    students = Enrollment.objects.filter(course=d.courses[0]).order_by('id').values_list('student_id', flat=True)[:3]
+    return d.teacher, reverse('teacher-attendance-register'), {
+        'course_id': d.courses[0].id,
+        'from': str(date.today() - timedelta(days=2)),
+        'students': [{'student_id': sid, 'days': 'PA-'} for sid in students],
+    }
+
+
+def enter_grades(d):
+    students = Enrollment.objects.filter(course=d.courses[0]).order_by('id').values_list('student_id', flat=True)[:5]
+    return d.teacher, reverse('teacher-grades'), {
+        'course_id': d.courses[0].id,
+        'grades': [{'student_id': sid, 'grade': grade} for sid, grade in zip(students, ['A+', 'b', 'O', '', 'c+'])],
+    }
+
+
+def sync_attendance(d):
+    students = Enrollment.objects.filter(course=d.courses[0]).order_by('id').values_list('student_id', flat=True)[:3]
+    d.sync_count = getattr(d, 'sync_count', 0) + 1
+    return d.teacher, reverse('teacher-attendance-sync'), {'ops': [
+        {
+            'op_id': f'op-{d.sync_count}-{sid}-{back}', 'course_id': d.courses[0].id, 'student_id': sid,
+            'date': str(date.today() - timedelta(days=back)), 'status': 'absent', 'ts': timezone.now().isoformat(),
+        }
+        for sid in students for back in range(2)
+    ]}
+
+
+def update_progress(d):
+    return d.teacher, reverse('teacher-update-progress'), {'enrollment_id': d.enrollment.id, 'progress': 40}
+
+
+def update_course_progress(d):
+    return d.teacher, reverse('teacher-update-course-progress'), {'course_id': d.courses[2].id, 'progress': 55}
+
+
+def student_performance(d):
+    return d.teacher, reverse('teacher-student-performance', kwargs={'enrollment_id': d.enrollment.id}), None
+
+
+def submit_daily_quiz(d):
+    challenge = d.quiz_challenges[0]
+    responses = {str(q.id): 'C' for q in challenge.quiz_questions.all()}
+    return make_student(d, course=d.courses[0]), reverse('daily-challenge-submit'), {
+        'challenge_id': challenge.id, 'responses': responses,
+    }
+
+
+def challenge_feedback(d):
+    submission = ChallengeSubmission.objects.create(
+        challenge=d.missions[0], student=make_student(d, course=d.courses[0]), text_response='Fresh answer',
+    )
+    return d.teacher, reverse('teacher-challenge-feedback'), {
+        'submission_id': submission.id, 'status': 'approved', 'feedback': 'Well done',
+    }
+
+
+def bulk_review(d):
+    submissions = [
+        ChallengeSubmission.objects.create(
+            challenge=d.missions[0], student=make_student(d, course=d.courses[0]), text_response='Fresh answer', status=st,
+        )
+        for st in ('pending', 'pending', 'pending', 'approved')
+    ]
+    return d.teacher, reverse('teacher-challenge-review'), {'reviews': [
+        {'submission_id': s.id, 'status': 'correction' if i == 2 else 'approved', 'feedback': 'Checked'}
+        for i, s in enumerate(submissions)
+    ]}
+
+
+def create_challenge(d):
+    return d.teacher, reverse('teacher-challenge-create'), {
+        'course': d.courses[0].id,
+        'mission': 'Budgeted quiz',
+        'challenge_type': 'quiz',
+        'deadline': '2030-01-01T00:00:00Z',
+        'quiz_questions': [
+            {'question_text': f'N{i}', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd', 'correct_option': 'A'}
+            for i in range(2)
+        ],
+    }
+
+
+LMS_ENDPOINTS = [
+    Endpoint('course-list', 'get', lambda d: (None, reverse('course-list'), None), max_queries=1),
+    Endpoint('enroll', 'post', enroll, max_queries=5),
+    Endpoint('bulk-enroll', 'post', bulk_enroll, max_queries=6),
+    Endpoint('student-import', 'post', student_import, max_queries=3),  # course check, import row, job
+    Endpoint('student-import-detail', 'get', student_import_detail, max_queries=1),
+    Endpoint('student-import-report', 'get', student_import_report, max_queries=1),
+    Endpoint('dashboard', 'get', as_student('dashboard'), max_queries=5),
+    Endpoint('dashboard', 'get', lambda d: (d.staff, reverse('dashboard'), None), max_queries=5, label='dashboard [staff]', max_ms=4000),
+    Endpoint('all-students', 'get', as_staff('all-students'), max_queries=2, max_ms=3000),
+    Endpoint('all-students', 'get', as_staff('all-students', '?q=student1'), max_queries=2, max_ms=1000, label='all-students [q]'),
+    Endpoint('export-attendance', 'get', lambda d: (d.student, reverse('export-attendance', kwargs={'enrollment_id': d.enrollment.id}), None), max_queries=4),
+    Endpoint('export-my-attendance', 'get', as_student('export-my-attendance'), max_queries=2),  # live + archived months
+    Endpoint('attendance-logs', 'get', as_student('attendance-logs'), max_queries=1),
+    Endpoint('student-attendance-logs', 'get', lambda d: (d.staff, reverse('student-attendance-logs', kwargs={'student_id': d.student.id}), None), max_queries=2),
+    Endpoint('attendance-calendar', 'get', as_student('attendance-calendar'), max_queries=1),
+    Endpoint('student-attendance-calendar', 'get', lambda d: (d.staff, reverse('student-attendance-calendar', kwargs={'student_id': d.student.id}), None), max_queries=1),
+    Endpoint('mark-attendance', 'post', mark_attendance, max_queries=6),  # + bitmap lock and update
+    Endpoint('all-attendance-logs', 'get', as_staff('all-attendance-logs', '?date=' + str(date.today())), max_queries=1, max_ms=3000),
+    Endpoint('competition-list', 'get', as_student('competition-list'), max_queries=3),
+    Endpoint('join-competition', 'post', join_competition, max_queries=3),
+    Endpoint('competition-leaderboard', 'get', lambda d: (d.student, reverse('competition-leaderboard', kwargs={'competition_id': d.quiz.id}), None), max_queries=1),
+    Endpoint('competition-questions', 'get', lambda d: (d.student, reverse('competition-questions', kwargs={'competition_id': d.memory.id}), None), max_queries=4),
+    Endpoint('competition-start', 'post', start_competition, max_queries=3),
+    Endpoint('competition-submit', 'post', submit_competition, max_queries=12),
+    Endpoint('gamification-data', 'get', as_student('gamification-data'), max_queries=2),
+    Endpoint('teacher-dashboard', 'get', as_teacher('teacher-dashboard'), max_queries=2),
+    Endpoint('teacher-students', 'get', as_teacher('teacher-students'), max_queries=3, max_ms=5000),
+    Endpoint('teacher-students', 'get', lambda d: (d.teacher, reverse('teacher-students') + f'?course_id={d.courses[0].id}&date={date.today()}', None), max_queries=5, max_ms=3000, label='teacher-students [course+date]'),
+    Endpoint('teacher-students', 'get', as_teacher('teacher-students', '?q=stu'), max_queries=3, max_ms=1000, label='teacher-students [q]'),
+    Endpoint('teacher-mark-attendance', 'post', teacher_mark_attendance, max_queries=7),  # + bitmap lock and update
+    Endpoint('teacher-attendance-register', 'get', lambda d: (d.teacher, reverse('teacher-attendance-register') + f'?course_id={d.courses[0].id}', None), max_queries=3, max_ms=1000),
+    Endpoint('teacher-attendance-register', 'post', edit_register, max_queries=8, label='teacher-attendance-register [save]'),
+    Endpoint('teacher-attendance-sync', 'post', sync_attendance, max_queries=12),
+    Endpoint('teacher-grades', 'get', lambda d: (d.teacher, reverse('teacher-grades') + f'?course_id={d.courses[0].id}', None), max_queries=2, max_ms=1000),
+    Endpoint('teacher-grades', 'post', enter_grades, max_queries=5, label='teacher-grades [save]'),  # locked read, update, re-rank
+    Endpoint('teacher-attendance-cohort', 'get', lambda d: (d.teacher, reverse('teacher-attendance-cohort') + f'?course_id={d.courses[0].id}', None), max_queries=2, max_ms=1000),
+    Endpoint('teacher-update-progress', 'post', update_progress, max_queries=4),
+    Endpoint('teacher-update-course-progress', 'post', update_course_progress, max_queries=4),
+    Endpoint('teacher-student-performance', 'get', student_performance, max_queries=4),
+    Endpoint('teacher-competition-attempts', 'get', as_teacher('teacher-competition-attempts'), max_queries=1, max_ms=3000),
+    Endpoint('daily-challenge-list', 'get', as_student('daily-challenge-list'), max_queries=3),
+    Endpoint('daily-challenge-submit', 'post', submit_daily_quiz, max_queries=8),
+    Endpoint('teacher-challenge-submissions', 'get', as_teacher('teacher-challenge-submissions'), max_queries=1, max_ms=3000),
+    Endpoint('teacher-challenge-submissions', 'get', as_teacher('teacher-challenge-submissions', '?q=student1 seeded'), max_queries=1, max_ms=1000, label='teacher-challenge-submissions [q]'),
+    Endpoint('teacher-challenge-feedback', 'post', challenge_feedback, max_queries=6),
+    # Reviewed submissions are only read when the pending ones do not fill the page, which depends on the row count
+    Endpoint('teacher-challenge-review-queue', 'get', as_teacher('teacher-challenge-review-queue'), max_queries=4, max_ms=3000, scale_invariant=False),
+    Endpoint('teacher-challenge-review-queue', 'get', as_teacher('teacher-challenge-review-queue', '?status=pending&limit=20'), max_queries=3, label='teacher-challenge-review-queue [pending]'),
+    Endpoint('teacher-challenge-review', 'post', bulk_review, max_queries=6),  # courses, locked read, update, XP, 2 event inserts
+    Endpoint('teacher-challenge-create', 'post', create_challenge, max_queries=6),
+    Endpoint('teacher-challenge-assigned-list', 'get', as_teacher('teacher-challenge-assigned-list'), max_queries=2),
+    Endpoint('course-leaderboard', 'get', lambda d: (d.student, reverse('course-leaderboard') + f'?course_id={d.courses[0].id}', None), max_queries=5),
+    Endpoint('course-leaderboard', 'get', as_teacher('course-leaderboard', '?course_id=all'), max_queries=2, label='course-leaderboard [all]', max_ms=3000),
+]
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LmsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    url_module = 'lms.urls'
+    endpoints = LMS_ENDPOINTS
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.handled = []
+        events._handlers['test_event'].append(lambda batch: self.handled.extend(e.payload['n'] for e in batch))
+        self.addCleanup(events._handlers.pop, 'test_event')
+
+    def emit(self, *numbers):
+        return [events.emit('test_event', n=n) for n in numbers]
+
+    def test_processes_in_order_and_advances_the_offset(self):
+        self.emit(1, 2, 3)
+        self.assertEqual(events.process_batch(batch_size=2), 2)
+        self.assertEqual(events.process_batch(batch_size=2), 1)
+        self.assertEqual(events.process_batch(), 0)
+        self.assertEqual(self.handled, [1, 2, 3])
+        self.assertEqual(events.consumer_lag()['lag_events'], 0)
+
+    def test_replay_from_reprocesses(self):
+        first, second = self.emit(1, 2)
+        events.process_batch()
+        events.replay_from(second.id)
+        self.assertEqual(events.process_batch(), 1)
+        self.assertEqual(self.handled, [1, 2, 2])
+
+    def test_consumers_keep_their_own_offsets(self):
+        self.emit(1)
+        events.process_batch(consumer='a')
+        self.assertEqual(events.consumer_lag('b')['lag_events'], 1)
+        self.assertEqual(events.process_batch(consumer='b'), 1)
+
+    def test_an_event_committed_late_is_handled_from_the_gap(self):
+        # The middle event stands for one whose transaction has not committed yet
+        first, missing, last = self.emit(1, 2, 3)
+        missing_id = missing.id
+        missing.delete()
+        self.assertEqual(events.process_batch(), 2)
+        self.assertEqual(events.process_batch(), 0)
+        self.assertEqual(self.handled, [1, 3])
+        self.assertEqual(events.consumer_lag()['gaps'], 1)
+
+        DomainEvent.objects.create(id=missing_id, event_type='test_event', payload={'n': 2})
+        self.assertEqual(events.process_batch(), 1)
+        self.assertEqual(self.handled, [1, 3, 2])
+        self.assertEqual(events.consumer_lag()['gaps'], 0)
+
+    def test_admin_lag_columns_cost_no_query_per_row(self):
+        self.emit(1, 2)
+        self.client.force_login(User.objects.create(email='ops@example.com', username='ops', is_staff=True, is_superuser=True))
+        url = reverse('admin:lms_eventconsumeroffset_changelist')
+        self.client.get(url)  # warms the per-process caches (content types, permissions)
+        queries = []
+        for consumer in ('a', 'b', 'c'):
+            events.process_batch(consumer=consumer, batch_size=1)
+            with CaptureQueriesContext(connection) as captured:
+                self.assertContains(self.client.get(url), 'Lag (events)')
+            queries.append(len(captured))
+        self.assertEqual(len(set(queries)), 1)
+
+    def test_gaps_are_forgotten_after_the_retention(self):
+        first, missing, last = self.emit(1, 2, 3)
+        missing.delete()
+        events.process_batch()
+        self.assertEqual(events.process_batch(gap_retention=timedelta(0)), 0)
+        self.assertEqual(EventConsumerOffset.objects.get().gaps, {})
+
+    def test_handlers_run_after_commit_while_the_cache_is_not_shared(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.emit(1)
+            self.assertEqual(self.handled, [])
+        self.assertEqual(self.handled, [1])
+        with self.settings(EVENTS={'INLINE_HANDLERS': False}), self.captureOnCommitCallbacks() as callbacks:
+            self.emit(2)
+        self.assertEqual(callbacks, [])
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        def flaky(fail=0):
+            self.calls.append(fail)
+            if len(self.calls) <= fail:
+                raise RuntimeError("boom")
+
+        jobs._registry['test.flaky'] = flaky
+        self.addCleanup(jobs._registry.pop, 'test.flaky')
+
+    def test_claims_by_priority_then_run_at(self):
+        low = jobs.enqueue('test.flaky')
+        high = jobs.enqueue('test.flaky', priority=5)
+        jobs.enqueue('test.flaky', priority=9, run_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(jobs.claim('w').id, high.id)
+        self.assertEqual(jobs.claim('w').id, low.id)
+        self.assertIsNone(jobs.claim('w'))
+
+    def test_retries_with_backoff_then_fails(self):
+        job_row = jobs.enqueue('test.flaky', max_attempts=2, fail=5)
+        self.assertFalse(jobs.run(jobs.claim('w')))
+        job_row.refresh_from_db()
+        self.assertEqual((job_row.status, job_row.attempts), ('queued', 1))
+        self.assertGreater(job_row.run_at, timezone.now() + jobs.backoff(1) - timedelta(seconds=5))
+        self.assertIsNone(jobs.claim('w'))
+
+        Job.objects.filter(pk=job_row.pk).update(run_at=timezone.now())
+        self.assertFalse(jobs.run(jobs.claim('w')))
+        job_row.refresh_from_db()
+        self.assertEqual((job_row.status, job_row.attempts), ('failed', 2))
+        self.assertIn('RuntimeError', job_row.last_error)
+
+    def test_succeeds_on_retry(self):
+        job_row = jobs.enqueue('test.flaky', fail=1)
+        jobs.run(jobs.claim('w'))
+        Job.objects.filter(pk=job_row.pk).update(run_at=timezone.now())
+        self.assertTrue(jobs.run(jobs.claim('w')))
+        job_row.refresh_from_db()
+        self.assertEqual(job_row.status, 'succeeded')
+
+    def test_backoff_is_exponential_and_capped(self):
+        self.assertEqual(jobs.backoff(1), timedelta(seconds=jobs.BACKOFF_BASE_SECONDS))
+        self.assertEqual(jobs.backoff(3), timedelta(seconds=jobs.BACKOFF_BASE_SECONDS * 4))
+        self.assertEqual(jobs.backoff(50), timedelta(seconds=jobs.BACKOFF_MAX_SECONDS))
+
+    def test_requeue_stale_counts_the_abandoned_attempt(self):
+        retry = jobs.enqueue('test.flaky', max_attempts=2)
+        exhausted = jobs.enqueue('test.flaky', max_attempts=1)
+        fresh = jobs.enqueue('test.flaky')
+        for job_row in (retry, exhausted, fresh):
+            jobs.claim('dead-worker')
+        Job.objects.filter(pk__in=[retry.pk, exhausted.pk]).update(heartbeat_at=timezone.now() - jobs.STALE_AFTER - timedelta(minutes=1))
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {retry.pk: 'queued', exhausted.pk: 'failed', fresh.pk: 'running'})
+
+    def test_a_heartbeat_keeps_a_long_run_from_being_requeued(self):
+        job_row = jobs.enqueue('test.flaky')
+        claimed = jobs.claim('w')
+        Job.objects.filter(pk=job_row.pk).update(started_at=timezone.now() - timedelta(hours=3))
+        self.assertEqual(jobs.heartbeat([job_row.pk]), 1)
+        self.assertEqual(jobs.requeue_stale(), 0)
+
+        # Presumed dead and claimed again: the first run's outcome no longer lands
+        Job.objects.filter(pk=job_row.pk).update(heartbeat_at=timezone.now() - jobs.STALE_AFTER - timedelta(minutes=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        retry = jobs.claim('w2')
+        jobs.run(claimed)
+        job_row.refresh_from_db()
+        self.assertEqual((job_row.status, job_row.worker, job_row.attempts), ('running', 'w2', 2))
+        jobs.run(retry)
+        job_row.refresh_from_db()
+        self.assertEqual(job_row.status, 'succeeded')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """The router outside a test transaction, which would otherwise send every read to the primary."""
+
+    def setUp(self):
+        cache.clear()
+        self.router = routers.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def serve(self, method, cookies=None, headers=None, write=False):
+        """One request through the middleware as user 5; returns (alias the view read from, response)."""
+        request = getattr(self.factory, method)('/api/lms/dashboard/', headers=headers)
+        request.user = SimpleNamespace(is_authenticated=True, pk=5)
+        request.COOKIES.update(cookies or {})
+        seen = {}
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Course)
+            seen['read'] = self.router.db_for_read(Course)
+            return HttpResponse()
+
+        response = routers.ReplicaRoutingMiddleware(view)(request)
+        return seen['read'], response
+
+    def test_safe_reads_go_to_a_replica(self):
+        self.assertEqual(self.serve('get')[0], 'replica1')
+        self.assertEqual(self.serve('post')[0], 'default')
+
+    def test_the_pin_survives_into_the_next_request_on_another_worker(self):
+        _, response = self.serve('post', write=True)
+        cookie = response.cookies[routers.PIN_COOKIE].value
+        cache.clear()  # another worker: its cache never saw the write
+        self.assertEqual(self.serve('get', cookies={routers.PIN_COOKIE: cookie})[0], 'default')
+
+    def test_the_pin_header_is_echoed_by_clients_without_cookies(self):
+        _, response = self.serve('post', write=True)
+        pin = response[routers.PIN_HEADER]
+        cache.clear()
+        self.assertEqual(self.serve('get', headers={routers.PIN_HEADER: pin})[0], 'default')
+        with override_settings(REPLICA_PIN_SECONDS=-1):
+            self.assertEqual(self.serve('get', headers={routers.PIN_HEADER: pin})[0], 'replica1')
+
+    def test_the_pin_expires_and_cannot_be_forged(self):
+        _, response = self.serve('post', write=True)
+        cookie = response.cookies[routers.PIN_COOKIE].value
+        cache.clear()
+        with override_settings(REPLICA_PIN_SECONDS=-1):
+            self.assertEqual(self.serve('get', cookies={routers.PIN_COOKIE: cookie})[0], 'replica1')
+        forged = cookie.replace(cookie.split(':')[0], '6', 1)
+        self.assertEqual(self.serve('get', cookies={routers.PIN_COOKIE: forged})[0], 'replica1')
+
+
+class PartitionArchiveTests(TestCase):
+    TODAY = date(2026, 5, 20)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(course_name='Archived', course_description='-', duration='1 Month')
+        cls.student = User.objects.create(email='arch@example.com', username='arch')
+
+    def log(self, day, status='present'):
+        DailyAttendanceLog.objects.create(student=self.student, course=self.course, date=day, status=status)
+
+    def test_folds_a_month_into_day_strings(self):
+        self.log(date(2026, 3, 2))
+        self.log(date(2026, 3, 4), 'absent')
+        self.log(date(2026, 4, 1))
+        self.assertEqual(partitions.archive_month(date(2026, 3, 1), today=self.TODAY), (1, 2))
+        self.assertEqual(AttendanceArchive.objects.get().days, '-P-A')
+        self.assertEqual(list(DailyAttendanceLog.objects.values_list('date', flat=True)), [date(2026, 4, 1)])
+
+    def test_late_logs_merge_into_the_archive(self):
+        self.log(date(2026, 3, 2))
+        partitions.archive_month(date(2026, 3, 1), today=self.TODAY)
+        self.log(date(2026, 3, 3), 'absent')
+        partitions.archive_month(date(2026, 3, 1), today=self.TODAY)
+        self.assertEqual(AttendanceArchive.objects.get().days, '-PA')
+
+    def test_months_inside_the_write_window_are_refused(self):
+        self.log(date(2026, 4, 30))
+        with self.assertRaises(ValueError):
+            partitions.archive_month(date(2026, 4, 1), today=self.TODAY)
+        # One month old by ARCHIVE_AFTER_MONTHS, but January ended only 30 days before March 3
+        self.log(date(2026, 1, 31))
+        messages = []
+        partitions.maintain(today=date(2026, 3, 3), archive_after_months=1, log=messages.append)
+        self.assertIn("Not archiving 2026-01 yet: it is still inside the write window.", messages)
+        self.assertEqual(DailyAttendanceLog.objects.count(), 2)
+
+    def test_history_reads_live_and_archived_logs(self):
+        self.log(date(2026, 3, 2))
+        self.log(date(2026, 5, 1), 'absent')
+        partitions.archive_month(date(2026, 3, 1), today=self.TODAY)
+        self.assertEqual(partitions.attendance_history(self.student.id), [
+            (date(2026, 3, 2), self.course.id, 'present'),
+            (date(2026, 5, 1), self.course.id, 'absent'),
+        ])
+
+
+class BitmapTests(TestCase):
+    TERM = date(2026, 6, 1)
+
+    def bits(self, days):
+        return sum(1 << day for day in days)
+
+    def test_streaks_skip_days_without_class(self):
+        # Days 0-6 but no class on day 5, absent on day 1
+        held = self.bits([0, 1, 2, 3, 4, 6])
+        self.assertEqual(bitmaps.streaks(held & ~self.bits([1]), held), (4, 4))
+        # Absent on the last class: no current streak, the longest run before it stays
+        self.assertEqual(bitmaps.streaks(self.bits([0, 1]), self.bits([0, 1, 2])), (0, 2))
+        self.assertEqual(bitmaps.streaks(0, 0), (0, 0))
+
+    def test_encode_runs(self):
+        held = self.bits([*range(5), *range(7, 12)])
+        present = self.bits([*range(5), *range(7, 11)])
+        self.assertEqual(bitmaps.encode(present, held), 'P5-2P4A')
+        self.assertEqual(bitmaps.encode(0, 0), '')
+        self.assertEqual(bitmaps.percentage(present, held), 90.0)
+
+    def test_day_counts(self):
+        bitsets = [self.bits([0, 2]), self.bits([1, 2]), self.bits([2]), self.bits([2, 9])]
+        counts = bitmaps.day_counts(bitsets)
+        self.assertEqual(counts, [sum(b >> day & 1 for b in bitsets) for day in range(10)])
+        self.assertEqual(counts[:3], [1, 1, 4])
+        self.assertEqual(bitmaps.day_counts([]), [])
+
+    def test_record_follows_the_logs(self):
+        course = Course.objects.create(course_name='Bits', course_description='-', duration='1 Month')
+        student = User.objects.create(email='bits@example.com', username='bits')
+        bitmaps.record([(student.id, course.id, date(2026, 6, 1), 'present'), (student.id, course.id, date(2026, 6, 3), 'absent')])
+        bitmaps.record([(student.id, course.id, '2026-06-03', 'present')])
+        row = AttendanceBitmap.objects.get()
+        self.assertEqual((row.term, row.bits()), (self.TERM, (0b101, 0b101)))
+        DailyAttendanceLog.objects.create(student=student, course=course, date=date(2026, 6, 2), status='absent')
+        self.assertEqual(bitmaps.rebuild(), 1)
+        self.assertEqual(AttendanceBitmap.objects.get().bits(), (0, 0b10))
+
+
+class RegisterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(course_name='Register', course_description='-', duration='1 Month')
+        cls.ann = User.objects.create(email='ann@example.com', username='ann')
+        cls.bob = User.objects.create(email='bob@example.com', username='bob')
+        for student in (cls.bob, cls.ann):
+            Enrollment.objects.create(student=student, course=cls.course)
+
+    def mark(self, student, day, status):
+        return (student.id, self.course.id, day, status, timezone.now())
+
+    def test_save_bumps_versions_and_emits_events(self):
+        day = date(2026, 6, 2)
+        versions = register.save([self.mark(self.ann, day, 'absent'), self.mark(self.ann, day, 'present')])
+        self.assertEqual(versions, {(self.ann.id, self.course.id, day): 1})
+        self.assertEqual(register.save([self.mark(self.ann, day, 'absent')]), {(self.ann.id, self.course.id, day): 2})
+        log = DailyAttendanceLog.objects.get()
+        self.assertEqual((log.status, log.version), ('absent', 2))
+        self.assertEqual(
+            list(DomainEvent.objects.filter(event_type__startswith='attendance').order_by('id').values_list('event_type', flat=True)),
+            [events.ATTENDANCE_MARKED, events.ATTENDANCE_CHANGED],
+        )
+        self.assertEqual(register.save([]), {})
+
+    def test_grid_spans_terms(self):
+        # Term boundary on June 1
+        register.save([
+            self.mark(self.ann, date(2026, 5, 31), 'present'),
+            self.mark(self.ann, date(2026, 6, 2), 'absent'),
+            self.mark(self.bob, date(2026, 6, 2), 'present'),
+        ])
+        grid = register.grid(self.course.id, date(2026, 5, 30), date(2026, 6, 3))
+        self.assertEqual(
+            [(s['username'], s['days'], s['present'], s['absent']) for s in grid['students']],
+            [('ann', '-P-A-', 1, 1), ('bob', '---P-', 1, 0)],
+        )
+        self.assertEqual(grid['present_per_day'], [0, 1, 0, 1, 0])
+        self.assertEqual(grid['absent_per_day'], [0, 0, 0, 1, 0])
+
+    def test_deleting_a_log_clears_its_day(self):
+        day = date(2026, 6, 2)
+        register.save([self.mark(self.ann, day, 'present'), self.mark(self.ann, day + timedelta(days=1), 'absent')])
+        DailyAttendanceLog.objects.get(student=self.ann, date=day).delete()
+        grid = register.grid(self.course.id, day, day + timedelta(days=1))
+        self.assertEqual([(s['username'], s['days']) for s in grid['students']], [('ann', '-A'), ('bob', '--')])
+
+    def test_cohort_rejects_a_non_integer_course_id(self):
+        teacher = User.objects.create(email='tea@example.com', username='tea', is_teacher=True)
+        token = AccessToken.for_user(teacher)
+        response = self.client.get(reverse('teacher-attendance-cohort') + '?course_id=abc', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual((response.status_code, response.json()), (400, {"detail": "course_id must be an integer."}))
+
+    def test_parse_leaves_blank_days_alone(self):
+        rows = [{'student_id': str(self.ann.id), 'days': 'P-A'}]
+        self.assertEqual(register.parse(date(2026, 6, 1), rows), [
+            (self.ann.id, date(2026, 6, 1), 'present'),
+            (self.ann.id, date(2026, 6, 3), 'absent'),
+        ])
+
+
+class SyncTests(TestCase):
+    T = timezone.now().replace(microsecond=0)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(course_name='Offline', course_description='-', duration='1 Month')
+        cls.teacher = User.objects.create(email='sync-teacher@example.com', username='sync-teacher', is_teacher=True)
+        cls.student = User.objects.create(email='sync-student@example.com', username='sync-student')
+        TeacherCourseAssignment.objects.create(teacher=cls.teacher, course=cls.course)
+        Enrollment.objects.create(student=cls.student, course=cls.course)
+
+    def op(self, op_id, status, minutes_ago, day='2026-06-02'):
+        return {
+            'op_id': op_id, 'student_id': self.student.id, 'course_id': self.course.id, 'date': day,
+            'status': status, 'ts': (self.T - timedelta(minutes=minutes_ago)).isoformat(),
+        }
+
+    def test_last_writer_wins(self):
+        acks = sync.sync(self.teacher, [self.op('a', 'absent', 5), self.op('b', 'present', 10)])
+        self.assertEqual(acks, [
+            {'op': 'a', 'result': 'applied', 'version': 1},
+            {'op': 'b', 'result': 'stale', 'version': 1, 'status': 'absent'},
+        ])
+        # Marked earlier than the stored log: stale; later: applied
+        self.assertEqual(sync.sync(self.teacher, [self.op('c', 'present', 7)]), [
+            {'op': 'c', 'result': 'stale', 'version': 1, 'status': 'absent'},
+        ])
+        self.assertEqual(sync.sync(self.teacher, [self.op('d', 'present', 1)])[0]['result'], 'applied')
+        log = DailyAttendanceLog.objects.get()
+        self.assertEqual((log.status, log.version), ('present', 2))
+
+    def test_retries_replay_the_first_acks(self):
+        batch = [self.op('a', 'absent', 5), self.op('b', 'present', 10), {'op_id': 'x'}, self.op('a', 'present', 1)]
+        first = sync.sync(self.teacher, batch[:3])
+        self.assertEqual(first[2]['result'], 'rejected')
+        again = sync.sync(self.teacher, batch)
+        self.assertEqual(again[:3], first)
+        self.assertEqual(again[3], first[0])
+        self.assertEqual(DailyAttendanceLog.objects.get().version, 1)
+
+    def test_a_racing_retry_replays_instead_of_failing(self):
+        first = sync.sync(self.teacher, [self.op('a', 'absent', 5), self.op('b', 'present', 10)])
+        apply, calls = sync._apply, []
+
+        def lose_the_race(*args):
+            # The first pass did not see the original's acks yet and hit the unique constraint
+            calls.append(args)
+            if len(calls) == 1:
+                raise IntegrityError
+            return apply(*args)
+
+        with mock.patch.object(sync, '_apply', lose_the_race):
+            self.assertEqual(sync.sync(self.teacher, [self.op('a', 'absent', 5), self.op('b', 'present', 10)]), first)
+        self.assertEqual(len(calls), 2)
+
+
+class BulkEnrollTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(course_name='Roster', course_description='-', duration='1 Month')
+        cls.staff = User.objects.create(email='roster-staff@example.com', username='roster-staff', is_staff=True, is_superuser=True)
+        cls.students = [User.objects.create(email=f'r{i}@example.com', username=f'r{i}') for i in range(3)]
+
+    def test_report_counts_created_skipped_and_unknown(self):
+        first, second, third = self.students
+        Enrollment.objects.create(student=first, course=self.course)
+        report = roster.enroll_report(self.course.id, [str(first.id), second.username, third.email, third.username, 'nobody'])
+        self.assertEqual(report, {'created': 2, 'skipped': 1, 'unknown': ['nobody']})
+        self.assertEqual(Enrollment.objects.filter(course=self.course).count(), 3)
+        self.assertEqual(roster.enroll_report(self.course.id, [second.username])['skipped'], 1)
+
+    def test_view_rejects_a_bad_course_id(self):
+        token = AccessToken.for_user(self.staff)
+        url, auth = reverse('bulk-enroll'), {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        response = self.client.post(url, {'course_id': 'abc', 'students': ['r0']}, content_type='application/json', **auth)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'course_id': str(self.course.id), 'students': ['r0', 'r1']}, content_type='application/json', **auth)
+        self.assertEqual(response.json(), {'created': 2, 'skipped': 0, 'unknown': []})
+
+    def test_admin_action_keeps_the_cap(self):
+        self.client.force_login(self.staff)
+        data = {
+            'action': 'bulk_enroll', '_selected_action': [self.course.id], 'apply': '1',
+            'students': ' '.join(student.username for student in self.students),
+        }
+        with mock.patch.object(roster, 'MAX_STUDENTS', 2):
+            self.client.post(reverse('admin:lms_course_changelist'), data)
+        self.assertFalse(Enrollment.objects.filter(course=self.course).exists())
+        self.client.post(reverse('admin:lms_course_changelist'), data)
+        self.assertEqual(Enrollment.objects.filter(course=self.course).count(), 3)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class StudentImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(course_name='Imported', course_description='-', duration='1 Month')
+        cls.staff = User.objects.create(email='import-staff@example.com', username='import-staff', is_staff=True)
+        User.objects.create(email='taken@example.com', username='taken')
+
+    def run_import(self, csv_text, course=None):
+        source, total = imports.read_upload(csv_text.encode())
+        record = StudentImport.objects.create(created_by=self.staff, course=course, source=source, total_rows=total)
+        imports.run(record.id)
+        record.refresh_from_db()
+        return record, list(csv.DictReader(io.StringIO(record.report)))
+
+    def test_report_has_a_result_per_row(self):
+        record, report = self.run_import(
+            'email,username,password,full_name\n'
+            'new1@example.com,new1,pass12345,New One\n'
+            'new2@example.com,new2,,New Two\n'
+            'NEW1@example.com,new1,pass12345,Again\n'
+            'taken@example.com,fresh,pass12345,Taken\n'
+            'not-an-email,bad,pass12345,Bad\n',
+            course=self.course,
+        )
+        self.assertEqual((record.status, record.processed_rows, record.created_count, record.failed_count), ('succeeded', 5, 2, 3))
+        self.assertEqual([row['row'] for row in report], ['2', '3', '4', '5', '6'])
+        self.assertEqual([row['result'] for row in report], ['created', 'created', 'failed', 'failed', 'failed'])
+        self.assertEqual(report[0]['detail'], 'enrolled')
+        self.assertEqual(report[1]['detail'], 'no password: set one with a password reset; enrolled')
+        self.assertIn('appears earlier in the file', report[2]['detail'])
+        self.assertIn('already exists', report[3]['detail'])
+        self.assertTrue(report[4]['detail'].startswith('email:'))
+        new1 = User.objects.get(username='new1')
+        self.assertEqual(report[0]['user_id'], str(new1.id))
+        self.assertTrue(new1.check_password('pass12345'))
+        self.assertFalse(User.objects.get(username='new2').has_usable_password())
+        self.assertEqual(Enrollment.objects.filter(course=self.course).count(), 2)
+
+    def test_view_rejects_a_bad_course_id(self):
+        token = AccessToken.for_user(self.staff)
+        response = self.client.post(
+            reverse('student-import'), {'course_id': 'abc', 'students': import_rows(1)},
+            content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_hasher_threads_and_iterations(self):
+        self.assertEqual(imports.hash_workers(imports.password_hasher()), 1)
+        with self.settings(
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+            STUDENT_IMPORT={'HASH_WORKERS': 3, 'PASSWORD_ITERATIONS': 1000},
+        ):
+            with self.assertLogs('lms.imports', 'WARNING') as logs:
+                hasher = imports.password_hasher()
+            self.assertEqual(hasher.iterations, imports.MIN_PASSWORD_ITERATIONS)
+            self.assertIn('below the minimum', logs.output[0])
+            self.assertEqual(imports.hash_workers(hasher), 3)
+
+
+class GradeRankTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(course_name='Ranked', course_description='-', duration='1 Month')
+        cls.students = [User.objects.create(email=f'g{i}@example.com', username=f'g{i}') for i in range(5)]
+        for student in cls.students:
+            Enrollment.objects.create(student=student, course=cls.course)
+
+    def ranks(self):
+        return dict(Grade.objects.filter(enrollment__course=self.course).values_list('enrollment__student__username', 'rank'))
+
+    def test_ties_share_a_rank_and_ungraded_rows_stay_null(self):
+        entries = grades.parse([
+            {'student_id': student.id, 'grade': grade} for student, grade in zip(self.students, ['A+', 'a', 'A ', 'F', ''])
+        ])
+        self.assertEqual(grades.save(self.course.id, entries), (4, []))
+        self.assertEqual(self.ranks(), {'g0': 1, 'g1': 2, 'g2': 2, 'g3': 4, 'g4': None})
+        # Nothing moved: nothing to write
+        self.assertEqual(grades.recompute_ranks([self.course.id]), 0)
+
+    def test_deleting_a_graded_enrollment_reranks(self):
+        grades.save(self.course.id, dict(zip([student.id for student in self.students], ['A+', 'A', 'A', 'F'])))
+        Enrollment.objects.get(student=self.students[0]).delete()
+        self.assertEqual(self.ranks(), {'g1': 1, 'g2': 1, 'g3': 3, 'g4': None})
+        Grade.objects.get(enrollment__student=self.students[1]).delete()
+        self.assertEqual(self.ranks(), {'g2': 1, 'g3': 2, 'g4': None})
+
+    def test_off_scale_grades_are_refused(self):
+        grade = Grade.objects.get(enrollment__student=self.students[0])
+        grade.grade = 'Z'
+        with self.assertRaises(ValidationError):
+            grade.full_clean()
+        with self.assertRaises(ValueError):
+            grade.save()
+        grade.grade = ' b+'
+        grade.full_clean()
+        grade.save()
+        self.assertEqual((grade.grade, grade.score), ('B+', 7))
+
+    def test_migration_clears_off_scale_legacy_grades(self):
+        migration = import_module('lms.migrations.0036_clear_off_scale_grades')
+        grades.save(self.course.id, grades.parse([{'student_id': self.students[0].id, 'grade': 'A'}]))
+        legacy = Grade.objects.get(enrollment__student=self.students[1])
+        Grade.objects.filter(pk=legacy.pk).update(grade='85')
+        migration.clear_off_scale_grades(django_apps, None)
+        grade_of = dict(Grade.objects.values_list('enrollment__student__username', 'grade'))
+        self.assertEqual((grade_of['g0'], grade_of['g1']), ('A', None))
+        # Saving the cleared row, e.g. from the admin, works again
+        legacy.refresh_from_db()
+        legacy.save()
+
+
+class SubmissionXpTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Challenges', course_description='-', duration='1 Month')
+        cls.teacher = User.objects.create(email='xp-teacher@example.com', username='xp-teacher', is_teacher=True)
+        cls.student = User.objects.create(email='xp-student@example.com', username='xp-student')
+        TeacherCourseAssignment.objects.create(teacher=cls.teacher, course=course)
+        deadline = timezone.now() + timedelta(days=1)
+        cls.mission = DailyChallenge.objects.create(course=course, mission='Write', deadline=deadline, reward_xp=50)
+        cls.quiz = DailyChallenge.objects.create(course=course, mission='Quiz', challenge_type='quiz', deadline=deadline, reward_xp=30)
+        cls.question = DailyChallengeQuestion.objects.create(
+            challenge=cls.quiz, question_text='?', option_a='a', option_b='b', option_c='c', option_d='d', correct_option='B',
+        )
+
+    def submit(self, data, **kwargs):
+        token = AccessToken.for_user(self.student)
+        response = self.client.post(reverse('daily-challenge-submit'), data, HTTP_AUTHORIZATION=f'Bearer {token}', **kwargs)
+        self.assertEqual(response.status_code, 201)
+
+    def xp(self):
+        return User.objects.get(pk=self.student.pk).xp
+
+    def decide(self, decision):
+        submission = ChallengeSubmission.objects.get(challenge=self.mission)
+        return reviews.review(self.teacher, {submission.id: (decision, None)})['xp_awarded']
+
+    def test_retaking_a_quiz_pays_once(self):
+        self.submit({'challenge_id': self.quiz.id, 'responses': {str(self.question.id): 'B'}}, content_type='application/json')
+        self.assertEqual(self.xp(), 30)
+        self.submit({'challenge_id': self.quiz.id, 'responses': {}}, content_type='application/json')
+        self.assertEqual(self.xp(), 30)
+        self.assertEqual(ChallengeSubmission.objects.get(challenge=self.quiz).quiz_score, 0)
+
+    def test_only_the_first_approval_pays(self):
+        self.submit({'challenge_id': self.mission.id, 'text_response': 'First try'})
+        self.assertEqual(self.decide('correction'), 0)
+        self.assertEqual(self.decide('approved'), 50)
+        self.assertEqual(self.decide('approved'), 0)
+        # A resubmission goes back to pending, but approving it again pays nothing
+        self.submit({'challenge_id': self.mission.id, 'text_response': 'Better'})
+        self.assertEqual(ChallengeSubmission.objects.get(challenge=self.mission).status, 'pending')
+        self.assertEqual(self.decide('approved'), 0)
+        self.assertEqual(self.xp(), 50)
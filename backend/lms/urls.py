@@ -4,12 +4,18 @@ from . import views
 urlpatterns = [
     path('courses/', views.CourseListView.as_view(), name='course-list'),
     path('enroll/', views.EnrollCourseView.as_view(), name='enroll'),
+    path('enroll/bulk/', views.BulkEnrollView.as_view(), name='bulk-enroll'),
+    path('students/import/', views.StudentImportView.as_view(), name='student-import'),
+    path('students/import/<int:import_id>/', views.StudentImportDetailView.as_view(), name='student-import-detail'),
+    path('students/import/<int:import_id>/report/', views.StudentImportReportView.as_view(), name='student-import-report'),
     path('dashboard/', views.StudentDashboardView.as_view(), name='dashboard'),
     path('all-students/', views.StaffStudentListView.as_view(), name='all-students'),
     path('attendance/export/<int:enrollment_id>/', views.ExportAttendanceView.as_view(), name='export-attendance'),
     path('attendance/export/me/', views.ExportUserDailyAttendanceView.as_view(), name='export-my-attendance'),
     path('attendance/logs/', views.AttendanceLogListView.as_view(), name='attendance-logs'),
     path('attendance/logs/<int:student_id>/', views.AttendanceLogListView.as_view(), name='student-attendance-logs'),
+    path('attendance/calendar/', views.AttendanceCalendarView.as_view(), name='attendance-calendar'),
+    path('attendance/calendar/<int:student_id>/', views.AttendanceCalendarView.as_view(), name='student-attendance-calendar'),
     path('attendance/mark/', views.MarkAttendanceView.as_view(), name='mark-attendance'),
     path('attendance/all-logs/', views.StaffAllAttendanceLogsView.as_view(), name='all-attendance-logs'),
     path('competitions/', views.CompetitionListView.as_view(), name='competition-list'),
@@ -24,6 +30,10 @@ urlpatterns = [
     path('teacher/dashboard/', views.TeacherDashboardView.as_view(), name='teacher-dashboard'),
     path('teacher/students/', views.TeacherStudentListView.as_view(), name='teacher-students'),
     path('teacher/attendance/mark/', views.TeacherMarkAttendanceView.as_view(), name='teacher-mark-attendance'),
+    path('teacher/attendance/register/', views.TeacherAttendanceRegisterView.as_view(), name='teacher-attendance-register'),
+    path('teacher/attendance/sync/', views.TeacherAttendanceSyncView.as_view(), name='teacher-attendance-sync'),
+    path('teacher/attendance/cohort/', views.TeacherAttendanceCohortView.as_view(), name='teacher-attendance-cohort'),
+    path('teacher/grades/', views.TeacherGradesView.as_view(), name='teacher-grades'),
     path('teacher/update-progress/', views.TeacherUpdateProgressView.as_view(), name='teacher-update-progress'),
     path('teacher/update-course-progress/', views.TeacherUpdateCourseProgressView.as_view(), name='teacher-update-course-progress'),
     path('teacher/students/<int:enrollment_id>/performance/', views.TeacherStudentPerformanceView.as_view(), name='teacher-student-performance'),
@@ -35,6 +45,8 @@ urlpatterns = [
     path('daily-challenges/submit/', views.ChallengeSubmissionView.as_view(), name='daily-challenge-submit'),
     path('teacher/challenges/submissions/', views.TeacherChallengeSubmissionsView.as_view(), name='teacher-challenge-submissions'),
     path('teacher/challenges/feedback/', views.TeacherFeedbackChallengeView.as_view(), name='teacher-challenge-feedback'),
+    path('teacher/challenges/review-queue/', views.TeacherReviewQueueView.as_view(), name='teacher-challenge-review-queue'),
+    path('teacher/challenges/review/', views.TeacherBulkReviewView.as_view(), name='teacher-challenge-review'),
     path('teacher/daily-challenges/create/', views.DailyChallengeCreateView.as_view(), name='teacher-challenge-create'),
     path('teacher/daily-challenges/list/', views.TeacherChallengeListView.as_view(), name='teacher-challenge-assigned-list'),
     path('leaderboard/course/', views.CourseLeaderboardView.as_view(), name='course-leaderboard'),
@@ -1,7 +1,7 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, PermissionDenied
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Prefetch, Window, Count, F, Q, Sum
 from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
@@ -11,7 +11,7 @@ from .models import (
     Competition, CompetitionParticipant, Badge, UserBadge, QuizQuestion, 
     CodingQuestion, EnglishQuestion, MemorySet, MemoryQuestion, 
     CompetitionAttempt, TeacherCourseAssignment, DailyChallenge, ChallengeSubmission,
-    DailyChallengeQuestion
+    DailyChallengeQuestion, AttendanceBitmap, StudentImport, prefetch_attendance_stats
 )
 from .serializers import (
     CourseSerializer, EnrollmentSerializer, EnrollCourseSerializer, DailyAttendanceLogSerializer, 
@@ -21,7 +21,9 @@ from .serializers import (
     DailyChallengeSerializer, ChallengeSubmissionSerializer, DailyChallengeQuestionSerializer, CourseLeaderboardSerializer
 )
 from accounts.serializers import UserSerializer
+from . import bitmaps, events, grades, imports, jobs, partitions, register, reviews, roster, search, sync
 import csv
+from datetime import datetime
 from django.http import HttpResponse
 from django.utils import timezone
 
@@ -45,14 +47,105 @@ class EnrollCourseView(generics.CreateAPIView):
             except Course.DoesNotExist:
                 return Response({"detail": "Course not found."}, status=status.HTTP_404_NOT_FOUND)
             
-            # Check if already enrolled
-            if Enrollment.objects.filter(student=request.user, course=course).exists():
+            # One conditional insert: nothing is written when already enrolled
+            if not roster.enroll(course.id, [request.user.id]):
                 return Response({"detail": "You are already enrolled in this course."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            enrollment = Enrollment.objects.create(student=request.user, course=course)
             return Response({"detail": f"Successfully enrolled in {course.course_name}!"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BulkEnrollView(generics.GenericAPIView):
+    """
+    Staff-only: enroll many students in a course at once. JSON {course_id, students: [id, username or email]}
+    or a multipart upload with course_id and a CSV `file`. Reports created, skipped (already enrolled) and unknown.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        try:
+            course_id = int(request.data.get('course_id'))
+        except (TypeError, ValueError):
+            return Response({"detail": "course_id must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if not Course.objects.filter(id=course_id).exists():
+            return Response({"detail": "Course not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        upload = request.FILES.get('file')
+        if upload is not None:
+            try:
+                identifiers = roster.read_csv(upload.read())
+            except (UnicodeDecodeError, csv.Error):
+                return Response({"detail": "file must be a UTF-8 CSV."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            identifiers = request.data.get('students')
+            if not isinstance(identifiers, list):
+                return Response({"detail": "students must be a list, or upload a CSV file."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(identifiers) > roster.MAX_STUDENTS:
+            return Response({"detail": f"At most {roster.MAX_STUDENTS} students per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(roster.enroll_report(course_id, identifiers))
+
+
+class StudentImportView(generics.GenericAPIView):
+    """
+    Staff-only: import students from a CSV `file` with the registration columns (email, username, password,
+    full_name, ...; password optional) or JSON {students: [{...}]}, optionally enrolling them in course_id.
+    The import runs as a job; poll student-import-detail, then download student-import-report.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        course_id = request.data.get('course_id') or None
+        if course_id is not None:
+            try:
+                course_id = int(course_id)
+            except (TypeError, ValueError):
+                return Response({"detail": "course_id must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+            if not Course.objects.filter(id=course_id).exists():
+                return Response({"detail": "Course not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                source, total = imports.read_upload(upload.read())
+            else:
+                source, total = imports.rows_to_csv(request.data.get('students'))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            record = StudentImport.objects.create(
+                created_by=request.user, course_id=course_id, filename=upload.name if upload else '',
+                source=source, total_rows=total,
+            )
+            # Not retried: a second run would report the first run's students as duplicates
+            jobs.enqueue('lms.import_students', max_attempts=1, import_id=record.id)
+        return Response(imports.summary(record), status=status.HTTP_202_ACCEPTED)
+
+
+class StudentImportDetailView(generics.GenericAPIView):
+    """Staff-only: progress and counts of a student import."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, import_id):
+        record = StudentImport.objects.defer('source', 'report').filter(id=import_id).first()
+        if record is None:
+            return Response({"detail": "Import not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(imports.summary(record))
+
+
+class StudentImportReportView(generics.GenericAPIView):
+    """Staff-only: the per-row results of a finished student import, as CSV."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, import_id):
+        record = StudentImport.objects.filter(id=import_id).only('id', 'status', 'report').first()
+        if record is None:
+            return Response({"detail": "Import not found."}, status=status.HTTP_404_NOT_FOUND)
+        if record.status in ('queued', 'running'):
+            return Response({"detail": "The import has not finished yet."}, status=status.HTTP_409_CONFLICT)
+        response = HttpResponse(record.report, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="student_import_{record.id}.csv"'
+        return response
+
 from django.db.models.functions import Rank
 
 class StudentDashboardView(generics.GenericAPIView):
@@ -64,7 +157,9 @@ class StudentDashboardView(generics.GenericAPIView):
         if user.is_staff:
             enrollments = Enrollment.objects.all().select_related('student', 'course', 'grade', 'attendance').order_by('-enrollment_date')
         else:
-            enrollments = Enrollment.objects.filter(student=user).select_related('course', 'grade', 'attendance')
+            enrollments = Enrollment.objects.filter(student=user).select_related('student', 'course', 'grade', 'attendance')
+        enrollments = list(enrollments)
+        prefetch_attendance_stats(enrollments)
         
         user_data = UserSerializer(user).data
         enrollments_data = EnrollmentSerializer(enrollments, many=True).data
@@ -75,25 +170,8 @@ class StudentDashboardView(generics.GenericAPIView):
             for c in Enrollment.objects.values('course_id').annotate(count=Count('id'))
         }
 
-        # Batch-compute all ranks per course to avoid N+1 rank queries
-        # Get all course IDs from the enrollments
-        course_ids = set(d['course']['id'] for d in enrollments_data)
-        # For each course, precompute grade -> rank mapping
-        course_rank_maps = {}
-        for cid in course_ids:
-            # Get sorted distinct grades for this course
-            graded_enrollments = (
-                Enrollment.objects.filter(course_id=cid)
-                .exclude(grade__grade__isnull=True)
-                .exclude(grade__grade='')
-                .values('id', 'grade__grade')
-            )
-            # Sort by grade and assign rank
-            sorted_grades = sorted(graded_enrollments, key=lambda x: x['grade__grade'] or 'ZZZ')
-            rank_map = {}
-            for rank_idx, item in enumerate(sorted_grades, 1):
-                rank_map[item['id']] = rank_idx
-            course_rank_maps[cid] = rank_map
+        # Ranks are stored on the grades (lms/grades.py), already loaded with the enrollments
+        ranks = {e.id: e.grade.rank for e in enrollments if hasattr(e, 'grade')}
 
         for data in enrollments_data:
             course_id = data['course']['id']
@@ -101,8 +179,7 @@ class StudentDashboardView(generics.GenericAPIView):
             
             data['course_total_students'] = course_counts.get(course_id, 0)
             
-            rank_map = course_rank_maps.get(course_id, {})
-            data['rank'] = rank_map.get(enrollment_id, "N/A")
+            data['rank'] = ranks.get(enrollment_id) or "N/A"
 
         # Overall attendance: (Sum of all present logs) / (Sum of all logs)
         # This provides a combined metric across all enrolled courses
@@ -162,7 +239,12 @@ class StaffStudentListView(generics.ListAPIView):
         course_id = self.request.query_params.get('course_id')
         if course_id:
             queryset = queryset.filter(course_id=course_id)
-        return queryset
+        return search.search(queryset, self.request.query_params.get('q'), search.student_fields('student__'))
+
+    def list(self, request, *args, **kwargs):
+        enrollments = list(self.filter_queryset(self.get_queryset()))
+        prefetch_attendance_stats(enrollments)
+        return Response(self.get_serializer(enrollments, many=True).data)
 
 class ExportAttendanceView(generics.GenericAPIView):
     """Allows a student to download their OWN attendance log for a specific course."""
@@ -198,7 +280,8 @@ class ExportUserDailyAttendanceView(generics.GenericAPIView):
 
     def get(self, request):
         user = request.user
-        logs = DailyAttendanceLog.objects.filter(student=user).order_by('date')
+        # Live logs plus months already moved to AttendanceArchive
+        history = partitions.attendance_history(user.id)
 
         response = HttpResponse(content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="Full_Attendance_Report_{user.username}.csv"'
@@ -206,8 +289,8 @@ class ExportUserDailyAttendanceView(generics.GenericAPIView):
         writer = csv.writer(response)
         writer.writerow(['Date', 'Day', 'Status'])
 
-        for log in logs:
-            writer.writerow([log.date, log.date.strftime('%A'), log.status.capitalize()])
+        for day, _, log_status in history:
+            writer.writerow([day, day.strftime('%A'), log_status.capitalize()])
 
         return response
 
@@ -229,11 +312,40 @@ class AttendanceLogListView(generics.GenericAPIView):
             except User.DoesNotExist:
                 return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        logs = DailyAttendanceLog.objects.filter(student=target_user).order_by('-date')
+        logs = DailyAttendanceLog.objects.filter(student=target_user).select_related('student', 'course').order_by('-date')
         serializer = DailyAttendanceLogSerializer(logs, many=True)
         return Response(serializer.data)
 
 
+class AttendanceCalendarView(generics.GenericAPIView):
+    """Per course and term attendance stats plus a run-length calendar, for the current student or a specific student (staff)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, student_id=None):
+        target_id = request.user.id
+        if student_id and request.user.is_staff:
+            target_id = student_id
+
+        rows = AttendanceBitmap.objects.filter(student_id=target_id).select_related('course').order_by('-term', 'course_id')
+        results = []
+        for row in rows:
+            present, held = row.bits()
+            current_streak, longest_streak = bitmaps.streaks(present, held)
+            results.append({
+                "course_id": row.course_id,
+                "course_name": row.course.course_name if row.course else None,
+                "term": str(row.term),
+                "class_days": held.bit_count(),
+                "present_days": present.bit_count(),
+                "percentage": bitmaps.percentage(present, held),
+                "current_streak": current_streak,
+                "longest_streak": longest_streak,
+                # Day i of the term onwards, e.g. "P5-2P4A"; see lms/bitmaps.py
+                "calendar": bitmaps.encode(present, held),
+            })
+        return Response(results)
+
+
 class MarkAttendanceView(generics.GenericAPIView):
     """Staff-only: mark or update a student's full-day attendance."""
     permission_classes = [permissions.IsAdminUser]
@@ -254,12 +366,20 @@ class MarkAttendanceView(generics.GenericAPIView):
         except User.DoesNotExist:
             return Response({"detail": "Student not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        log, created = DailyAttendanceLog.objects.update_or_create(
-            student=student,
-            course_id=course_id,
-            date=date,
-            defaults={'status': status_val}
-        )
+        with transaction.atomic():
+            now = timezone.now()
+            log, created = DailyAttendanceLog.objects.update_or_create(
+                student=student,
+                course_id=course_id,
+                date=date,
+                defaults={'status': status_val, 'marked_at': now, 'version': F('version') + 1},
+                create_defaults={'status': status_val, 'marked_at': now},
+            )
+            events.emit(
+                events.ATTENDANCE_MARKED if created else events.ATTENDANCE_CHANGED,
+                student_id=student.id, course_id=course_id, date=str(log.date), status=log.status,
+            )
+            bitmaps.record([(student.id, course_id, log.date, log.status)])
 
         return Response({
             "detail": "Attendance marked.",
@@ -275,7 +395,7 @@ class StaffAllAttendanceLogsView(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get_queryset(self):
-        queryset = DailyAttendanceLog.objects.all().select_related('student')
+        queryset = DailyAttendanceLog.objects.all().select_related('student', 'course')
         course_id = self.request.query_params.get('course_id')
         student_id = self.request.query_params.get('student_id')
         date = self.request.query_params.get('date')
@@ -297,7 +417,9 @@ class CompetitionListView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = Competition.objects.all().select_related('reward_badge', 'course')
+        queryset = Competition.objects.all().select_related('reward_badge', 'course').annotate(
+            participant_total=Count('participants', distinct=True)
+        )
         
         # Filter by enrollments for students
         if not user.is_staff and not getattr(user, 'is_teacher', False):
@@ -316,6 +438,18 @@ class CompetitionListView(generics.ListAPIView):
             
         return queryset.order_by('-start_date')
 
+    def get_serializer_context(self):
+        # Two queries for the whole page instead of two EXISTS per competition
+        context = super().get_serializer_context()
+        user = self.request.user
+        context['joined_competition_ids'] = set(
+            CompetitionParticipant.objects.filter(user=user).values_list('competition_id', flat=True)
+        )
+        context['completed_competition_ids'] = set(
+            CompetitionAttempt.objects.filter(user=user, is_completed=True).values_list('competition_id', flat=True)
+        )
+        return context
+
 @method_decorator(cache_page(60), name='dispatch')  # Cache leaderboard for 1 min
 class CompetitionLeaderboardView(generics.ListAPIView):
     serializer_class = LeaderboardSerializer
@@ -396,6 +530,8 @@ class GamificationDataView(generics.GenericAPIView):
 
 class GetCompetitionQuestions(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    # The "already completed" check must not see a lagging replica
+    read_from = 'primary'
 
     def get(self, request, competition_id):
         try:
@@ -419,7 +555,7 @@ class GetCompetitionQuestions(generics.GenericAPIView):
             questions = competition.english_questions.all()
             data["questions"] = EnglishQuestionSerializer(questions, many=True).data
         elif competition.mode_type == 'memory':
-            mem_sets = competition.memory_sets.all()
+            mem_sets = competition.memory_sets.prefetch_related('questions')
             data["memory_sets"] = MemorySetSerializer(mem_sets, many=True).data
 
         return Response(data)
@@ -492,7 +628,7 @@ class SubmitCompetitionAttempt(generics.GenericAPIView):
                     correct_count += 1
 
         elif competition.mode_type == 'memory':
-            mem_sets = competition.memory_sets.all()
+            mem_sets = competition.memory_sets.prefetch_related('questions')
             for ms in mem_sets:
                 for q in ms.questions.all():
                     total_questions += 1
@@ -514,10 +650,7 @@ class SubmitCompetitionAttempt(generics.GenericAPIView):
 
         # Reward XP and update attempt
         user = request.user
-        user.xp += total_xp
-        # Simple level up logic: 1000 XP per level
-        user.level = (user.xp // 1000) + 1
-        user.save()
+        user.award_xp(total_xp, source=f'competition:{competition.id}')
 
         attempt.score = total_xp
         attempt.correct_answers = correct_count
@@ -568,11 +701,13 @@ class TeacherDashboardView(generics.GenericAPIView):
 
     def get(self, request):
         teacher = request.user
-        assignments = TeacherCourseAssignment.objects.filter(teacher=teacher).select_related('course')
+        assignments = TeacherCourseAssignment.objects.filter(teacher=teacher).select_related('course').annotate(
+            student_total=Count('course__enrollments')
+        )
         assigned_courses = TeacherCourseAssignmentSerializer(assignments, many=True).data
         
         # Use values_list instead of Python-side [a.course for a in assignments]
-        assigned_course_ids = assignments.values_list('course_id', flat=True)
+        assigned_course_ids = TeacherCourseAssignment.objects.filter(teacher=teacher).values_list('course_id', flat=True)
         total_students = Enrollment.objects.filter(course_id__in=assigned_course_ids).count()
         
         return Response({
@@ -593,11 +728,34 @@ class TeacherStudentListView(generics.ListAPIView):
         if course_id and course_id != 'all':
             if not TeacherCourseAssignment.objects.filter(teacher=teacher, course_id=course_id).exists():
                 return Enrollment.objects.none()
-            return Enrollment.objects.filter(course_id=course_id).select_related('student', 'course', 'attendance', 'grade').prefetch_related('student__competitions', 'student__daily_attendance_logs')
-        
-        # If no course_id, return all students in all assigned courses
-        assigned_course_ids = TeacherCourseAssignment.objects.filter(teacher=teacher).values_list('course_id', flat=True)
-        return Enrollment.objects.filter(course_id__in=assigned_course_ids).select_related('student', 'course', 'attendance', 'grade').prefetch_related('student__competitions', 'student__daily_attendance_logs')
+            queryset = Enrollment.objects.filter(course_id=course_id)
+        else:
+            # If no course_id, return all students in all assigned courses
+            assigned_course_ids = TeacherCourseAssignment.objects.filter(teacher=teacher).values_list('course_id', flat=True)
+            queryset = Enrollment.objects.filter(course_id__in=assigned_course_ids)
+        queryset = search.search(queryset, self.request.query_params.get('q'), search.student_fields('student__'))
+
+        queryset = queryset.select_related('student', 'course', 'attendance', 'grade').prefetch_related(
+            Prefetch('student__competitions', queryset=CompetitionParticipant.objects.select_related('competition'))
+        )
+        # daily_status only needs the logs of the requested date, not each student's whole history
+        date_str = self.request.query_params.get('date')
+        if date_str:
+            try:
+                target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            except ValueError:
+                target_date = None
+            if target_date:
+                queryset = queryset.prefetch_related(Prefetch(
+                    'student__daily_attendance_logs',
+                    queryset=DailyAttendanceLog.objects.filter(date=target_date),
+                ))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        enrollments = list(self.filter_queryset(self.get_queryset()))
+        prefetch_attendance_stats(enrollments)
+        return Response(self.get_serializer(enrollments, many=True).data)
 
 class TeacherMarkAttendanceView(generics.GenericAPIView):
     permission_classes = [IsTeacher]
@@ -611,31 +769,161 @@ class TeacherMarkAttendanceView(generics.GenericAPIView):
         if date is None or course_id is None:
             return Response({"detail": "date and course_id are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        saved_count = 0
         from django.contrib.auth import get_user_model
         User = get_user_model()
 
+        statuses = {}
         for entry in attendance_data:
             student_id = entry.get('student_id')
             status_val = entry.get('status')
-            
+
             if not student_id or status_val not in ('present', 'absent'):
                 continue
-                
             try:
-                student = User.objects.get(id=student_id)
-                DailyAttendanceLog.objects.update_or_create(
-                    student=student,
-                    course_id=course_id,
-                    date=date,
-                    defaults={'status': status_val}
-                )
-                saved_count += 1
-            except User.DoesNotExist:
+                statuses[int(student_id)] = status_val
+            except (TypeError, ValueError):
                 continue
 
+        try:
+            day = datetime.strptime(str(date), '%Y-%m-%d').date()
+            course_id = int(course_id)
+        except (TypeError, ValueError):
+            return Response({"detail": "date must be YYYY-MM-DD and course_id a number."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Set-based: one lookup for the students, one for their existing logs, one upsert for all of them
+        known_ids = set(User.objects.filter(id__in=statuses).values_list('id', flat=True))
+        now = timezone.now()
+        saved_count = len(register.save([(sid, course_id, day, st, now) for sid, st in statuses.items() if sid in known_ids]))
+
         return Response({"detail": f"Successfully marked attendance for {saved_count} students."}, status=status.HTTP_200_OK)
 
+class TeacherAttendanceSyncView(generics.GenericAPIView):
+    """Offline sync: a batch of client-timestamped marks across courses and dates, applied idempotently (lms/sync.py)."""
+    permission_classes = [IsTeacher]
+
+    def post(self, request):
+        ops = request.data.get('ops')
+        if not isinstance(ops, list):
+            return Response({"detail": "ops must be a list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ops) > sync.MAX_OPS:
+            return Response({"detail": f"At most {sync.MAX_OPS} operations per request."}, status=status.HTTP_400_BAD_REQUEST)
+        acks = sync.sync(request.user, ops)
+        return Response({"acks": acks, "server_time": timezone.now().isoformat()})
+
+class TeacherAttendanceCohortView(generics.GenericAPIView):
+    """Class-wide attendance for one course and term: totals, full-attendance days and per-day headcounts."""
+    permission_classes = [IsTeacher]
+
+    def get(self, request):
+        if not request.query_params.get('course_id'):
+            return Response({"detail": "course_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            course_id = int(request.query_params['course_id'])
+        except ValueError:
+            return Response({"detail": "course_id must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        # Any date inside the term; defaults to the current term
+        day = timezone.localdate()
+        if request.query_params.get('term'):
+            try:
+                day = datetime.strptime(request.query_params['term'], '%Y-%m-%d').date()
+            except ValueError:
+                return Response({"detail": "term must be a date (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+        if not TeacherCourseAssignment.objects.filter(teacher=request.user, course_id=course_id).exists():
+            return Response({"detail": "Not authorized."}, status=status.HTTP_403_FORBIDDEN)
+
+        term = bitmaps.term_start(day)
+        rows = AttendanceBitmap.objects.filter(course_id=course_id, term=term).values_list('student_id', 'present', 'held')
+        cohort = bitmaps.cohort(term, {
+            student_id: (int.from_bytes(present, 'little'), int.from_bytes(held, 'little'))
+            for student_id, present, held in rows
+        })
+        return Response({"course_id": course_id, "term": str(term), **cohort})
+
+class TeacherAttendanceRegisterView(generics.GenericAPIView):
+    """
+    GET: the register grid of a course (?course_id=&from=&to=, default this month), one status string per student.
+    POST: save edited grid rows back, {course_id, from, students: [{student_id, days}]}, in one upsert.
+    """
+    permission_classes = [IsTeacher]
+
+    def _course_id(self, request, data):
+        try:
+            course_id = int(data.get('course_id'))
+        except (TypeError, ValueError):
+            raise ValidationError({"detail": "course_id is required."})
+        if not TeacherCourseAssignment.objects.filter(teacher=request.user, course_id=course_id).exists():
+            raise PermissionDenied("Not authorized.")
+        return course_id
+
+    @staticmethod
+    def _date(value, default):
+        if not value:
+            return default
+        try:
+            return datetime.strptime(str(value), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValidationError({"detail": "Dates must be YYYY-MM-DD."})
+
+    def get(self, request):
+        course_id = self._course_id(request, request.query_params)
+        today = timezone.localdate()
+        start = self._date(request.query_params.get('from'), today.replace(day=1))
+        end = self._date(request.query_params.get('to'), register.month_end(start))
+        if not 0 <= (end - start).days < register.MAX_DAYS:
+            return Response({"detail": f"from must not be after to, and the range is at most {register.MAX_DAYS} days."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(register.grid(course_id, start, end))
+
+    def post(self, request):
+        course_id = self._course_id(request, request.data)
+        start = self._date(request.data.get('from'), None)
+        rows = request.data.get('students')
+        if start is None or not isinstance(rows, list):
+            return Response({"detail": "from and students are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            entries = register.parse(start, rows)
+        except (KeyError, TypeError, ValueError):
+            return Response({"detail": "Each row needs a student_id and a days string."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only students on the course's roster
+        enrolled = set(Enrollment.objects.filter(course_id=course_id, student_id__in={sid for sid, _, _ in entries}).values_list('student_id', flat=True))
+        now = timezone.now()
+        saved_count = len(register.save([
+            (sid, course_id, day, st, now) for sid, day, st in entries if sid in enrolled
+        ]))
+        return Response({"detail": f"Saved {saved_count} attendance entries.", "saved": saved_count})
+
+class TeacherGradesView(generics.GenericAPIView):
+    """
+    GET: the grade sheet of a course (?course_id=), students in rank order with grade, score and rank.
+    POST: grades for the whole course at once, {course_id, grades: [{student_id, grade}]}; a blank grade clears it.
+    The course is re-ranked once per POST.
+    """
+    permission_classes = [IsTeacher]
+
+    def _course_id(self, request, data):
+        try:
+            course_id = int(data.get('course_id'))
+        except (TypeError, ValueError):
+            raise ValidationError({"detail": "course_id is required."})
+        if not TeacherCourseAssignment.objects.filter(teacher=request.user, course_id=course_id).exists():
+            raise PermissionDenied("Not authorized.")
+        return course_id
+
+    def get(self, request):
+        return Response(grades.sheet(self._course_id(request, request.query_params)))
+
+    def post(self, request):
+        course_id = self._course_id(request, request.data)
+        rows = request.data.get('grades')
+        if not isinstance(rows, list):
+            return Response({"detail": "grades must be a list of {student_id, grade}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            entries = grades.parse(rows)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        updated, skipped = grades.save(course_id, entries)
+        return Response({"detail": f"Updated {updated} grades.", "updated": updated, "not_enrolled": skipped})
+
 class TeacherUpdateProgressView(generics.GenericAPIView):
     permission_classes = [IsTeacher]
 
@@ -701,7 +989,9 @@ class TeacherStudentPerformanceView(generics.RetrieveAPIView):
     def get_queryset(self):
         teacher = self.request.user
         assigned_course_ids = TeacherCourseAssignment.objects.filter(teacher=teacher).values_list('course_id', flat=True)
-        return Enrollment.objects.filter(course_id__in=assigned_course_ids).select_related('student', 'course', 'attendance', 'grade')
+        return Enrollment.objects.filter(course_id__in=assigned_course_ids).select_related('student', 'course', 'attendance', 'grade').prefetch_related(
+            Prefetch('student__competitions', queryset=CompetitionParticipant.objects.select_related('competition'))
+        )
 
 class DailyChallengeListView(generics.ListAPIView):
     serializer_class = DailyChallengeSerializer
@@ -712,11 +1002,11 @@ class DailyChallengeListView(generics.ListAPIView):
         enrolled_course_ids = Enrollment.objects.filter(student=user).values_list('course_id', flat=True)
         return DailyChallenge.objects.filter(
             course_id__in=enrolled_course_ids
-        ).prefetch_related(
+        ).select_related('course').prefetch_related(
             'quiz_questions',
             Prefetch(
                 'submissions',
-                queryset=ChallengeSubmission.objects.filter(student=user),
+                queryset=ChallengeSubmission.objects.filter(student=user).select_related('student'),
                 to_attr='user_submissions'
             )
         ).order_by('-created_at')
@@ -760,22 +1050,22 @@ class ChallengeSubmissionView(generics.GenericAPIView):
                 if responses.get(str(q.id)) == q.correct_option:
                     score += 1
             
-            submission, created = ChallengeSubmission.objects.update_or_create(
-                challenge=challenge,
-                student=request.user,
-                defaults={
-                    'quiz_score': score,
-                    'total_quiz_questions': questions.count(),
-                    'status': 'approved' # Quiz is auto-approved
-                }
-            )
-            
-            # Auto-award XP for quiz if not previously approved
-            if created or submission.status == 'approved':
-                student = request.user
-                student.xp += challenge.reward_xp
-                student.level = (student.xp // 1000) + 1
-                student.save()
+            defaults = {
+                'quiz_score': score,
+                'total_quiz_questions': questions.count(),
+                'status': 'approved' # Quiz is auto-approved
+            }
+            with transaction.atomic():
+                submission, created = ChallengeSubmission.objects.update_or_create(
+                    challenge=challenge,
+                    student=request.user,
+                    defaults=defaults,
+                    create_defaults={**defaults, 'xp_awarded_at': timezone.now()},
+                )
+                # XP once: a new submission is stamped as it is inserted, a retake only pays if it never was
+                if created or ChallengeSubmission.objects.filter(pk=submission.pk, xp_awarded_at__isnull=True).update(xp_awarded_at=timezone.now()):
+                    request.user.award_xp(challenge.reward_xp, source=f'challenge:{challenge.id}')
+                    events.emit(events.SUBMISSION_APPROVED, submission_id=submission.id, student_id=request.user.id, challenge_id=challenge.id)
 
             return Response({
                 "detail": f"Quiz submitted! Score: {score}/{questions.count()}",
@@ -812,35 +1102,82 @@ class TeacherChallengeSubmissionsView(generics.ListAPIView):
             queryset = queryset.filter(challenge__course_id=course_id)
         else:
             queryset = queryset.filter(challenge__course_id__in=assigned_course_ids)
-            
+        # Student name/email, the mission, or words of the answer
+        queryset = search.search(
+            queryset, self.request.query_params.get('q'),
+            search.student_fields('student__') + ('challenge__mission',), full_text=('text_response',),
+        )
         return queryset.order_by('-submitted_at')
 
+class TeacherReviewQueueView(generics.GenericAPIView):
+    """
+    The review queue of the teacher's courses (?course_id= for one), pending submissions first, oldest first,
+    then reviewed ones. Keyset pages: ?limit= (default 50, at most 200) and ?cursor= from the previous page's next;
+    ?status=pending stops after the pending ones.
+    """
+    permission_classes = [IsTeacher]
+
+    def get(self, request):
+        course_ids = set(TeacherCourseAssignment.objects.filter(teacher=request.user).values_list('course_id', flat=True))
+        course_id = request.query_params.get('course_id')
+        if course_id:
+            if not course_id.isdigit() or int(course_id) not in course_ids:
+                return Response({"detail": "Not authorized."}, status=status.HTTP_403_FORBIDDEN)
+            course_ids = {int(course_id)}
+        try:
+            limit = min(int(request.query_params.get('limit', reviews.PAGE_SIZE)), reviews.MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"detail": f"limit must be between 1 and {reviews.MAX_PAGE_SIZE}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = reviews.queue(
+                course_ids, cursor=request.query_params.get('cursor'), limit=limit,
+                pending_only=request.query_params.get('status') == 'pending',
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        page['results'] = ChallengeSubmissionSerializer(page['results'], many=True).data
+        return Response(page)
+
 class TeacherFeedbackChallengeView(generics.GenericAPIView):
     permission_classes = [IsTeacher]
 
     def post(self, request):
-        submission_id = request.data.get('submission_id')
-        new_status = request.data.get('status') # approved, correction
-        feedback = request.data.get('feedback')
-
         try:
-            submission = ChallengeSubmission.objects.get(id=submission_id)
-            if not TeacherCourseAssignment.objects.filter(teacher=request.user, course=submission.challenge.course).exists():
-                return Response({"detail": "Not authorized."}, status=status.HTTP_403_FORBIDDEN)
-            
-            submission.status = new_status
-            submission.feedback = feedback
-            submission.save()
-
-            if new_status == 'approved':
-                student = submission.student
-                student.xp += submission.challenge.reward_xp
-                student.level = (student.xp // 1000) + 1
-                student.save()
-
-            return Response({"detail": f"Submission {new_status}."})
-        except ChallengeSubmission.DoesNotExist:
+            decisions = reviews.parse([request.data])
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        result = reviews.review(request.user, decisions)
+        if result['not_found']:
             return Response({"detail": "Submission not found."}, status=status.HTTP_404_NOT_FOUND)
+        if result['not_authorized']:
+            return Response({"detail": "Not authorized."}, status=status.HTTP_403_FORBIDDEN)
+        return Response({"detail": f"Submission {request.data.get('status')}."})
+
+class TeacherBulkReviewView(generics.GenericAPIView):
+    """
+    Review many submissions at once: {reviews: [{submission_id, status, feedback}]}, or {submission_ids, status,
+    feedback} for one decision. status is 'approved' or 'correction'; without feedback the current one is kept.
+    One transaction; XP is awarded once per student, for submissions going from pending to approved only.
+    """
+    permission_classes = [IsTeacher]
+
+    def post(self, request):
+        items = request.data.get('reviews')
+        if items is None and isinstance(request.data.get('submission_ids'), list):
+            items = [
+                {'submission_id': pk, 'status': request.data.get('status'), 'feedback': request.data.get('feedback')}
+                for pk in request.data['submission_ids']
+            ]
+        if not isinstance(items, list):
+            return Response({"detail": "reviews must be a list, or give submission_ids and a status."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            decisions = reviews.parse(items)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        result = reviews.review(request.user, decisions)
+        return Response({"detail": f"Reviewed {result['reviewed']} submissions.", **result})
 
 class DailyChallengeCreateView(generics.CreateAPIView):
     serializer_class = DailyChallengeSerializer
@@ -871,7 +1208,7 @@ class TeacherChallengeListView(generics.ListAPIView):
     def get_queryset(self):
         teacher = self.request.user
         assigned_course_ids = TeacherCourseAssignment.objects.filter(teacher=teacher).values_list('course_id', flat=True)
-        return DailyChallenge.objects.filter(course_id__in=assigned_course_ids).order_by('-created_at')
+        return DailyChallenge.objects.filter(course_id__in=assigned_course_ids).select_related('course').prefetch_related('quiz_questions').order_by('-created_at')
 
 class CourseLeaderboardView(generics.GenericAPIView):
     serializer_class = CourseLeaderboardSerializer
@@ -904,8 +1241,10 @@ class CourseLeaderboardView(generics.GenericAPIView):
         
         # 1. Group by student to avoid duplicates if enrolled in multiple courses
         student_map = {}
+        student_xp = {}
         for enrollment in enrollments:
             s = enrollment.student
+            student_xp[s.id] = s.xp
             if s.id not in student_map:
                 student_map[s.id] = {
                     "student_id": s.id,
@@ -915,32 +1254,22 @@ class CourseLeaderboardView(generics.GenericAPIView):
                 }
 
         # 2. Calculate XP
-        for student_id, data in student_map.items():
-            if target_course_id:
-                # Specific course
-                comp_xp = CompetitionParticipant.objects.filter(
-                    user_id=student_id, 
-                    competition__course_id=target_course_id
-                ).aggregate(total=Sum('score'))['total'] or 0
-                
-                challenge_xp = ChallengeSubmission.objects.filter(
-                    student_id=student_id,
-                    challenge__course_id=target_course_id,
-                    status='approved'
-                ).aggregate(total=Sum('challenge__reward_xp'))['total'] or 0
-            else:
-                # Overall XP (Global rank for students managed by this teacher)
-                from accounts.models import User as AccountUser
-                try:
-                    u = AccountUser.objects.get(id=student_id)
-                    total_course_xp = u.xp
-                except AccountUser.DoesNotExist:
-                    total_course_xp = 0
-                
-                data["course_xp"] = total_course_xp
-                continue
-
-            data["course_xp"] = comp_xp + challenge_xp
+        if target_course_id:
+            # Specific course: one grouped query per XP source instead of two per student
+            comp_xp = dict(
+                CompetitionParticipant.objects.filter(competition__course_id=target_course_id, user_id__in=student_map.keys())
+                .values('user_id').annotate(total=Sum('score')).values_list('user_id', 'total')
+            )
+            challenge_xp = dict(
+                ChallengeSubmission.objects.filter(challenge__course_id=target_course_id, status='approved', student_id__in=student_map.keys())
+                .values('student_id').annotate(total=Sum('challenge__reward_xp')).values_list('student_id', 'total')
+            )
+            for student_id, data in student_map.items():
+                data["course_xp"] = (comp_xp.get(student_id) or 0) + (challenge_xp.get(student_id) or 0)
+        else:
+            # Overall XP (Global rank for students managed by this teacher), already loaded with the enrollments
+            for student_id, data in student_map.items():
+                data["course_xp"] = student_xp[student_id]
         
         leaderboard_data = list(student_map.values())
         
@@ -0,0 +1,176 @@
+"""
+Primary/replica routing (DATABASE_ROUTERS, DATABASE_REPLICAS in settings).
+
+Reads go to a replica only inside a request handled by ReplicaRoutingMiddleware,
+and only while nothing says the primary is needed. The primary is used when:
+- the request is not a safe method (POST, PUT, PATCH, DELETE),
+- the request has already written, or is inside transaction.atomic(),
+- the same user wrote within the last REPLICA_PIN_SECONDS (read-your-writes
+  across requests). The response to a write carries a signed, timestamped
+  token naming the user in the X-DB-Pin header, which the frontend's API
+  client echoes back on its next requests (it calls cross-origin without
+  credentials, so a cookie would never come back), so whichever worker serves
+  the next request sees the pin. Same-origin clients (admin, browsable API)
+  get the token as the db_pin cookie too, and the marker is also put in the
+  default cache, which covers other clients once the cache is shared
+  (REDIS_URL),
+- the view says so: `read_from = 'primary'` on a class-based view or
+  @read_from('primary') on a function view. `read_from = 'replica'` lets an
+  unsafe-method view that only reads use a replica.
+
+Management commands, workers and the shell never see a request context, so
+they always use the primary. One replica is picked per request, so a request
+never mixes the states of two replicas.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from monitoring.middleware import request_user_id
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'db:pin-primary:{}'
+PIN_COOKIE = 'db_pin'
+PIN_HEADER = 'X-DB-Pin'
+
+_request_state = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('request', 'override', 'replica', 'pinned', 'wrote', 'resolving')
+
+    def __init__(self, request):
+        self.request = request
+        self.override = None
+        self.replica = None
+        self.pinned = None
+        self.wrote = False
+        self.resolving = False
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def read_from(target):
+    """Per-view override for function views: @read_from('primary') or @read_from('replica')."""
+    if target not in ('primary', 'replica'):
+        raise ValueError("read_from() takes 'primary' or 'replica'")
+
+    def decorator(view):
+        view.read_from = target
+        return view
+    return decorator
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def _signer():
+    return signing.TimestampSigner(salt='lms_backend.routers.pin')
+
+
+def pin_user(user_id, response=None):
+    """Sends `user_id`'s reads to the primary for REPLICA_PIN_SECONDS, via `response`'s header and cookie and the cache."""
+    cache.set(PIN_KEY.format(user_id), True, timeout=pin_seconds())
+    if response is not None:
+        token = _signer().sign(str(user_id))
+        response[PIN_HEADER] = token
+        response.set_cookie(
+            PIN_COOKIE, token, max_age=pin_seconds(), httponly=True,
+            secure=settings.SESSION_COOKIE_SECURE, samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
+
+
+def is_pinned(request, user_id):
+    for token in (request.headers.get(PIN_HEADER), request.COOKIES.get(PIN_COOKIE)):
+        if not token:
+            continue
+        try:
+            if _signer().unsign(token, max_age=pin_seconds()) == str(user_id):
+                return True
+        except signing.BadSignature:
+            # Expired, tampered with, or signed with an old SECRET_KEY
+            pass
+    return cache.get(PIN_KEY.format(user_id)) is not None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or not replicas():
+            return DEFAULT_DB_ALIAS
+        if state.pinned is None:
+            if state.resolving:
+                # Loading the session user for the pin check reads too; let it go to the primary
+                return DEFAULT_DB_ALIAS
+            state.resolving = True
+            try:
+                state.pinned = self.needs_primary(state)
+            finally:
+                state.resolving = False
+        if state.pinned or state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = random.choice(replicas())
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+    @staticmethod
+    def needs_primary(state):
+        if state.override is not None:
+            return state.override == 'primary'
+        request = state.request
+        if request.method not in SAFE_METHODS:
+            return True
+        user_id = request_user_id(request)
+        return user_id is not None and is_pinned(request, user_id)
+
+
+class ReplicaRoutingMiddleware:
+    """Gives the router its per-request context and records writes for read-your-writes."""
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state.wrote:
+            user_id = request_user_id(request)
+            if user_id is not None:
+                pin_user(user_id, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request_state.get()
+        view = getattr(view_func, 'view_class', view_func)
+        override = getattr(view, 'read_from', None)
+        if state is not None and override is not None:
+            # Middleware may already have read (the session user); decide again for the view's reads
+            state.override = override
+            state.pinned = None
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 import dj_database_url
@@ -20,6 +21,9 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-7927^yj7$uvo#&gfdov3jf=s@^
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DEBUG', 'True') == 'True'
 
+# `manage.py test`: keeps the per-request log lines (monitoring) out of the test output
+TESTING = sys.argv[1:2] == ['test']
+
 _allowed_hosts_env = os.getenv('ALLOWED_HOSTS', '')
 ALLOWED_HOSTS = [
     'localhost', '127.0.0.1', 
@@ -42,6 +46,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'accounts',
     'lms.apps.LmsConfig',
+    'monitoring',
 ]
 
 # Only disable Django's static serving in production (let WhiteNoise handle it)
@@ -50,6 +55,15 @@ if not DEBUG:
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'monitoring.middleware.RequestMetricsMiddleware',
+    'monitoring.admission.AdmissionMiddleware',  # priority classes: throttle (429), queue or shed (503)
+    'monitoring.pool.PoolTimeoutMiddleware',  # pool checkout timeouts -> 503
+    'monitoring.deadlines.DeadlineMiddleware',  # per-endpoint budgets -> statement_timeout, 503/504
+    'lms_backend.routers.ReplicaRoutingMiddleware',  # no-op without DATABASE_REPLICA_URLS
+    'monitoring.nplusone.NPlusOneMiddleware',  # no-op unless NPLUSONE['ENABLED']
+    'monitoring.profiler.ProfilerMiddleware',  # only samples requests matching a ProfilingRule
+    'monitoring.slowqueries.SlowQueryMiddleware',
+    'monitoring.memory.MemoryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # For serving static files
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -62,6 +76,8 @@ MIDDLEWARE = [
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# The frontend reads the read-your-writes pin from this header and sends it back (lms_backend/routers.py)
+CORS_EXPOSE_HEADERS = ['X-DB-Pin']
 
 if not DEBUG:
     CSRF_TRUSTED_ORIGINS = [
@@ -79,6 +95,7 @@ if not DEBUG:
         "origin",
         "user-agent",
         "x-csrftoken",
+        "x-db-pin",
         "x-requested-with",
     ]
     CSRF_COOKIE_SAMESITE = 'None'
@@ -124,13 +141,54 @@ WSGI_APPLICATION = 'lms_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# On PostgreSQL each worker process keeps a psycopg 3 connection pool instead of one persistent
+# connection per thread. A gthread worker never needs more connections than it has threads, so the
+# pool is sized from the same GUNICORN_THREADS that gunicorn.conf.py uses, and the server sees at most
+# WEB_CONCURRENCY * DB_POOL_MAX connections (runworker resizes its own pools to --concurrency + 2: the
+# claim loop and the heartbeat hold a connection besides the job threads). Checkouts are health-checked
+# (CONN_HEALTH_CHECKS), so connections broken by a failover are replaced, and a checkout that waits
+# longer than DB_POOL_TIMEOUT becomes a 503 (monitoring.pool.PoolTimeoutMiddleware).
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '2'))
+DB_POOL = os.getenv('DB_POOL', 'True') == 'True'
+
 DATABASES = {
     'default': dj_database_url.config(
         default=f"postgresql://{os.getenv('DB_USER', 'postgres')}:{os.getenv('DB_PASSWORD', 'Sparky@45')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'lms_db')}",
-        conn_max_age=600
+        conn_max_age=0 if DB_POOL else 600,
+        conn_health_checks=True,
     )
 }
 
+if DB_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN', '1')),
+        'max_size': int(os.getenv('DB_POOL_MAX', str(GUNICORN_THREADS))),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '5')),    # seconds to wait for a free connection
+        'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),  # recycle connections (failover, leaks)
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),  # close idle connections above min_size
+        'name': 'default',
+    }
+
+# Read replicas: DATABASE_REPLICA_URLS="postgresql://...,postgresql://..." adds aliases replica1, replica2...
+# Safe-method requests read from one of them unless the request or its user wrote recently
+# (lms_backend/routers.py). In tests every replica mirrors the default database; locally any second
+# database (e.g. a copy of the SQLite file) can stand in for one.
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = dj_database_url.parse(url.strip(), conn_max_age=0 if DB_POOL else 600, conn_health_checks=True)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    if 'pool' in DATABASES['default'].get('OPTIONS', {}) and DATABASES[alias]['ENGINE'] == 'django.db.backends.postgresql':
+        DATABASES[alias].setdefault('OPTIONS', {})['pool'] = {**DATABASES['default']['OPTIONS']['pool'], 'name': alias}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['lms_backend.routers.PrimaryReplicaRouter']
+# Read-your-writes window after a user's write: a signed token in the write's X-DB-Pin response header,
+# which the frontend echoes back (it sends no cookies cross-origin), the same token as a 'db_pin' cookie for
+# same-origin clients, and a cache marker for any other client (only seen by every worker with a shared
+# cache, REDIS_URL).
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/zen/5.2/ref/settings/#auth-password-validators
@@ -189,11 +247,49 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # PERFORMANCE OPTIMIZATIONS (for 100+ concurrent users)
 # =============================================================================
 
+# --- Attendance partitions (lms/partitions.py) ---
+# On PostgreSQL DailyAttendanceLog is partitioned by month; `manage.py attendance_partitions`
+# (daily, or the lms.maintain_attendance_partitions job) keeps MONTHS_AHEAD partitions ready.
+# ARCHIVE_AFTER_MONTHS > 0 folds older months into AttendanceArchive and drops their partitions;
+# archived months leave the live attendance stats but stay in the attendance export. Months that
+# ended less than WRITE_WINDOW_DAYS ago are never archived: teachers still correct those registers.
+ATTENDANCE_PARTITIONS = {
+    'MONTHS_AHEAD': 3,
+    'ARCHIVE_AFTER_MONTHS': int(os.getenv('ATTENDANCE_ARCHIVE_AFTER_MONTHS', '0')),
+    'WRITE_WINDOW_DAYS': 31,
+}
+
+# --- Attendance bitmaps (lms.bitmaps) ---
+# One present/held bitset per student, course and term, kept next to the daily logs for
+# percentages, streaks and calendars. Terms start on the 1st of TERM_START_MONTH; after
+# changing it, run `manage.py attendance_bitmaps` to rebuild the bitmaps.
+ATTENDANCE_BITMAPS = {
+    'TERM_START_MONTH': int(os.getenv('ATTENDANCE_TERM_START_MONTH', '6')),
+}
+
+# --- Student import (lms.imports) ---
+# Staff CSV imports run in the job worker. HASH_WORKERS threads hash the passwords (0: one per CPU);
+# PBKDF2 costs about 0.2 s per password per core, so size the worker host for large imports.
+# Only hashers that release the GIL (imports.THREADED_HASHERS: PBKDF2) get the threads; with another
+# PASSWORD_HASHERS[0] the passwords are hashed one at a time.
+# PASSWORD_ITERATIONS > 0 hashes imported passwords with fewer iterations (at least
+# imports.MIN_PASSWORD_ITERATIONS, with a warning in the log); Django upgrades each one to full
+# strength on the student's first login.
+STUDENT_IMPORT = {
+    'HASH_WORKERS': int(os.getenv('IMPORT_HASH_WORKERS', '0')),
+    'PASSWORD_ITERATIONS': int(os.getenv('IMPORT_PASSWORD_ITERATIONS', '0')),
+}
+
 # --- Caching ---
 # LocMemCache: per-process in-memory cache. No Redis needed for ≤100 users.
+# Each gunicorn worker, the event consumer and the job worker then has its own copy:
+# cache deletes from the event consumer (lms/events.py) never reach the web workers,
+# so the writing worker runs the outbox handlers itself (EVENTS below) and the other
+# workers' copies go stale for their TTL. Set REDIS_URL to share one cache between
+# all processes once the site runs more than one of them.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'monitoring.cache.InstrumentedLocMemCache',  # LocMemCache + hit/miss counters
         'LOCATION': 'vetri-academy-cache',
         'TIMEOUT': 300,  # 5 minutes default TTL
         'OPTIONS': {
@@ -201,6 +297,22 @@ CACHES = {
         },
     }
 }
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'monitoring.cache.InstrumentedRedisCache',  # RedisCache + hit/miss counters
+        'LOCATION': os.getenv('REDIS_URL'),
+        'TIMEOUT': 300,
+    }
+
+# --- Outbox handlers (lms.events) ---
+# `manage.py process_events` (Procfile: events) runs the outbox handlers: cache deletes and badge grants.
+# INLINE_HANDLERS also runs them in the process that wrote the event, after its commit. Unset, that is
+# the case while the cache is not shared (LocMemCache), where the consumer's cache deletes could not
+# reach the web workers; it also keeps badges granted under runserver without the events process.
+# With a shared cache (REDIS_URL) badges are granted only by the events process, so run it.
+EVENTS = {
+    'INLINE_HANDLERS': {'true': True, 'false': False}.get(os.getenv('EVENTS_INLINE_HANDLERS', '').lower()),
+}
 
 # --- Sessions ---
 # Use cache-backed sessions instead of DB to avoid a query per request.
@@ -208,20 +320,134 @@ CACHES = {
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
 
+# --- Request instrumentation (monitoring app) ---
+# Sampled requests get a Server-Timing header (db / cache / ser / total), a JSON
+# log line on 'monitoring.requests' and feed the per-endpoint percentiles in the admin.
+REQUEST_METRICS = {
+    'SAMPLE_RATE': float(os.getenv('REQUEST_METRICS_SAMPLE_RATE', '1.0' if DEBUG else '0.1')),
+    'SERVER_TIMING': True,
+    'WINDOW': 500,          # samples kept per endpoint between flushes
+    'FLUSH_INTERVAL': 60,   # seconds between writes to EndpointMetric
+}
+
+# --- N+1 detector (monitoring.nplusone) ---
+# Logs lazy FK/reverse loads and repeated query shapes per request; RAISE turns them into errors.
+NPLUSONE = {
+    'ENABLED': os.getenv('NPLUSONE_ENABLED', str(DEBUG)) == 'True',
+    'THRESHOLD': 3,
+    'RAISE': os.getenv('NPLUSONE_RAISE', 'False') == 'True',
+}
+
+# --- Sampling profiler (monitoring.profiler) ---
+# Requests matching a ProfilingRule (admin) are stack-sampled and stored as flame profiles.
+PROFILER = {
+    'ENABLED': os.getenv('PROFILER_ENABLED', 'True') == 'True',
+    'INTERVAL_MS': 5,          # target sampling interval
+    'MAX_OVERHEAD': 0.01,      # share of wall time the sampler may spend; stretches the interval
+    'MAX_CONCURRENT': 2,       # profiled requests at once, per worker process
+    'MAX_PER_MINUTE': 10,      # profiled requests per minute, per worker process
+    'MAX_SAMPLES': 6000,       # per request; further samples are dropped and the profile marked truncated
+    'RULES_TTL': 30,           # seconds between reloads of the rules
+}
+
+# --- Slow-query capture (monitoring.slowqueries) ---
+# Queries over the threshold are stored with call site, params hash and EXPLAIN plan; admin → Slow queries.
+SLOW_QUERIES = {
+    'ENABLED': os.getenv('SLOW_QUERIES_ENABLED', 'True') == 'True',
+    'THRESHOLD_MS': float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '100')),
+    'EXPLAIN': True,
+    'EXPLAIN_INTERVAL': 3600,  # seconds before a fingerprint is explained again (per worker)
+    'BUFFER': 1000,            # captures kept between flushes; the oldest are dropped beyond this
+    'FLUSH_INTERVAL': 60,      # seconds between writes to SlowQuery
+}
+
+# --- Request deadlines (monitoring.deadlines) ---
+# Each view gets a budget: queries and cache reads fail fast once it is spent, and on PostgreSQL the
+# remaining budget becomes the connection's statement_timeout. Keys are endpoint names as shown under
+# Endpoint metrics; keep every budget well below gunicorn's 120 s timeout.
+REQUEST_DEADLINES = {
+    'ENABLED': os.getenv('REQUEST_DEADLINES_ENABLED', 'True') == 'True',
+    'DEFAULT_MS': int(os.getenv('REQUEST_DEADLINE_MS', '30000')),
+    'ENDPOINTS': {
+        'GET api/lms/dashboard/': 10000,
+        'GET api/lms/leaderboard/course/': 10000,
+        'GET api/lms/attendance/all-logs/': 20000,
+        'GET api/lms/attendance/export/<int:enrollment_id>/': 60000,
+        'GET api/lms/attendance/export/me/': 60000,
+    },
+}
+
+# --- Admission control (monitoring.admission) ---
+# Under overload, lower classes are queued briefly and then shed (503 + Retry-After) so the health
+# check, logins and submissions keep getting through. LIMIT: in-flight requests of the class per
+# worker; MAX_QUEUE_MS: wait in front of the app (X-Request-Start from the proxy) plus wait for a
+# slot; RATE: per-user token bucket (refill per second, burst) -> 429; ANON_RATE: the same per client
+# address for anonymous calls (defaults to RATE). Logins come from whole schools behind one NAT address,
+# so the high class allows a school's morning rush per address. The buckets live in the default cache,
+# so RATE and ANON_RATE are only enforced with a shared one (REDIS_URL); with the per-process
+# LocMemCache rate limiting is off. None turns a setting off. Counters per worker: /api/monitoring/admission/.
+ADMISSION = {
+    'ENABLED': os.getenv('ADMISSION_ENABLED', 'True') == 'True',
+    'DEFAULT_CLASS': 'normal',
+    'CLASSES': {
+        'critical': {'LIMIT': None, 'MAX_QUEUE_MS': None, 'RATE': None},
+        'high': {'LIMIT': None, 'MAX_QUEUE_MS': 15000, 'RATE': (5, 60), 'ANON_RATE': (20, 1200)},
+        'normal': {'LIMIT': None, 'MAX_QUEUE_MS': 5000, 'RATE': (5, 50)},
+        # Polls: 15 at once, then one a second
+        'low': {'LIMIT': max(1, GUNICORN_THREADS // 2), 'MAX_QUEUE_MS': 1000, 'RATE': (1, 15)},
+    },
+    'ENDPOINTS': {
+        'GET ': 'critical',   # health check
+        'HEAD ': 'critical',
+        'POST api/accounts/login/': 'high',
+        'POST api/accounts/token/refresh/': 'high',
+        'POST api/accounts/register/': 'high',
+        'GET api/lms/courses/': 'high',
+        'POST api/lms/competitions/submit/<int:competition_id>/': 'high',
+        'POST api/lms/daily-challenges/submit/': 'high',
+        'POST api/lms/attendance/mark/': 'high',
+        'POST api/lms/teacher/attendance/mark/': 'high',
+        # Polled or heavy reads
+        'GET api/lms/dashboard/': 'low',
+        'GET api/lms/teacher/dashboard/': 'low',
+        'GET api/lms/gamification/': 'low',
+        'GET api/lms/leaderboard/course/': 'low',
+        'GET api/lms/competitions/leaderboard/<int:competition_id>/': 'low',
+        'GET api/lms/attendance/all-logs/': 'low',
+        'GET api/lms/attendance/export/<int:enrollment_id>/': 'low',
+        'GET api/lms/attendance/export/me/': 'low',
+    },
+}
+
+# --- Worker memory (monitoring.memory) ---
+# Per-endpoint RSS growth and a MemorySample row per worker every SAMPLE_INTERVAL seconds.
+# TRACEMALLOC adds per-endpoint peak allocation and the top-growth report at /api/monitoring/memory/,
+# at a noticeable CPU cost, so switch it on for one deployment at a time.
+MEMORY = {
+    'ENABLED': os.getenv('MEMORY_ENABLED', 'True') == 'True',
+    'TRACEMALLOC': os.getenv('MEMORY_TRACEMALLOC', 'False') == 'True',
+    'TRACEMALLOC_FRAMES': 10,  # stack depth kept per allocation; more frames cost more memory
+    'SAMPLE_INTERVAL': 300,
+    'TOP': 25,                 # default number of allocation sites in the report
+}
+
 # --- Logging (debug query counts in development) ---
-if DEBUG:
-    LOGGING = {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'handlers': {
-            'console': {
-                'class': 'logging.StreamHandler',
-            },
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
         },
-        'loggers': {
-            'django.db.backends': {
-                'level': 'WARNING',  # Set to 'DEBUG' to see all SQL queries
-                'handlers': ['console'],
-            },
+    },
+    'loggers': {
+        'django.db.backends': {
+            'level': 'WARNING',  # Set to 'DEBUG' to see all SQL queries
+            'handlers': ['console'],
         },
-    }
+        'monitoring': {
+            'level': os.getenv('MONITORING_LOG_LEVEL', 'WARNING' if TESTING else 'INFO'),
+            'handlers': ['console'],
+        },
+    },
+}
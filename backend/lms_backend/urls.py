@@ -12,6 +12,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/accounts/', include('accounts.urls')),
     path('api/lms/', include('lms.urls')),
+    path('api/monitoring/', include('monitoring.urls')),
 ]
 
 if settings.DEBUG:
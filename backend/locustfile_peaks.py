@@ -0,0 +1,359 @@
+"""
+Peak-traffic load profiles for Vetri Academy.
+
+Unlike locustfile.py (steady browsing by freshly registered users), these users
+log in as the accounts created by `python manage.py generate_dataset`, so run
+against a seeded local database:
+
+    python manage.py generate_dataset --scale 1
+    gunicorn lms_backend.wsgi -c gunicorn.conf.py
+    LOADTEST_PROFILE=contest locust -f locustfile_peaks.py --host=http://127.0.0.1:8000 --headless
+    LOADTEST_PROFILE=morning locust -f locustfile_peaks.py --host=http://127.0.0.1:8000 --headless
+
+Profiles (WaveShape):
+    contest  Waves of contestants who all start the same competition within a few
+             seconds, answer for under a minute and submit, over background browsing.
+    morning  Every teacher opens a roster and marks attendance at once (9 am)
+             while students check their dashboards before class.
+
+When the run ends, p95/p99 and the error rate of every endpoint in SLOS are
+checked; the process exits non-zero if any budget is missed. Set
+LOADTEST_SLO_REPORT=path.json to also write the verdicts as JSON.
+"""
+
+import itertools
+import json
+import os
+import random
+import time
+from datetime import date
+
+from locust import HttpUser, LoadTestShape, between, events, task
+import requests  # after locust, which has to monkey-patch ssl first
+
+PROFILE = os.getenv("LOADTEST_PROFILE", "contest")
+PASSWORD = os.getenv("LOADTEST_PASSWORD", "DatasetPass123!")
+EMAIL_DOMAIN = "dataset.invalid"
+STUDENTS = int(os.getenv("LOADTEST_STUDENTS", "5000"))  # generate_dataset: 5,000 per --scale
+TEACHERS = int(os.getenv("LOADTEST_TEACHERS", "12"))    # generate_dataset: 12 per --scale
+CONTEST_ID = os.getenv("LOADTEST_CONTEST_ID")           # default: resolved once at test start, see resolve_contest()
+
+BACKGROUND_USERS = int(os.getenv("LOADTEST_BACKGROUND_USERS", "20"))
+WAVE_USERS = int(os.getenv("LOADTEST_WAVE_USERS", "300"))
+WAVES = int(os.getenv("LOADTEST_WAVES", "3"))
+MORNING_STUDENTS = int(os.getenv("LOADTEST_MORNING_STUDENTS", "150"))
+
+# Request name -> (p95 ms, p99 ms). Every endpoint may also fail at most MAX_FAILURE_RATIO of the time.
+SLOS = {
+    "/api/accounts/login/": (800, 1500),
+    "/api/lms/dashboard/": (500, 1000),
+    "/api/lms/gamification/": (300, 600),
+    "/api/lms/competitions/": (400, 800),
+    "/api/lms/competitions/join/[id]/": (300, 600),
+    "/api/lms/competitions/questions/[id]/": (300, 600),
+    "/api/lms/competitions/start/[id]/": (300, 600),
+    "/api/lms/competitions/submit/[id]/": (500, 1000),
+    "/api/lms/competitions/leaderboard/[id]/": (300, 600),
+    "/api/lms/teacher/dashboard/": (300, 600),
+    "/api/lms/teacher/students/ [roster]": (800, 1500),
+    "/api/lms/teacher/attendance/mark/": (500, 1000),
+}
+MAX_FAILURE_RATIO = 0.01
+
+# Accounts are handed out in order so concurrent users never share one
+_student_numbers = itertools.count()
+_teacher_numbers = itertools.count()
+
+
+def next_student():
+    return next(_student_numbers) % STUDENTS
+
+
+class DatasetUser(HttpUser):
+    """Logs in as a generated account and sends its JWT on every request."""
+
+    abstract = True
+    token = None
+
+    def login(self, email):
+        response = self.client.post("/api/accounts/login/", json={
+            "email": email,
+            "password": PASSWORD
+        }, name="/api/accounts/login/")
+        if response.status_code == 200:
+            self.token = response.json().get("access")
+
+    @property
+    def auth_headers(self):
+        if self.token:
+            return {"Authorization": f"Bearer {self.token}"}
+        return {}
+
+    def expect_already(self, response):
+        """'Already joined/completed/submitted' is a normal answer for a seeded account, not an error."""
+        if response.status_code == 400 and "already" in response.text.lower():
+            response.success()
+            return True
+        return False
+
+
+# =============================================================================
+# STUDENTS
+# =============================================================================
+
+class BrowsingStudent(DatasetUser):
+    """Background traffic: students looking around between peaks."""
+
+    wait_time = between(2, 8)
+
+    def on_start(self):
+        self.login(f"student{next_student()}@{EMAIL_DOMAIN}")
+
+    @task(5)
+    def view_dashboard(self):
+        self.client.get("/api/lms/dashboard/", headers=self.auth_headers, name="/api/lms/dashboard/")
+
+    @task(3)
+    def view_gamification(self):
+        self.client.get("/api/lms/gamification/", headers=self.auth_headers, name="/api/lms/gamification/")
+
+    @task(2)
+    def view_competitions(self):
+        self.client.get("/api/lms/competitions/", headers=self.auth_headers, name="/api/lms/competitions/")
+
+
+class MorningStudent(BrowsingStudent):
+    """The same browsing, by the extra students who check in before class."""
+
+    weight = MORNING_STUDENTS
+
+
+class Contestant(DatasetUser):
+    """
+    Joins the contest, loads the questions, starts, answers for 20-50 s and submits,
+    then keeps refreshing the leaderboard. A wave of these arrives within seconds.
+    """
+
+    wait_time = between(5, 15)
+    weight = WAVE_USERS
+    contest_id = None
+    finished = False
+
+    def on_start(self):
+        self.login(f"student{next_student()}@{EMAIL_DOMAIN}")
+        self.contest_id = CONTEST_ID
+
+    def contest_url(self, action):
+        return f"/api/lms/competitions/{action}/{self.contest_id}/", f"/api/lms/competitions/{action}/[id]/"
+
+    @task
+    def take_contest(self):
+        if self.contest_id is None:
+            return
+        if self.finished:
+            url, name = self.contest_url("leaderboard")
+            self.client.get(url, headers=self.auth_headers, name=name)
+            return
+
+        url, name = self.contest_url("join")
+        with self.client.post(url, headers=self.auth_headers, name=name, catch_response=True) as response:
+            self.expect_already(response)
+
+        url, name = self.contest_url("questions")
+        with self.client.get(url, headers=self.auth_headers, name=name, catch_response=True) as response:
+            if self.expect_already(response):
+                self.finished = True
+                return
+            questions = response.json().get("questions", []) if response.status_code == 200 else []
+
+        url, name = self.contest_url("start")
+        with self.client.post(url, headers=self.auth_headers, name=name, catch_response=True) as response:
+            if self.expect_already(response):
+                self.finished = True
+                return
+
+        # Answering; locust patches time.sleep to yield to other users
+        time.sleep(random.uniform(20, 50))
+
+        answers = {str(q["id"]): random.choice("ABCD") for q in questions}
+        url, name = self.contest_url("submit")
+        with self.client.post(url, json={"answers": answers}, headers=self.auth_headers, name=name,
+                              catch_response=True) as response:
+            self.expect_already(response)
+        self.finished = True
+
+
+@events.test_start.add_listener
+def resolve_contest(environment, **kwargs):
+    """
+    Picks the one contest every wave attacks, unless LOADTEST_CONTEST_ID is set:
+    the lowest-id quiz open to all courses, else the lowest-id quiz. Students
+    only see the competitions of their own courses, so asking as a teacher keeps
+    the whole run (and every locust worker) on the same contest.
+    """
+    global CONTEST_ID
+    if CONTEST_ID or PROFILE != "contest":
+        return
+    login = requests.post(f"{environment.host}/api/accounts/login/",
+                          json={"email": f"teacher0@{EMAIL_DOMAIN}", "password": PASSWORD}, timeout=30)
+    login.raise_for_status()
+    response = requests.get(f"{environment.host}/api/lms/competitions/",
+                            headers={"Authorization": f"Bearer {login.json()['access']}"}, timeout=30)
+    response.raise_for_status()
+    quizzes = sorted((c["course"] is not None, c["id"]) for c in response.json() if c.get("mode_type") == "quiz")
+    if not quizzes:
+        raise RuntimeError("No quiz competition in the dataset; set LOADTEST_CONTEST_ID.")
+    CONTEST_ID = str(quizzes[0][1])
+    print(f"Contest profile: every wave takes competition #{CONTEST_ID}")
+
+
+# =============================================================================
+# TEACHERS
+# =============================================================================
+
+class Teacher(DatasetUser):
+    """Opens each assigned course's roster for today and marks the whole class, then checks in occasionally."""
+
+    wait_time = between(20, 60)
+    weight = TEACHERS
+    course_ids = ()
+    marked = False
+
+    def on_start(self):
+        self.login(f"teacher{next(_teacher_numbers) % TEACHERS}@{EMAIL_DOMAIN}")
+        response = self.client.get("/api/lms/teacher/dashboard/", headers=self.auth_headers,
+                                   name="/api/lms/teacher/dashboard/")
+        if response.status_code == 200:
+            self.course_ids = [c["course"] for c in response.json().get("assigned_courses", [])]
+
+    @task
+    def morning_register(self):
+        if self.marked:
+            self.client.get("/api/lms/teacher/dashboard/", headers=self.auth_headers,
+                            name="/api/lms/teacher/dashboard/")
+            return
+
+        today = date.today().isoformat()
+        for course_id in self.course_ids:
+            response = self.client.get(
+                f"/api/lms/teacher/students/?course_id={course_id}&date={today}",
+                headers=self.auth_headers,
+                name="/api/lms/teacher/students/ [roster]"
+            )
+            if response.status_code != 200:
+                continue
+            self.client.post("/api/lms/teacher/attendance/mark/", json={
+                "course_id": course_id,
+                "date": today,
+                "attendance": [
+                    {"student_id": row["student_details"]["id"],
+                     "status": "present" if random.random() < 0.9 else "absent"}
+                    for row in response.json()
+                ]
+            }, headers=self.auth_headers, name="/api/lms/teacher/attendance/mark/")
+            # Calling the register takes a minute or two per class
+            time.sleep(random.uniform(5, 15))
+        self.marked = True
+
+
+# =============================================================================
+# LOAD SHAPE
+# =============================================================================
+
+def contest_stages():
+    """Background browsing, then WAVES synchronized contest waves each followed by a lull."""
+    stages = [(30, BACKGROUND_USERS, BACKGROUND_USERS, [BrowsingStudent])]
+    for _ in range(WAVES):
+        # The whole wave arrives within ~5 seconds and stays until everyone has submitted
+        stages.append((120, BACKGROUND_USERS + WAVE_USERS, max(WAVE_USERS / 5, 1), [Contestant]))
+        stages.append((60, BACKGROUND_USERS, WAVE_USERS, [BrowsingStudent]))
+    return stages
+
+
+def morning_stages():
+    """Quiet start, then every teacher and a crowd of students at 9 am, tailing off."""
+    return [
+        (30, BACKGROUND_USERS, BACKGROUND_USERS, [BrowsingStudent]),
+        (300, BACKGROUND_USERS + TEACHERS + MORNING_STUDENTS, max((TEACHERS + MORNING_STUDENTS) / 10, 1),
+         [MorningStudent, Teacher]),
+        (120, BACKGROUND_USERS, MORNING_STUDENTS, [BrowsingStudent]),
+    ]
+
+
+PROFILES = {
+    "contest": contest_stages,
+    "morning": morning_stages,
+}
+
+
+class WaveShape(LoadTestShape):
+    """
+    Runs the stages of LOADTEST_PROFILE in order: (duration s, users, spawn rate, user classes).
+
+    Locust keeps running users when the class list changes, adds new users from the
+    listed classes by weight, and stops the most recently started ones first. So a
+    peak stage lists only the classes it adds on top of the background (weighted by
+    head count), and the following lull drops exactly those again.
+    """
+
+    def __init__(self):
+        super().__init__()
+        if PROFILE not in PROFILES:
+            raise ValueError(f"Unknown LOADTEST_PROFILE {PROFILE!r}; choose from {', '.join(PROFILES)}")
+        self.stages = PROFILES[PROFILE]()
+
+    def tick(self):
+        elapsed = self.get_run_time()
+        for duration, users, spawn_rate, user_classes in self.stages:
+            if elapsed < duration:
+                return users, spawn_rate, user_classes
+            elapsed -= duration
+        return None
+
+
+# =============================================================================
+# SLO REPORT
+# =============================================================================
+
+def evaluate_slos(stats):
+    verdicts = []
+    for name, (p95_budget, p99_budget) in SLOS.items():
+        entry = next((e for (n, _), e in stats.entries.items() if n == name), None)
+        if entry is None or entry.num_requests == 0:
+            verdicts.append({"endpoint": name, "requests": 0, "passed": None})
+            continue
+        p95 = entry.get_response_time_percentile(0.95)
+        p99 = entry.get_response_time_percentile(0.99)
+        failure_ratio = entry.num_failures / entry.num_requests
+        verdicts.append({
+            "endpoint": name,
+            "requests": entry.num_requests,
+            "p95_ms": p95, "p95_budget_ms": p95_budget,
+            "p99_ms": p99, "p99_budget_ms": p99_budget,
+            "failure_ratio": round(failure_ratio, 4),
+            "passed": p95 <= p95_budget and p99 <= p99_budget and failure_ratio <= MAX_FAILURE_RATIO,
+        })
+    return verdicts
+
+
+@events.quitting.add_listener
+def report_slos(environment, **kwargs):
+    verdicts = evaluate_slos(environment.stats)
+    print(f"\nSLO report ({PROFILE} profile)")
+    print(f"{'endpoint':<45} {'reqs':>7} {'p95':>12} {'p99':>12} {'errors':>7}  result")
+    for v in verdicts:
+        if v["passed"] is None:
+            print(f"{v['endpoint']:<45} {0:>7} {'':>12} {'':>12} {'':>7}  no data")
+            continue
+        print(
+            f"{v['endpoint']:<45} {v['requests']:>7} "
+            f"{v['p95_ms']:>5.0f}/{v['p95_budget_ms']:<6} {v['p99_ms']:>5.0f}/{v['p99_budget_ms']:<6} "
+            f"{v['failure_ratio']:>7.1%}  {'PASS' if v['passed'] else 'FAIL'}"
+        )
+
+    if os.getenv("LOADTEST_SLO_REPORT"):
+        with open(os.environ["LOADTEST_SLO_REPORT"], "w") as fh:
+            json.dump({"profile": PROFILE, "slos": verdicts}, fh, indent=2)
+
+    if any(v["passed"] is False for v in verdicts):
+        environment.process_exit_code = 1
@@ -0,0 +1,225 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib import admin
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from . import flamegraph
+from .metrics import percentile
+from .models import DeadlineHit, EndpointMetric, MemorySample, Profile, ProfilingRule, SlowQuery
+from .profiler import format_collapsed, parse_collapsed
+
+
+@admin.register(EndpointMetric)
+class EndpointMetricAdmin(admin.ModelAdmin):
+    list_display = ('endpoint', 'window_end', 'requests', 'p50_ms', 'p95_ms', 'p99_ms', 'avg_queries', 'max_queries', 'avg_db_ms', 'cache_hit_ratio', 'worker')
+    list_filter = ('endpoint',)
+    search_fields = ('endpoint',)
+    date_hierarchy = 'window_end'
+    change_list_template = 'admin/monitoring/endpointmetric/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Worst window per endpoint over the last hour, slowest first
+        summary = (
+            EndpointMetric.objects.filter(window_end__gte=timezone.now() - timedelta(hours=1))
+            .values('endpoint')
+            .annotate(
+                total_requests=Sum('requests'),
+                worst_p95=Max('p95_ms'),
+                worst_p99=Max('p99_ms'),
+                mean_queries=Avg('avg_queries'),
+                peak_queries=Max('max_queries'),
+            )
+            .order_by('-worst_p95')
+        )
+        extra_context = extra_context or {}
+        extra_context['endpoint_summary'] = summary
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(ProfilingRule)
+class ProfilingRuleAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'endpoint', 'user', 'sample_rate', 'enabled', 'expires_at', 'profile_count', 'created_at')
+    list_filter = ('enabled',)
+    search_fields = ('endpoint',)
+    raw_id_fields = ('user',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(num_profiles=Count('profiles'))
+
+    @admin.display(description='Profiles', ordering='num_profiles')
+    def profile_count(self, obj):
+        return obj.num_profiles
+
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ('endpoint', 'started_at', 'duration_ms', 'status_code', 'samples', 'interval_ms', 'truncated', 'user', 'worker', 'links')
+    list_filter = ('endpoint', 'truncated')
+    list_select_related = ('user',)
+    date_hierarchy = 'started_at'
+    exclude = ('stacks',)
+    actions = ['download_merged']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('<int:profile_id>/flamegraph/', self.admin_site.admin_view(self.flamegraph_view), name='monitoring_profile_flamegraph'),
+            path('<int:profile_id>/collapsed/', self.admin_site.admin_view(self.collapsed_view), name='monitoring_profile_collapsed'),
+        ]
+        return urls + super().get_urls()
+
+    @admin.display(description='Stacks')
+    def links(self, obj):
+        return format_html(
+            '<a href="{}">flame graph</a> | <a href="{}">collapsed</a>',
+            reverse('admin:monitoring_profile_flamegraph', args=[obj.pk]),
+            reverse('admin:monitoring_profile_collapsed', args=[obj.pk]),
+        )
+
+    def flamegraph_view(self, request, profile_id):
+        profile = get_object_or_404(Profile, pk=profile_id)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f'Flame graph: {profile}',
+            'profile': profile,
+            'svg': mark_safe(flamegraph.render(parse_collapsed(profile.stacks), title=str(profile))),
+        }
+        return TemplateResponse(request, 'admin/monitoring/profile/flamegraph.html', context)
+
+    def collapsed_view(self, request, profile_id):
+        profile = get_object_or_404(Profile, pk=profile_id)
+        return self.collapsed_response(profile.stacks + '\n', f'profile-{profile.pk}.collapsed')
+
+    @admin.action(description='Download merged collapsed stacks')
+    def download_merged(self, request, queryset):
+        merged = Counter()
+        for stacks in queryset.values_list('stacks', flat=True):
+            merged.update(parse_collapsed(stacks))
+        return self.collapsed_response(format_collapsed(merged) + '\n', 'profiles-merged.collapsed')
+
+    @staticmethod
+    def collapsed_response(text, filename):
+        response = HttpResponse(text, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'duration_ms', 'endpoint', 'call_site', 'params_hash', 'has_plan', 'captured_at', 'worker')
+    list_filter = ('endpoint',)
+    search_fields = ('fingerprint', 'sql', 'call_site')
+    date_hierarchy = 'captured_at'
+    change_list_template = 'admin/monitoring/slowquery/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def lookup_allowed(self, lookup, value, request):
+        # The summary links to ?fingerprint=...
+        return lookup == 'fingerprint' or super().lookup_allowed(lookup, value, request)
+
+    @admin.display(description='Plan', boolean=True)
+    def has_plan(self, obj):
+        return bool(obj.plan)
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['fingerprint_summary'] = self.fingerprint_summary(timezone.now() - timedelta(hours=24))
+        return super().changelist_view(request, extra_context=extra_context)
+
+    @staticmethod
+    def fingerprint_summary(since, limit=25):
+        """Per fingerprint over the window: count, p95/max time, distinct params, latest SQL/call site and plan."""
+        recent = SlowQuery.objects.filter(captured_at__gte=since)
+        rows = list(
+            recent.values('fingerprint')
+            .annotate(
+                count=Count('id'),
+                max_ms=Max('duration_ms'),
+                total_ms=Sum('duration_ms'),
+                distinct_params=Count('params_hash', distinct=True),
+                latest_id=Max('id'),
+                plan_id=Max('id', filter=~Q(plan='')),
+            )
+            .order_by('-total_ms')[:limit]
+        )
+        fingerprints = [row['fingerprint'] for row in rows]
+        durations = {}
+        for key, duration in recent.filter(fingerprint__in=fingerprints).values_list('fingerprint', 'duration_ms'):
+            durations.setdefault(key, []).append(duration)
+        latest = SlowQuery.objects.in_bulk([row['latest_id'] for row in rows])
+        for row in rows:
+            row['p95_ms'] = percentile(durations[row['fingerprint']], 95)
+            row['sql'] = latest[row['latest_id']].sql
+            row['endpoint'] = latest[row['latest_id']].endpoint
+            row['call_site'] = latest[row['latest_id']].call_site
+        return rows
+
+
+@admin.register(MemorySample)
+class MemorySampleAdmin(admin.ModelAdmin):
+    list_display = ('worker', 'sampled_at', 'requests', 'rss_kb', 'traced_kb', 'traced_peak_kb', 'gc_collections', 'cache_entries', 'cache_kb')
+    list_filter = ('worker',)
+    date_hierarchy = 'sampled_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DeadlineHit)
+class DeadlineHitAdmin(admin.ModelAdmin):
+    list_display = ('endpoint', 'kind', 'budget_ms', 'elapsed_ms', 'user', 'worker', 'occurred_at')
+    list_filter = ('kind', 'endpoint')
+    list_select_related = ('user',)
+    date_hierarchy = 'occurred_at'
+    change_list_template = 'admin/monitoring/deadlinehit/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Endpoints that hit their deadline in the last 24 hours, most hits first
+        summary = (
+            DeadlineHit.objects.filter(occurred_at__gte=timezone.now() - timedelta(hours=24))
+            .values('endpoint')
+            .annotate(
+                hits=Count('id'),
+                cancelled=Count('id', filter=Q(kind='statement')),
+                budget=Max('budget_ms'),
+                worst_elapsed=Max('elapsed_ms'),
+            )
+            .order_by('-hits')
+        )
+        extra_context = extra_context or {}
+        extra_context['deadline_summary'] = summary
+        return super().changelist_view(request, extra_context=extra_context)
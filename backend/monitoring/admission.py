@@ -0,0 +1,237 @@
+"""
+Admission control and load shedding.
+
+When a worker is saturated, requests pile up in front of it until gunicorn's
+timeout, cheap ones (the health check, /courses/) included. AdmissionMiddleware
+decides per request, before the view runs, using the endpoint's priority class
+(ADMISSION['ENDPOINTS'], keyed like EndpointMetric; everything else is
+DEFAULT_CLASS). Each class in ADMISSION['CLASSES'] has:
+- LIMIT: in-flight requests of the class per worker process. Keeping polls
+  below the thread count leaves threads for logins and submissions. A request
+  over the limit waits for a slot;
+- MAX_QUEUE_MS: how long a request may have waited before it runs: the time
+  in front of the app (X-Request-Start, set by the proxy as t=<epoch s/ms/us>)
+  plus the wait for a slot. Older requests are shed with 503 + Retry-After,
+  since their client has most likely given up;
+- RATE: (requests per second, burst) per user and class: a token bucket that
+  holds up to `burst` tokens and refills at `rate` per second; a request takes
+  a token, or is answered with 429 + Retry-After when none is left. ANON_RATE is the same for anonymous calls, counted per client
+  address; a whole school can share one address behind its NAT, so it
+  defaults to RATE but is set much higher for the login class.
+None switches a setting off for the class.
+
+The buckets live in the default cache as (tokens, last refill) pairs. The
+read and the write are not one atomic step, so concurrent requests of one
+client may both take its last token; the limit errs by the client's requests
+in flight, never against it. Rate limits need a cache every worker shares
+(REDIS_URL): a per-process LocMemCache would give each worker a bucket of its
+own, and the workers do not see even shares of a client's requests, so RATE
+and ANON_RATE are not enforced without one.
+
+Counters per class (admitted, queued, shed, throttled, queue times) are kept
+per worker and served at /api/monitoring/admission/.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+
+from .cache import cache_is_shared
+from .metrics import worker_id
+from .middleware import endpoint_name, request_user_id
+
+logger = logging.getLogger('monitoring.admission')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DEFAULT_CLASS': 'normal',
+    'CLASSES': {'normal': {}},
+    'ENDPOINTS': {},
+}
+RETRY_AFTER = 5
+BUCKET_KEY = 'throttle:{}:{}'
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'ADMISSION', {})}
+
+
+def upstream_queue_ms(request):
+    """Time since the proxy received the request (X-Request-Start), or 0 without the header."""
+    value = request.META.get('HTTP_X_REQUEST_START')
+    if not value:
+        return 0.0
+    try:
+        started = float(value.removeprefix('t='))
+    except ValueError:
+        return 0.0
+    # Proxies differ in the unit: seconds (nginx $msec), milliseconds or microseconds
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    # Clock skew between proxy and app must not shed anything
+    return max(0.0, (time.time() - started) * 1000)
+
+
+def client_key(request, user_id):
+    if user_id is not None:
+        return f'user:{user_id}'
+    # The proxy appends the address it saw; earlier entries come from the client
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    return f"ip:{forwarded.rsplit(',', 1)[-1].strip() or request.META.get('REMOTE_ADDR', '')}"
+
+
+def take_token(key, rate, burst):
+    """
+    Takes a token from `key`'s bucket, which holds up to `burst` tokens and
+    refills at `rate` per second; returns 0, or the seconds until the next
+    token when the bucket is empty.
+    """
+    now = time.time()
+    tokens, refilled_at = cache.get(key) or (burst, now)
+    tokens = min(burst, tokens + max(0.0, now - refilled_at) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    # Once it has expired the bucket would be full again anyway
+    cache.set(key, (tokens - 1, now), timeout=math.ceil(burst / rate) + 1)
+    return 0
+
+
+class PriorityClass:
+    def __init__(self, name, lock, LIMIT=None, MAX_QUEUE_MS=None, RATE=None, ANON_RATE=None):
+        self.name = name
+        self.limit = LIMIT
+        self.max_queue_ms = MAX_QUEUE_MS
+        self.rate = RATE
+        self.anon_rate = ANON_RATE or RATE
+        self.slot_free = threading.Condition(lock)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.queue_ms = 0.0
+        self.max_seen_queue_ms = 0.0
+        self.shed = 0
+        self.throttled = 0
+
+    def as_dict(self):
+        return {
+            'limit': self.limit,
+            'max_queue_ms': self.max_queue_ms,
+            'rate': self.rate,
+            'anon_rate': self.anon_rate,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'avg_queue_ms': round(self.queue_ms / self.admitted, 1) if self.admitted else 0.0,
+            'max_queue_ms_seen': round(self.max_seen_queue_ms, 1),
+            'shed_503': self.shed,
+            'throttled_429': self.throttled,
+        }
+
+
+class AdmissionController:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.classes = {}
+        self.rate_limits = False
+
+    def configure(self, classes):
+        with self.lock:
+            self.classes = {name: PriorityClass(name, self.lock, **options) for name, options in classes.items()}
+
+    def admit(self, priority, waited_ms):
+        """Takes a slot for `priority`, waiting while the class is full; False when the request is to be shed."""
+        with self.lock:
+            budget_ms = None if priority.max_queue_ms is None else priority.max_queue_ms - waited_ms
+            if budget_ms is not None and budget_ms <= 0:
+                priority.shed += 1
+                return False
+            if priority.limit is not None and priority.in_flight >= priority.limit:
+                priority.queued += 1
+                start = time.monotonic()
+                has_slot = priority.slot_free.wait_for(
+                    lambda: priority.in_flight < priority.limit,
+                    timeout=None if budget_ms is None else budget_ms / 1000,
+                )
+                if not has_slot:
+                    priority.shed += 1
+                    return False
+                waited_ms += (time.monotonic() - start) * 1000
+            priority.in_flight += 1
+            priority.peak_in_flight = max(priority.peak_in_flight, priority.in_flight)
+            priority.admitted += 1
+            priority.queue_ms += waited_ms
+            priority.max_seen_queue_ms = max(priority.max_seen_queue_ms, waited_ms)
+            return True
+
+    def release(self, priority):
+        with self.lock:
+            priority.in_flight -= 1
+            priority.slot_free.notify()
+
+    def throttled(self, priority):
+        with self.lock:
+            priority.throttled += 1
+
+    def stats(self):
+        with self.lock:
+            return {'worker': worker_id(), 'rate_limits': self.rate_limits, 'classes': {name: p.as_dict() for name, p in self.classes.items()}}
+
+
+controller = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """Throttles, queues or sheds each request by its endpoint's priority class. Removed when disabled."""
+
+    def __init__(self, get_response):
+        conf = config()
+        if not conf['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.default_class = conf['DEFAULT_CLASS']
+        self.endpoints = conf['ENDPOINTS']
+        controller.configure(conf['CLASSES'])
+        # A per-process cache would give every worker a bucket of its own for each client
+        controller.rate_limits = cache_is_shared()
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            priority = request.__dict__.pop('_admission', None)
+            if priority is not None:
+                controller.release(priority)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        endpoint = endpoint_name(request)
+        priority = controller.classes[self.endpoints.get(endpoint, self.default_class)]
+
+        user_id = request_user_id(request)
+        limit = priority.rate if user_id is not None else priority.anon_rate
+        if limit is not None and controller.rate_limits:
+            rate, burst = limit
+            client = client_key(request, user_id)
+            wait = take_token(BUCKET_KEY.format(priority.name, client), rate, burst)
+            if wait:
+                controller.throttled(priority)
+                logger.info("Throttled %s on %s", client, endpoint)
+                response = JsonResponse({"detail": "Too many requests, please slow down."}, status=429)
+                response['Retry-After'] = str(math.ceil(wait))
+                return response
+
+        if not controller.admit(priority, upstream_queue_ms(request)):
+            logger.warning("Shed %s (%s class) under load", endpoint, priority.name)
+            response = JsonResponse({"detail": "The server is busy, please retry shortly."}, status=503)
+            response['Retry-After'] = str(RETRY_AFTER)
+            return response
+        request._admission = priority
+        return None
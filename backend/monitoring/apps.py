@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'monitoring'
+
+    def ready(self):
+        from .metrics import install_serializer_timing
+        from .nplusone import install as install_nplusone
+        from .slowqueries import connect_signals as install_slow_queries
+        install_serializer_timing()
+        install_nplusone()
+        install_slow_queries()
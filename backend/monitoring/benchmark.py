@@ -0,0 +1,217 @@
+"""
+In-process benchmark runner: drives views through the DRF test client against
+whatever database is configured (normally one loaded by generate_dataset) and
+records latency percentiles, query counts and peak Python memory per scenario.
+
+Every iteration runs in a savepoint that is rolled back, and the whole run
+(including the fixtures `build_context` creates) in a transaction that is
+rolled back, so write endpoints can be measured repeatedly without changing the
+data. Results are plain JSON so a baseline can be kept and compared against
+later runs with `compare()`.
+"""
+import gc
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import django
+from django.core.cache import cache
+from django.db import connection, transaction
+from rest_framework.test import APIClient
+
+from .metrics import percentile
+from .sql import is_savepoint
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+@dataclass
+class Scenario:
+    """One benchmarked call. `setup(context)` returns (user, path, payload) and runs outside the timer."""
+    name: str
+    method: str
+    setup: Callable
+    label: Optional[str] = None
+
+    def __str__(self):
+        return self.label or self.name
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not is_savepoint(sql):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+class Runner:
+    def __init__(self, scenarios, build_context, iterations=20, warmup=3, warm_cache=False, log=None):
+        self.scenarios = scenarios
+        self.build_context = build_context
+        self.context = None
+        self.iterations = iterations
+        self.warmup = warmup
+        # By default every call starts from an empty cache, so the numbers measure the work and not the hit rate
+        self.warm_cache = warm_cache
+        self.log = log or (lambda message: None)
+        self.client = APIClient()
+
+    def call(self, scenario):
+        """One rolled-back call; returns (elapsed seconds, queries)."""
+        counter = QueryCounter()
+        with transaction.atomic():
+            user, path, payload = scenario.setup(self.context)
+            self.client.force_authenticate(user)
+            if not self.warm_cache:
+                cache.clear()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = getattr(self.client, scenario.method)(path, payload, format='json')
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        if response.status_code >= 400:
+            raise BenchmarkError(
+                f'{scenario} returned {response.status_code}: {getattr(response, "data", response.content)!r}'
+            )
+        return elapsed, counter.count
+
+    def measure(self, scenario):
+        for _ in range(self.warmup):
+            self.call(scenario)
+
+        timings, queries = [], []
+        for _ in range(self.iterations):
+            elapsed, count = self.call(scenario)
+            timings.append(elapsed * 1000)
+            queries.append(count)
+
+        # Separate pass: tracemalloc slows everything down, so it never overlaps the timed calls
+        gc.collect()
+        tracemalloc.start()
+        try:
+            self.call(scenario)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'iterations': self.iterations,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': max(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def run(self):
+        results = {}
+        with transaction.atomic():
+            self.context = self.build_context()
+            if self.context is None:
+                raise BenchmarkError('Nothing to benchmark against; load a dataset with `manage.py generate_dataset` first.')
+            for scenario in self.scenarios:
+                results[str(scenario)] = result = self.measure(scenario)
+                self.log(
+                    f"  {str(scenario):<36} p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+                    f"p99 {result['p99_ms']:>8.1f} ms  {result['queries']:>3} queries  {result['peak_kb']:>9,.0f} KB"
+                )
+            transaction.set_rollback(True)
+        return results
+
+
+def report(results, dataset=None, iterations=None, warm_cache=False):
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'dataset': dataset or {},
+        'iterations': iterations,
+        'warm_cache': warm_cache,
+        'results': results,
+    }
+
+
+def save(data, path):
+    with open(path, 'w') as fh:
+        json.dump(data, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def load(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+# Metrics compared against the baseline, and whether they regress relatively (vs. any increase)
+COMPARED = [
+    ('p50_ms', True),
+    ('p95_ms', True),
+    ('p99_ms', True),
+    ('queries', False),
+    ('peak_kb', True),
+]
+# Latency differences below this are noise whatever the percentage
+MIN_DELTA_MS = 1.0
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Returns (lines, regressions). A timing or memory metric regresses when it grows by more than
+    `threshold` (a fraction); query counts regress on any increase.
+    """
+    lines, regressions = [], []
+    if baseline.get('dataset') != current.get('dataset'):
+        lines.append('WARNING: the baseline was recorded against a different dataset; numbers are not comparable.')
+    if baseline.get('warm_cache') != current.get('warm_cache'):
+        lines.append('WARNING: the baseline was recorded with a different cache mode (--warm-cache).')
+    if baseline.get('database') != current.get('database'):
+        lines.append(f"WARNING: baseline database {baseline.get('database')!r}, current {current.get('database')!r}.")
+
+    base_results, current_results = baseline.get('results', {}), current.get('results', {})
+    header = f"{'scenario':<36} {'metric':<8} {'baseline':>10} {'current':>10} {'change':>8}"
+    lines += [header, '-' * len(header)]
+    for name in sorted(set(base_results) | set(current_results)):
+        if name not in current_results:
+            lines.append(f'{name:<36} missing from the current run')
+            continue
+        if name not in base_results:
+            lines.append(f'{name:<36} new (no baseline)')
+            continue
+        for metric, relative in COMPARED:
+            before, after = base_results[name].get(metric), current_results[name].get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            if relative:
+                regressed = change > threshold and (not metric.endswith('_ms') or after - before >= MIN_DELTA_MS)
+                improved = change < -threshold
+            else:
+                regressed, improved = after > before, after < before
+            marker = '  REGRESSION' if regressed else ('  improved' if improved else '')
+            lines.append(f'{name:<36} {metric:<8} {before:>10,.1f} {after:>10,.1f} {change:>+7.0%}{marker}')
+            if regressed:
+                regressions.append((name, metric, before, after))
+    return lines, regressions
@@ -0,0 +1,41 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+from . import deadlines
+from .metrics import record_cache
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """
+    Counts hits/misses of `get` into the current request's metrics (LocMemCache's `get_many` goes
+    through `get`; RedisCache's is one MGET, counted by InstrumentedRedisCache), and refuses reads
+    once the request is past its deadline (monitoring.deadlines).
+    """
+
+    def get(self, key, default=None, version=None):
+        deadlines.check()
+        value = super().get(key, _MISSING, version=version)
+        record_cache(value is not _MISSING)
+        return default if value is _MISSING else value
+
+
+def cache_is_shared(alias='default'):
+    """Whether every process sees the same cache; LocMemCache is one per process."""
+    return not isinstance(caches[alias], LocMemCache)
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    def get_many(self, keys, version=None):
+        deadlines.check()
+        keys = list(keys)
+        found = super().get_many(keys, version=version)
+        for key in keys:
+            record_cache(key in found)
+        return found
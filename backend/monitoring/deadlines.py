@@ -0,0 +1,220 @@
+"""
+Per-endpoint request deadlines.
+
+DeadlineMiddleware gives every view a time budget (REQUEST_DEADLINES: a default
+plus per-endpoint overrides keyed like EndpointMetric, e.g.
+'GET api/lms/dashboard/'). The remaining budget is propagated downstream:
+- before each query the remaining time is checked, and an exhausted budget
+  raises DeadlineExceeded without touching the database;
+- on PostgreSQL the connection's statement_timeout is set to the remaining
+  budget (and lowered again as it shrinks), so a runaway query is cancelled
+  by the server instead of holding the worker until gunicorn's timeout; it is
+  reset when the request ends, before the connection goes back to the pool;
+- on SQLite a progress handler interrupts the running query at the deadline;
+- cache reads check the budget too (monitoring.cache).
+
+A query cancelled at the deadline answers 504, a budget spent before the next
+call answers 503 with Retry-After; both are stored as DeadlineHit rows, which
+the admin summarises per endpoint.
+"""
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .metrics import worker_id
+from .middleware import endpoint_name, request_user_id
+
+logger = logging.getLogger('monitoring.deadlines')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DEFAULT_MS': 30000,
+    'ENDPOINTS': {},
+}
+RETRY_AFTER = 5
+# PostgreSQL's query_canceled; statement_timeout raises it
+QUERY_CANCELED = '57014'
+# Only lower statement_timeout once the budget has shrunk below this share of the value set
+RESET_RATIO = 0.5
+
+_current = ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    __slots__ = ('endpoint', 'budget_ms', 'started', 'expires', 'statement_timeouts', 'progress_handlers', 'tripped')
+
+    def __init__(self, endpoint, budget_ms):
+        self.endpoint = endpoint
+        self.budget_ms = budget_ms
+        self.started = time.monotonic()
+        self.expires = self.started + budget_ms / 1000
+        self.statement_timeouts = {}   # alias -> ms currently set on the connection
+        self.progress_handlers = set()
+        self.tripped = False
+
+    def remaining_ms(self):
+        return (self.expires - time.monotonic()) * 1000
+
+    def elapsed_ms(self):
+        return (time.monotonic() - self.started) * 1000
+
+    def check(self):
+        if time.monotonic() >= self.expires:
+            self.tripped = True
+            raise DeadlineExceeded(f"{self.endpoint} ran out of its {self.budget_ms} ms budget")
+
+    def interrupt(self):
+        """SQLite progress handler: stop the running query once, then let error handling use the connection."""
+        if self.tripped or time.monotonic() < self.expires:
+            return 0
+        self.tripped = True
+        return 1
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        self.check()
+        connection = context['connection']
+        if connection.vendor == 'postgresql':
+            self.limit_statement(connection, context['cursor'])
+        elif connection.vendor == 'sqlite' and connection.alias not in self.progress_handlers:
+            connection.connection.set_progress_handler(self.interrupt, 1000)
+            self.progress_handlers.add(connection.alias)
+        return execute(sql, params, many, context)
+
+    def limit_statement(self, connection, cursor):
+        current = self.statement_timeouts.get(connection.alias)
+        remaining = max(1, int(self.remaining_ms()))
+        if current is None or remaining < current * RESET_RATIO:
+            # Plain SET on the backend cursor (no wrappers); reset in release()
+            cursor.cursor.execute(f'SET statement_timeout = {remaining}')
+            self.statement_timeouts[connection.alias] = remaining
+
+    def release(self):
+        for alias in self.statement_timeouts:
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('RESET statement_timeout')
+            except DatabaseError:
+                # A broken connection is discarded rather than reused, so it keeps nothing
+                logger.warning("Could not reset statement_timeout on %s", alias)
+        for alias in self.progress_handlers:
+            connection = connections[alias].connection
+            if connection is not None:
+                connection.set_progress_handler(None, 0)
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_DEADLINES', {})}
+
+
+def current():
+    return _current.get()
+
+
+def check():
+    """Raises DeadlineExceeded if the running request is out of time; a no-op outside requests."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def db_wrapper(execute, sql, params, many, context):
+    deadline = _current.get()
+    if deadline is None:
+        return execute(sql, params, many, context)
+    return deadline.db_wrapper(execute, sql, params, many, context)
+
+
+def is_cancelled_query(exc):
+    """A statement_timeout cancellation (PostgreSQL) or a progress-handler interrupt (SQLite)."""
+    cause = exc.__cause__
+    code = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    return code == QUERY_CANCELED or 'interrupted' in str(exc)
+
+
+class DeadlineMiddleware:
+    """Applies the per-endpoint budget to the view and turns overruns into 503/504. Removed when disabled."""
+
+    def __init__(self, get_response):
+        conf = config()
+        if not conf['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.default_ms = conf['DEFAULT_MS']
+        self.endpoints = conf['ENDPOINTS']
+
+    def __call__(self, request):
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(db_wrapper))
+                return self.get_response(request)
+        finally:
+            self.finish(request)
+
+    @staticmethod
+    def finish(request):
+        """Lift the deadline and reset the connections it touched. Safe to call twice."""
+        deadline = request.__dict__.pop('_deadline', None)
+        if deadline is not None:
+            _current.reset(request._deadline_token)
+            deadline.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        endpoint = endpoint_name(request)
+        budget_ms = self.endpoints.get(endpoint, self.default_ms)
+        if budget_ms:
+            request._deadline = Deadline(endpoint, budget_ms)
+            request._deadline_token = _current.set(request._deadline)
+        return None
+
+    def process_exception(self, request, exception):
+        deadline = getattr(request, '_deadline', None)
+        if deadline is None:
+            return None
+        if isinstance(exception, DeadlineExceeded):
+            kind, status_code = 'budget', 503
+        elif isinstance(exception, DatabaseError) and is_cancelled_query(exception):
+            kind, status_code = 'statement', 504
+        else:
+            return None
+
+        elapsed_ms = deadline.elapsed_ms()
+        logger.warning("%s hit its %d ms deadline after %.0f ms (%s)", deadline.endpoint, deadline.budget_ms, elapsed_ms, kind)
+        # Lifted first, so recording the hit is not itself cut short
+        self.finish(request)
+        self.record(request, deadline, kind, elapsed_ms)
+
+        response = JsonResponse({
+            "detail": f"The request took longer than its {deadline.budget_ms / 1000:g} s limit.",
+            "deadline_ms": deadline.budget_ms,
+        }, status=status_code)
+        if status_code == 503:
+            response['Retry-After'] = str(RETRY_AFTER)
+        return response
+
+    @staticmethod
+    def record(request, deadline, kind, elapsed_ms):
+        from .models import DeadlineHit
+        try:
+            DeadlineHit.objects.create(
+                endpoint=deadline.endpoint,
+                kind=kind,
+                budget_ms=deadline.budget_ms,
+                elapsed_ms=round(elapsed_ms, 1),
+                user_id=request_user_id(request),
+                worker=worker_id(),
+                occurred_at=timezone.now(),
+            )
+        except DatabaseError:
+            logger.exception("Failed to record deadline hit for %s", deadline.endpoint)
@@ -0,0 +1,74 @@
+"""
+Renders collapsed stacks ("a;b;c 12" per line, see monitoring/profiler.py) as a
+standalone SVG flame graph: callers at the bottom, width proportional to samples,
+hover for the frame name and its share. The same text loads into speedscope or
+Brendan Gregg's flamegraph.pl if more than a quick look is needed.
+"""
+import zlib
+from html import escape
+
+WIDTH = 1200
+ROW = 16
+FONT_SIZE = 11
+CHAR_WIDTH = FONT_SIZE * 0.6
+MIN_WIDTH = 0.5   # frames narrower than this (px) are dropped
+
+
+def build_tree(stacks):
+    root = {'name': 'all', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['value'] += count
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'name': name, 'value': 0, 'children': {}})
+            node['value'] += count
+    return root
+
+
+def colour(name):
+    # Stable per frame name, in the usual warm flame-graph range
+    h = zlib.crc32(name.encode())
+    return f'rgb({205 + h % 50},{(h >> 8) % 180},{(h >> 16) % 55})'
+
+
+def render(stacks, title='Flame graph'):
+    root = build_tree(stacks)
+    total = root['value'] or 1
+    scale = WIDTH / total
+    rects = []
+    depth_max = 0
+
+    pending = [(root, 0.0, 0)]
+    while pending:
+        node, x, depth = pending.pop()
+        width = node['value'] * scale
+        if width < MIN_WIDTH:
+            continue
+        depth_max = max(depth_max, depth)
+        rects.append((node, x, depth, width))
+        child_x = x
+        for child in sorted(node['children'].values(), key=lambda n: n['name']):
+            pending.append((child, child_x, depth + 1))
+            child_x += child['value'] * scale
+
+    height = (depth_max + 1) * ROW + 2 * ROW
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{height}" '
+        f'viewBox="0 0 {WIDTH} {height}" font-family="monospace" font-size="{FONT_SIZE}">',
+        f'<text x="{WIDTH / 2}" y="{ROW}" text-anchor="middle" font-size="{FONT_SIZE + 3}">{escape(title)}</text>',
+    ]
+    for node, x, depth, width in rects:
+        y = height - (depth + 1) * ROW
+        label = f"{node['name']} ({node['value']:,} samples, {node['value'] / total:.1%})"
+        fill = '#ccc' if depth == 0 else colour(node['name'])
+        parts.append(
+            f'<g><title>{escape(label)}</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{width:.2f}" height="{ROW - 1}" fill="{fill}" rx="2"/>'
+        )
+        chars = int((width - 6) / CHAR_WIDTH)
+        if chars >= 3:
+            text = node['name'] if len(node['name']) <= chars else node['name'][:chars - 2] + '..'
+            parts.append(f'<text x="{x + 3:.2f}" y="{y + ROW - 4}">{escape(text)}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
@@ -0,0 +1,233 @@
+"""
+Worker memory observability.
+
+MemoryMiddleware keeps, per worker process:
+- per-endpoint request counts, RSS growth across requests and (with
+  tracemalloc on) the peak Python allocation of requests that ran alone in
+  the process, since tracemalloc's peak is process-wide and a concurrent
+  request on another gthread thread would inflate it;
+- a MemorySample row every MEMORY['SAMPLE_INTERVAL'] seconds with RSS, the
+  traced heap, GC counts, LocMem cache size and the endpoint table, so growth
+  can be followed across a worker's life in the admin.
+
+With MEMORY['TRACEMALLOC'] on (it costs CPU and memory, so it is meant to be
+switched on for a while on one deployment), GET /api/monitoring/memory/ shows
+the top allocation growth since a baseline snapshot taken at startup or by
+POSTing to the same URL. Each call answers for the worker that served it.
+"""
+import gc
+import logging
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from .metrics import worker_id
+from .middleware import endpoint_name
+
+logger = logging.getLogger('monitoring.memory')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TRACEMALLOC': False,
+    'TRACEMALLOC_FRAMES': 10,
+    'SAMPLE_INTERVAL': 300,
+    'TOP': 25,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'MEMORY', {})}
+
+
+def rss_kb():
+    """Current resident set size; falls back to the peak where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def cache_usage(alias='default'):
+    """(entries, KB) of a LocMem cache, whose values are stored pickled; (None, None) for other backends."""
+    cache = caches[alias]
+    if not isinstance(cache, LocMemCache):
+        return None, None
+    # The cache's own lock: other threads of this worker write to the OrderedDict meanwhile
+    with cache._lock:
+        sizes = [len(value) for value in cache._cache.values() if isinstance(value, bytes)]
+    return len(sizes), round(sum(sizes) / 1024, 1)
+
+
+class EndpointMemory:
+    __slots__ = ('requests', 'rss_growth_kb', 'measured', 'peak_alloc_kb', 'total_alloc_kb')
+
+    def __init__(self):
+        self.requests = 0
+        self.rss_growth_kb = 0
+        self.measured = 0
+        self.peak_alloc_kb = 0.0
+        self.total_alloc_kb = 0.0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'rss_growth_kb': self.rss_growth_kb,
+            'peak_alloc_kb': round(self.peak_alloc_kb, 1),
+            'avg_alloc_kb': round(self.total_alloc_kb / self.measured, 1) if self.measured else None,
+        }
+
+
+class MemoryTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.started = 0           # bumped on every request start; detects overlapping requests
+        self.baseline = None
+        self.baseline_at = None
+        self.last_sample = time.monotonic()
+
+    # --- tracemalloc ---------------------------------------------------------
+
+    def start_tracing(self, frames):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.reset_baseline()
+
+    def reset_baseline(self):
+        self.baseline = self.snapshot()
+        self.baseline_at = timezone.now()
+
+    @staticmethod
+    def snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ))
+
+    def top_growth(self, limit, group_by='lineno'):
+        """Allocation sites that grew most since the baseline."""
+        stats = self.snapshot().compare_to(self.baseline, group_by)
+        return [
+            {
+                'where': stat.traceback.format() if group_by == 'traceback' else str(stat.traceback[0]),
+                'size_kb': round(stat.size / 1024, 1),
+                'size_diff_kb': round(stat.size_diff / 1024, 1),
+                'count': stat.count,
+                'count_diff': stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ]
+
+    # --- requests ------------------------------------------------------------
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+            self.started += 1
+            alone = self.in_flight == 1
+            if alone and tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            return self.started if alone else None, rss_kb(), tracemalloc.get_traced_memory()[0]
+
+    def end(self, endpoint, state):
+        generation, rss_before, traced_before = state
+        rss_after = rss_kb()
+        with self.lock:
+            self.in_flight -= 1
+            self.requests += 1
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointMemory()
+            stats.requests += 1
+            stats.rss_growth_kb += rss_after - rss_before
+            # Only when no other request started meanwhile, so the process-wide peak is ours
+            if generation is not None and generation == self.started and tracemalloc.is_tracing():
+                allocated_kb = (tracemalloc.get_traced_memory()[1] - traced_before) / 1024
+                stats.measured += 1
+                stats.total_alloc_kb += allocated_kb
+                stats.peak_alloc_kb = max(stats.peak_alloc_kb, allocated_kb)
+
+    def endpoint_table(self):
+        with self.lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self.endpoints.items()}
+
+    def status(self):
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        entries, cache_kb = cache_usage()
+        return {
+            'worker': worker_id(),
+            'rss_kb': rss_kb(),
+            'tracing': tracemalloc.is_tracing(),
+            'traced_kb': round(traced / 1024, 1),
+            'traced_peak_kb': round(traced_peak / 1024, 1),
+            'requests': self.requests,
+            'gc_collections': [generation['collections'] for generation in gc.get_stats()],
+            'gc_pending': list(gc.get_count()),
+            'cache_entries': entries,
+            'cache_kb': cache_kb,
+        }
+
+    def sample_if_due(self, interval):
+        if time.monotonic() - self.last_sample < interval:
+            return
+        with self.lock:
+            if time.monotonic() - self.last_sample < interval:
+                return
+            self.last_sample = time.monotonic()
+        from .models import MemorySample
+        try:
+            self.store(MemorySample, self.status())
+        except Exception:
+            logger.exception("Failed to store memory sample")
+
+    def store(self, model, status):
+        model.objects.create(
+            worker=status['worker'],
+            sampled_at=timezone.now(),
+            requests=status['requests'],
+            rss_kb=status['rss_kb'],
+            traced_kb=status['traced_kb'] if status['tracing'] else None,
+            traced_peak_kb=status['traced_peak_kb'] if status['tracing'] else None,
+            gc_collections=sum(status['gc_collections']),
+            cache_entries=status['cache_entries'],
+            cache_kb=status['cache_kb'],
+            endpoints=self.endpoint_table(),
+        )
+
+
+tracker = MemoryTracker()
+
+
+class MemoryMiddleware:
+    """Per-endpoint memory accounting and periodic MemorySample rows. Removed when MEMORY['ENABLED'] is False."""
+
+    def __init__(self, get_response):
+        conf = config()
+        if not conf['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_interval = conf['SAMPLE_INTERVAL']
+        if conf['TRACEMALLOC']:
+            tracker.start_tracing(conf['TRACEMALLOC_FRAMES'])
+
+    def __call__(self, request):
+        state = tracker.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            tracker.end(endpoint_name(request), state)
+        tracker.sample_if_due(self.sample_interval)
+        return response
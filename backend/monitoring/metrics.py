@@ -0,0 +1,167 @@
+"""
+Per-request counters (queries, DB time, cache hits/misses, serializer time)
+and rolling per-endpoint percentiles.
+
+The counters live in a ContextVar that RequestMetricsMiddleware sets for
+sampled requests only; every hook below is a no-op when it is unset, so
+unsampled requests pay nothing beyond one ContextVar lookup.
+"""
+import os
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils import timezone
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'cache_hits', 'cache_misses', 'serializer_time', '_serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serializer_time = 0.0
+        self._serializer_depth = 0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def current():
+    """The RequestMetrics for the running request, or None when not sampled."""
+    return _current.get()
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def record_cache(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def install_serializer_timing():
+    """Time top-level `serializer.data` calls. Nested serializers are counted once via the depth guard."""
+    from rest_framework import serializers
+
+    base_data = serializers.BaseSerializer.data
+    if getattr(base_data.fget, '_timed', False):
+        return
+
+    def timed_data(self):
+        metrics = _current.get()
+        if metrics is None:
+            return base_data.fget(self)
+        metrics._serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return base_data.fget(self)
+        finally:
+            metrics._serializer_depth -= 1
+            if metrics._serializer_depth == 0:
+                metrics.serializer_time += time.perf_counter() - start
+
+    timed_data._timed = True
+    serializers.BaseSerializer.data = property(timed_data)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class EndpointStats:
+    """Bounded in-process window of samples per endpoint, flushed to EndpointMetric periodically."""
+
+    def __init__(self, window=500, flush_interval=60):
+        self.window = window
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._last_flush = time.monotonic()
+
+    @property
+    def worker(self):
+        # Read per flush: with preload_app the instance is built in the gunicorn master before the fork
+        return worker_id()
+
+    def record(self, endpoint, duration, metrics):
+        sample = (duration * 1000, metrics.queries, metrics.db_time * 1000, metrics.cache_hits, metrics.cache_misses)
+        with self._lock:
+            self._samples[endpoint].append(sample)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                samples, self._samples = self._samples, defaultdict(lambda: deque(maxlen=self.window))
+                self._last_flush = time.monotonic()
+        if due:
+            self.flush(samples)
+
+    def snapshot(self):
+        """Current (unflushed) percentiles, keyed by endpoint."""
+        with self._lock:
+            samples = {k: list(v) for k, v in self._samples.items()}
+        return {endpoint: self._summarise(rows) for endpoint, rows in samples.items()}
+
+    def flush(self, samples):
+        from .models import EndpointMetric
+        now = timezone.now()
+        EndpointMetric.objects.bulk_create([
+            EndpointMetric(endpoint=endpoint, worker=self.worker, window_end=now, **self._summarise(rows))
+            for endpoint, rows in samples.items() if rows
+        ])
+
+    @staticmethod
+    def _summarise(rows):
+        durations = [r[0] for r in rows]
+        queries = [r[1] for r in rows]
+        hits = sum(r[3] for r in rows)
+        lookups = hits + sum(r[4] for r in rows)
+        return {
+            'requests': len(rows),
+            'p50_ms': percentile(durations, 50),
+            'p95_ms': percentile(durations, 95),
+            'p99_ms': percentile(durations, 99),
+            'avg_queries': sum(queries) / len(rows),
+            'max_queries': max(queries),
+            'avg_db_ms': sum(r[2] for r in rows) / len(rows),
+            'cache_hit_ratio': hits / lookups if lookups else None,
+        }
+
+
+def _build_endpoint_stats():
+    config = getattr(settings, 'REQUEST_METRICS', {})
+    return EndpointStats(
+        window=config.get('WINDOW', 500),
+        flush_interval=config.get('FLUSH_INTERVAL', 60),
+    )
+
+
+endpoint_stats = _build_endpoint_stats()
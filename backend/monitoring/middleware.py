@@ -0,0 +1,90 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('monitoring.requests')
+
+
+def endpoint_name(request):
+    """Stable per-route key, e.g. 'GET api/lms/dashboard/' (URL kwargs stay as placeholders)."""
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match else 'unresolved'
+    return f"{request.method} {route}"
+
+
+def request_user_id(request):
+    """The user id from the session or, for API calls, from the JWT, without touching the database."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not header.startswith('Bearer '):
+        return None
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    try:
+        return AccessToken(header[len('Bearer '):]).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+class RequestMetricsMiddleware:
+    """
+    Samples requests and reports query count, DB time, cache hits/misses and
+    serializer time as a Server-Timing header plus one JSON log line, and feeds
+    the rolling per-endpoint percentiles shown in the admin (EndpointMetric).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = getattr(settings, 'REQUEST_METRICS', {})
+        self.sample_rate = config.get('SAMPLE_RATE', 1.0)
+        self.server_timing = config.get('SERVER_TIMING', True)
+
+    def __call__(self, request):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.activate(request_metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(request_metrics.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+        duration = time.perf_counter() - start
+
+        endpoint = endpoint_name(request)
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={request_metrics.db_time * 1000:.1f};desc="{request_metrics.queries} queries"',
+                f'cache;desc="hit={request_metrics.cache_hits} miss={request_metrics.cache_misses}"',
+                f'ser;dur={request_metrics.serializer_time * 1000:.1f}',
+                f'total;dur={duration * 1000:.1f}',
+            ])
+        logger.info(json.dumps({
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': request_metrics.queries,
+            'db_ms': round(request_metrics.db_time * 1000, 1),
+            'cache_hits': request_metrics.cache_hits,
+            'cache_misses': request_metrics.cache_misses,
+            'serializer_ms': round(request_metrics.serializer_time * 1000, 1),
+        }))
+        try:
+            metrics.endpoint_stats.record(endpoint, duration, request_metrics)
+        except Exception:
+            logger.exception("Failed to record endpoint metrics")
+        return response
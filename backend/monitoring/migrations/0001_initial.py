@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EndpointMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(db_index=True, max_length=255)),
+                ('worker', models.CharField(max_length=100)),
+                ('window_end', models.DateTimeField(db_index=True)),
+                ('requests', models.IntegerField(default=0)),
+                ('p50_ms', models.FloatField(default=0)),
+                ('p95_ms', models.FloatField(default=0)),
+                ('p99_ms', models.FloatField(default=0)),
+                ('avg_queries', models.FloatField(default=0)),
+                ('max_queries', models.IntegerField(default=0)),
+                ('avg_db_ms', models.FloatField(default=0)),
+                ('cache_hit_ratio', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-window_end'],
+            },
+        ),
+    ]
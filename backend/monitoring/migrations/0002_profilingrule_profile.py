@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:57
+
+import django.db.models.deletion
+import monitoring.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(blank=True, help_text="As shown under Endpoint metrics, e.g. 'GET api/lms/leaderboard/course/', or just the route. Blank matches any.", max_length=255)),
+                ('sample_rate', models.FloatField(default=1.0, help_text='Fraction of matching requests to profile (0-1)')),
+                ('enabled', models.BooleanField(default=True)),
+                ('expires_at', models.DateTimeField(default=monitoring.models.default_rule_expiry, help_text='Rules switch themselves off; default one hour')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, help_text="Only this user's requests. Blank matches anyone.", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(db_index=True, max_length=255)),
+                ('worker', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('duration_ms', models.FloatField()),
+                ('status_code', models.IntegerField(null=True)),
+                ('interval_ms', models.FloatField(help_text='Effective sampling interval, after the overhead cap')),
+                ('samples', models.IntegerField()),
+                ('truncated', models.BooleanField(default=False, help_text="Hit PROFILER['MAX_SAMPLES']")),
+                ('stacks', models.TextField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('rule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profiles', to='monitoring.profilingrule')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_profilingrule_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, max_length=16)),
+                ('sql', models.TextField(help_text='Normalized: literals and IN-list lengths stripped')),
+                ('endpoint', models.CharField(blank=True, max_length=255)),
+                ('call_site', models.CharField(blank=True, max_length=255)),
+                ('params_hash', models.CharField(max_length=16)),
+                ('duration_ms', models.FloatField()),
+                ('plan', models.TextField(blank=True, help_text="EXPLAIN output; taken once per fingerprint per worker and SLOW_QUERIES['EXPLAIN_INTERVAL']")),
+                ('captured_at', models.DateTimeField(db_index=True)),
+                ('worker', models.CharField(max_length=100)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+                'ordering': ['-captured_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0003_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemorySample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('worker', models.CharField(db_index=True, max_length=100)),
+                ('sampled_at', models.DateTimeField(db_index=True)),
+                ('requests', models.IntegerField(help_text='Served by this worker so far')),
+                ('rss_kb', models.IntegerField()),
+                ('traced_kb', models.FloatField(blank=True, help_text='Python heap per tracemalloc; empty when tracing is off', null=True)),
+                ('traced_peak_kb', models.FloatField(blank=True, null=True)),
+                ('gc_collections', models.IntegerField()),
+                ('cache_entries', models.IntegerField(blank=True, null=True)),
+                ('cache_kb', models.FloatField(blank=True, null=True)),
+                ('endpoints', models.JSONField(default=dict, help_text='Per endpoint: requests, RSS growth, peak/avg allocation')),
+            ],
+            options={
+                'ordering': ['-sampled_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_memorysample'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadlineHit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(db_index=True, max_length=255)),
+                ('kind', models.CharField(choices=[('statement', 'Query cancelled (504)'), ('budget', 'Budget spent before next call (503)')], max_length=10)),
+                ('budget_ms', models.IntegerField()),
+                ('elapsed_ms', models.FloatField()),
+                ('worker', models.CharField(max_length=100)),
+                ('occurred_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-occurred_at'],
+            },
+        ),
+    ]
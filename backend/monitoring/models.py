@@ -0,0 +1,139 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class EndpointMetric(models.Model):
+    """One flushed window of sampled request timings for an endpoint on one worker."""
+    endpoint = models.CharField(max_length=255, db_index=True)
+    worker = models.CharField(max_length=100)
+    window_end = models.DateTimeField(db_index=True)
+    requests = models.IntegerField(default=0)
+    p50_ms = models.FloatField(default=0)
+    p95_ms = models.FloatField(default=0)
+    p99_ms = models.FloatField(default=0)
+    avg_queries = models.FloatField(default=0)
+    max_queries = models.IntegerField(default=0)
+    avg_db_ms = models.FloatField(default=0)
+    cache_hit_ratio = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-window_end']
+
+    def __str__(self):
+        return f"{self.endpoint} @ {self.window_end:%Y-%m-%d %H:%M}"
+
+
+def default_rule_expiry():
+    return timezone.now() + timedelta(hours=1)
+
+
+class ProfilingRule(models.Model):
+    """Which requests the sampling profiler records (see monitoring/profiler.py). Every set condition must match."""
+    endpoint = models.CharField(
+        max_length=255, blank=True,
+        help_text="As shown under Endpoint metrics, e.g. 'GET api/lms/leaderboard/course/', or just the route. Blank matches any.",
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+',
+        help_text="Only this user's requests. Blank matches anyone.",
+    )
+    sample_rate = models.FloatField(default=1.0, help_text="Fraction of matching requests to profile (0-1)")
+    enabled = models.BooleanField(default=True)
+    expires_at = models.DateTimeField(default=default_rule_expiry, help_text="Rules switch themselves off; default one hour")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        parts = [self.endpoint or 'any endpoint']
+        if self.user_id:
+            parts.append(f'user #{self.user_id}')
+        if self.sample_rate < 1:
+            parts.append(f'{self.sample_rate:.0%}')
+        return ', '.join(parts)
+
+
+class Profile(models.Model):
+    """Stack samples of one profiled request, aggregated in collapsed-stack format ("a;b;c 12" per line)."""
+    rule = models.ForeignKey(ProfilingRule, on_delete=models.SET_NULL, null=True, blank=True, related_name='profiles')
+    endpoint = models.CharField(max_length=255, db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    worker = models.CharField(max_length=100)
+    started_at = models.DateTimeField(db_index=True)
+    duration_ms = models.FloatField()
+    status_code = models.IntegerField(null=True)
+    interval_ms = models.FloatField(help_text="Effective sampling interval, after the overhead cap")
+    samples = models.IntegerField()
+    truncated = models.BooleanField(default=False, help_text="Hit PROFILER['MAX_SAMPLES']")
+    stacks = models.TextField()
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.endpoint} @ {self.started_at:%Y-%m-%d %H:%M:%S}"
+
+
+class SlowQuery(models.Model):
+    """One query slower than SLOW_QUERIES['THRESHOLD_MS'] (see monitoring/slowqueries.py)."""
+    fingerprint = models.CharField(max_length=16, db_index=True)
+    sql = models.TextField(help_text="Normalized: literals and IN-list lengths stripped")
+    endpoint = models.CharField(max_length=255, blank=True)
+    call_site = models.CharField(max_length=255, blank=True)
+    params_hash = models.CharField(max_length=16)
+    duration_ms = models.FloatField()
+    plan = models.TextField(blank=True, help_text="EXPLAIN output; taken once per fingerprint per worker and SLOW_QUERIES['EXPLAIN_INTERVAL']")
+    captured_at = models.DateTimeField(db_index=True)
+    worker = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['-captured_at']
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f"{self.fingerprint} {self.duration_ms:.0f} ms @ {self.captured_at:%Y-%m-%d %H:%M:%S}"
+
+
+class MemorySample(models.Model):
+    """Periodic memory reading of one worker process (see monitoring/memory.py)."""
+    worker = models.CharField(max_length=100, db_index=True)
+    sampled_at = models.DateTimeField(db_index=True)
+    requests = models.IntegerField(help_text="Served by this worker so far")
+    rss_kb = models.IntegerField()
+    traced_kb = models.FloatField(null=True, blank=True, help_text="Python heap per tracemalloc; empty when tracing is off")
+    traced_peak_kb = models.FloatField(null=True, blank=True)
+    gc_collections = models.IntegerField()
+    cache_entries = models.IntegerField(null=True, blank=True)
+    cache_kb = models.FloatField(null=True, blank=True)
+    endpoints = models.JSONField(default=dict, help_text="Per endpoint: requests, RSS growth, peak/avg allocation")
+
+    class Meta:
+        ordering = ['-sampled_at']
+
+    def __str__(self):
+        return f"{self.worker} @ {self.sampled_at:%Y-%m-%d %H:%M}"
+
+
+class DeadlineHit(models.Model):
+    """A request stopped by its per-endpoint deadline (see monitoring/deadlines.py)."""
+    KIND_CHOICES = [
+        ('statement', 'Query cancelled (504)'),
+        ('budget', 'Budget spent before next call (503)'),
+    ]
+    endpoint = models.CharField(max_length=255, db_index=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    budget_ms = models.IntegerField()
+    elapsed_ms = models.FloatField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    worker = models.CharField(max_length=100)
+    occurred_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-occurred_at']
+
+    def __str__(self):
+        return f"{self.endpoint} ({self.kind}) @ {self.occurred_at:%Y-%m-%d %H:%M:%S}"
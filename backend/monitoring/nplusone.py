@@ -0,0 +1,219 @@
+"""
+Development/staging N+1 detector.
+
+The related-object descriptors are wrapped at startup (a single ContextVar
+lookup while no detector is active). Inside a detector (NPlusOneMiddleware
+when settings.NPLUSONE['ENABLED'], default DEBUG, or the context manager
+below) every lazy load is recorded together with the serializer field that
+triggered it: a forward FK or one-to-one that was not select_related, a
+reverse one-to-one, or a reverse FK / many-to-many manager that was not
+prefetched.
+Identical query shapes are counted as well. At the end of the request every
+load or shape repeated `THRESHOLD` times or more is logged with the missing
+select_related/prefetch_related; with `RAISE` it raises NPlusOneError instead.
+
+Tests can opt in explicitly:
+
+    with detect_n_plus_one(raise_errors=True):
+        client.get(...)
+"""
+import logging
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models import query
+from django.db.models.fields import related_descriptors
+
+from .sql import is_savepoint, normalize
+
+logger = logging.getLogger('monitoring.nplusone')
+
+_tracker = ContextVar('nplusone_tracker', default=None)
+# prefetch_related itself builds each related manager's queryset before filling the cache
+_prefetching = ContextVar('nplusone_prefetching', default=False)
+_installed = False
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def config():
+    return {'ENABLED': settings.DEBUG, 'THRESHOLD': 3, 'RAISE': False, **getattr(settings, 'NPLUSONE', {})}
+
+
+class Tracker:
+    def __init__(self, label, threshold, parent=None):
+        self.label = label
+        self.parent = parent
+        self.threshold = threshold
+        self.lazy_loads = Counter()
+        self.lazy_origin = {}
+        self.shapes = Counter()
+
+    def record_lazy(self, model, field, kind):
+        key = (model.__name__, field, kind)
+        self.lazy_loads[key] += 1
+        if key not in self.lazy_origin:
+            self.lazy_origin[key] = serializer_origin()
+        if self.parent is not None:
+            # e.g. the middleware's detector running inside a test's
+            self.parent.record_lazy(model, field, kind)
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        if not is_savepoint(sql):
+            self.shapes[normalize(sql)] += 1
+        return execute(sql, params, many, context)
+
+    def problems(self):
+        found = []
+        for (model, field, kind), count in self.lazy_loads.items():
+            if count < self.threshold:
+                continue
+            fix = f"select_related('{field}')" if kind == 'select' else f"prefetch_related('{field}')"
+            origin = self.lazy_origin[(model, field, kind)]
+            found.append(
+                f"{model}.{field} loaded lazily {count}x"
+                + (f" from {origin}" if origin else "")
+                + f" — add {fix} to the {model} queryset (or the matching '__{field}' path on its parent)"
+            )
+        for shape, count in self.shapes.most_common():
+            if count < self.threshold:
+                break
+            found.append(f"Identical query shape ran {count}x: {shape[:300]}")
+        return found
+
+    def report(self, raise_errors):
+        found = self.problems()
+        if not found:
+            return
+        message = f"Possible N+1 in {self.label}:\n  " + "\n  ".join(found)
+        if raise_errors:
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+def serializer_origin():
+    """The serializer fields on the current stack, outermost first, e.g. 'TeacherStudentSerializer.competition_records'."""
+    from rest_framework import fields, serializers
+
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, serializers.BaseSerializer) and frame.f_code.co_name.startswith('get_'):
+            # SerializerMethodField: get_<field>
+            frames.append(f"{type(owner).__name__}.{frame.f_code.co_name[4:]}")
+        elif isinstance(owner, fields.Field) and not isinstance(owner, serializers.BaseSerializer) \
+                and frame.f_code.co_name == 'get_attribute' and owner.parent is not None:
+            frames.append(f"{type(owner.parent).__name__}.{owner.field_name}")
+        frame = frame.f_back
+    return ' > '.join(dict.fromkeys(reversed(frames)))
+
+
+def _record(model, field, kind):
+    tracker = _tracker.get()
+    if tracker is not None and not _prefetching.get():
+        tracker.record_lazy(model, field, kind)
+
+
+def install():
+    """Wrap Django's related descriptors once per process."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    forward_get_object = related_descriptors.ForwardManyToOneDescriptor.get_object
+
+    def get_object(self, instance):
+        _record(type(instance), self.field.name, 'select')
+        return forward_get_object(self, instance)
+
+    related_descriptors.ForwardManyToOneDescriptor.get_object = get_object
+
+    reverse_one_get_queryset = related_descriptors.ReverseOneToOneDescriptor.get_queryset
+
+    def get_queryset(self, **hints):
+        # Only the lazy __get__ path passes the instance; prefetching does not
+        if 'instance' in hints:
+            _record(type(hints['instance']), self.related.get_accessor_name(), 'select')
+        return reverse_one_get_queryset(self, **hints)
+
+    related_descriptors.ReverseOneToOneDescriptor.get_queryset = get_queryset
+
+    create_reverse = related_descriptors.create_reverse_many_to_one_manager
+
+    def create_reverse_many_to_one_manager(superclass, rel):
+        manager_cls = create_reverse(superclass, rel)
+
+        class TrackedRelatedManager(manager_cls):
+            def get_queryset(self):
+                cache = getattr(self.instance, '_prefetched_objects_cache', {})
+                if self.field.remote_field.cache_name not in cache:
+                    _record(type(self.instance), rel.get_accessor_name(), 'prefetch')
+                return super().get_queryset()
+
+        return TrackedRelatedManager
+
+    related_descriptors.create_reverse_many_to_one_manager = create_reverse_many_to_one_manager
+
+    create_m2m = related_descriptors.create_forward_many_to_many_manager
+
+    def create_forward_many_to_many_manager(superclass, rel, reverse):
+        manager_cls = create_m2m(superclass, rel, reverse)
+
+        class TrackedManyRelatedManager(manager_cls):
+            def get_queryset(self):
+                if self.get_prefetch_cache() is None:
+                    _record(type(self.instance), self.prefetch_cache_name, 'prefetch')
+                return super().get_queryset()
+
+        return TrackedManyRelatedManager
+
+    related_descriptors.create_forward_many_to_many_manager = create_forward_many_to_many_manager
+
+    original_prefetch = query.prefetch_related_objects
+
+    def prefetch_related_objects(model_instances, *related_lookups):
+        token = _prefetching.set(True)
+        try:
+            return original_prefetch(model_instances, *related_lookups)
+        finally:
+            _prefetching.reset(token)
+
+    query.prefetch_related_objects = prefetch_related_objects
+
+
+@contextmanager
+def detect_n_plus_one(label='block', raise_errors=None, threshold=None):
+    conf = config()
+    install()
+    tracker = Tracker(label, threshold or conf['THRESHOLD'], parent=_tracker.get())
+    token = _tracker.set(tracker)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(tracker.db_wrapper))
+            yield tracker
+    finally:
+        _tracker.reset(token)
+    tracker.report(conf['RAISE'] if raise_errors is None else raise_errors)
+
+
+class NPlusOneMiddleware:
+    """Reports (or, with NPLUSONE['RAISE'], raises on) N+1 patterns per request. Removed when disabled."""
+
+    def __init__(self, get_response):
+        if not config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with detect_n_plus_one(label=f"{request.method} {request.path}"):
+            return self.get_response(request)
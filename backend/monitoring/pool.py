@@ -0,0 +1,104 @@
+"""
+Database connection pool (psycopg 3 / psycopg_pool, configured in settings.DATABASES)
+metrics and overload handling.
+
+Each worker process holds one pool per database alias, sized to its gunicorn
+threads, so the server sees at most workers * DB_POOL_MAX connections. Other
+processes with their own threads (runworker) resize their pools with
+size_for() before the first query. When
+every connection is checked out, a request waits up to DB_POOL_TIMEOUT seconds
+and then gets PoolTimeout; PoolTimeoutMiddleware turns that into a 503 with
+Retry-After instead of a 500, and counts it.
+"""
+import logging
+import threading
+
+from django.db import connections
+from django.http import JsonResponse
+
+from .metrics import worker_id
+
+logger = logging.getLogger('monitoring.pool')
+
+RETRY_AFTER = 2
+
+_timeouts = 0
+_lock = threading.Lock()
+
+
+def is_pool_timeout(exc):
+    """True when `exc` is, or was raised from, psycopg_pool's checkout timeout (Django wraps it)."""
+    try:
+        from psycopg_pool import PoolTimeout
+    except ImportError:
+        return False
+    while exc is not None:
+        if isinstance(exc, PoolTimeout):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def size_for(threads):
+    """Sizes this process's pools for `threads` threads that hold a connection at once; call before the first query."""
+    for alias in connections:
+        options = connections[alias].settings_dict.get('OPTIONS', {})
+        if not isinstance(options.get('pool'), dict):
+            continue
+        connections[alias].close_pool()
+        options['pool'] = {**options['pool'], 'max_size': max(threads, options['pool'].get('min_size', 1))}
+
+
+def pool_stats():
+    """Per alias: the pool's configuration and psycopg_pool's counters for this worker."""
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        counters = pool.get_stats()
+        checkouts = counters.get('requests_num', 0)
+        stats[alias] = {
+            'min_size': pool.min_size,
+            'max_size': pool.max_size,
+            'timeout_s': pool.timeout,
+            'max_lifetime_s': pool.max_lifetime,
+            'max_idle_s': pool.max_idle,
+            'size': counters.get('pool_size', 0),
+            'available': counters.get('pool_available', 0),
+            'waiters': counters.get('requests_waiting', 0),
+            'checkouts': checkouts,
+            'queued': counters.get('requests_queued', 0),
+            'avg_wait_ms': round(counters.get('requests_wait_ms', 0) / checkouts, 2) if checkouts else 0.0,
+            'checkout_errors': counters.get('requests_errors', 0),
+            'bad_returns': counters.get('returns_bad', 0),
+            'connections_opened': counters.get('connections_num', 0),
+            'avg_connect_ms': round(counters.get('connections_ms', 0) / counters['connections_num'], 2)
+            if counters.get('connections_num') else 0.0,
+            'connection_errors': counters.get('connections_errors', 0),
+            'connections_lost': counters.get('connections_lost', 0),
+        }
+    return {'worker': worker_id(), 'timeouts_503': _timeouts, 'pools': stats}
+
+
+class PoolTimeoutMiddleware:
+    """Answers 503 + Retry-After when a view could not get a pooled connection in time."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        global _timeouts
+        if not is_pool_timeout(exception):
+            return None
+        with _lock:
+            _timeouts += 1
+        logger.warning("Connection pool exhausted on %s %s", request.method, request.path)
+        response = JsonResponse(
+            {"detail": "The server is busy, please retry shortly."}, status=503,
+        )
+        response['Retry-After'] = str(RETRY_AFTER)
+        return response
@@ -0,0 +1,303 @@
+"""
+Opt-in sampling profiler for production requests.
+
+ProfilingRule rows (admin → Monitoring → Profiling rules) pick the requests:
+an endpoint, a user, a sample rate, or any combination, and they expire on
+their own. For a matching request ProfilerMiddleware registers the request
+thread with a per-process sampler thread, which reads its stack from
+sys._current_frames() every PROFILER['INTERVAL_MS'] and counts identical
+stacks. When the response is ready the counts are stored as a Profile in
+collapsed-stack format, which the admin downloads or renders as a flame graph
+(monitoring/flamegraph.py).
+
+Overhead is capped three ways:
+- the sampler never spends more than PROFILER['MAX_OVERHEAD'] of wall time
+  sampling; when a sample gets expensive it sleeps longer before the next;
+- at most MAX_CONCURRENT requests per process are profiled at once and at
+  most MAX_PER_MINUTE per process per minute;
+- a profile stops collecting after MAX_SAMPLES samples.
+
+Requests that match no rule pay one dict lookup in process_view; rules are
+re-read from the database every RULES_TTL seconds.
+"""
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .metrics import worker_id
+from .middleware import endpoint_name, request_user_id
+
+logger = logging.getLogger('monitoring.profiler')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'INTERVAL_MS': 5,
+    'MAX_OVERHEAD': 0.01,
+    'MAX_CONCURRENT': 2,
+    'MAX_PER_MINUTE': 10,
+    'MAX_SAMPLES': 6000,
+    'RULES_TTL': 30,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'PROFILER', {})}
+
+
+# =============================================================================
+# Sampling
+# =============================================================================
+
+_labels = {}
+_root = os.path.dirname(str(settings.BASE_DIR))
+
+
+def frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_root):
+            filename = os.path.relpath(filename, _root)
+        elif 'site-packages' in filename:
+            filename = filename.split('site-packages' + os.sep, 1)[1]
+        label = _labels[code] = f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+    return label
+
+
+def collapse(frame):
+    """'outermost;...;innermost' for a frame, the collapsed-stack key."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+class Session:
+    __slots__ = ('thread_id', 'stacks', 'samples', 'max_samples', 'started', 'truncated')
+
+    def __init__(self, thread_id, max_samples):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.samples = 0
+        self.max_samples = max_samples
+        self.started = time.perf_counter()
+        self.truncated = False
+
+
+class Sampler(threading.Thread):
+    """Daemon thread that samples the registered request threads; idle while none are registered."""
+
+    def __init__(self, interval, max_overhead):
+        super().__init__(name='monitoring-profiler', daemon=True)
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.sample_time = 0.0
+        self.sample_count = 0
+
+    def add(self, session):
+        with self.lock:
+            self.sessions[session.thread_id] = session
+        self.wakeup.set()
+
+    def remove(self, session):
+        with self.lock:
+            self.sessions.pop(session.thread_id, None)
+
+    def active(self):
+        return len(self.sessions)
+
+    def run(self):
+        while True:
+            if not self.sessions:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            start = time.perf_counter()
+            frames = sys._current_frames()
+            with self.lock:
+                for session in self.sessions.values():
+                    frame = frames.get(session.thread_id)
+                    if frame is None:
+                        continue
+                    if session.samples >= session.max_samples:
+                        session.truncated = True
+                        continue
+                    session.stacks[collapse(frame)] += 1
+                    session.samples += 1
+            del frames
+            cost = time.perf_counter() - start
+            self.sample_time += cost
+            self.sample_count += 1
+            # Hard cap: cost / (cost + sleep) never exceeds MAX_OVERHEAD
+            time.sleep(max(self.interval, cost * (1 - self.max_overhead) / self.max_overhead))
+
+    def effective_interval_ms(self):
+        if not self.sample_count:
+            return self.interval * 1000
+        mean_cost = self.sample_time / self.sample_count
+        return max(self.interval, mean_cost * (1 - self.max_overhead) / self.max_overhead) * 1000
+
+
+# =============================================================================
+# Rules
+# =============================================================================
+
+class RuleCache:
+    """Enabled, unexpired ProfilingRules, re-read at most every `ttl` seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.rules = ()
+        self.loaded_at = float('-inf')
+        self.lock = threading.Lock()
+
+    def get(self):
+        if time.monotonic() - self.loaded_at > self.ttl:
+            with self.lock:
+                if time.monotonic() - self.loaded_at > self.ttl:
+                    self.rules = self.load()
+                    self.loaded_at = time.monotonic()
+        return self.rules
+
+    def load(self):
+        from .models import ProfilingRule
+        try:
+            return tuple(ProfilingRule.objects.filter(enabled=True, expires_at__gt=timezone.now()))
+        except DatabaseError:
+            # e.g. before migrations have run; try again after the TTL
+            logger.exception("Could not load profiling rules")
+            return ()
+
+
+# One per process, shared by every handler (the test client builds a new one per client)
+rule_cache = RuleCache(config()['RULES_TTL'])
+
+
+def match(rules, request, endpoint):
+    """The first rule matching this request (rate applied), or None."""
+    route = endpoint.split(' ', 1)[-1]
+    user_id = None
+    for rule in rules:
+        if rule.endpoint and rule.endpoint not in (endpoint, route):
+            continue
+        if rule.user_id is not None:
+            if user_id is None:
+                user_id = request_user_id(request)
+            if str(rule.user_id) != str(user_id):
+                continue
+        if rule.sample_rate < 1.0 and random.random() >= rule.sample_rate:
+            continue
+        return rule
+    return None
+
+
+# =============================================================================
+# Middleware
+# =============================================================================
+
+class ProfilerMiddleware:
+    """Profiles the requests picked by ProfilingRules. Removed when PROFILER['ENABLED'] is False."""
+
+    def __init__(self, get_response):
+        conf = config()
+        if not conf['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.conf = conf
+        self.sampler = None
+        self.sampler_lock = threading.Lock()
+        self.recent = deque()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        session = getattr(request, '_profile_session', None)
+        if session is not None:
+            self.finish(request, session, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        rules = rule_cache.get()
+        if not rules:
+            return None
+        endpoint = endpoint_name(request)
+        rule = match(rules, request, endpoint)
+        if rule is None or not self.admit():
+            return None
+        session = Session(threading.get_ident(), self.conf['MAX_SAMPLES'])
+        request._profile_session = session
+        request._profile_rule = rule
+        request._profile_endpoint = endpoint
+        request._profile_started_at = timezone.now()
+        self.get_sampler().add(session)
+        return None
+
+    def admit(self):
+        """Concurrency and per-minute caps; both are per process."""
+        now = time.monotonic()
+        with self.sampler_lock:
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            if len(self.recent) >= self.conf['MAX_PER_MINUTE']:
+                return False
+            if self.sampler is not None and self.sampler.active() >= self.conf['MAX_CONCURRENT']:
+                return False
+            self.recent.append(now)
+        return True
+
+    def get_sampler(self):
+        if self.sampler is None or not self.sampler.is_alive():
+            with self.sampler_lock:
+                if self.sampler is None or not self.sampler.is_alive():
+                    self.sampler = Sampler(self.conf['INTERVAL_MS'] / 1000, self.conf['MAX_OVERHEAD'])
+                    self.sampler.start()
+        return self.sampler
+
+    def finish(self, request, session, response):
+        self.sampler.remove(session)
+        if not session.samples:
+            return
+        from .models import Profile
+        rule = request._profile_rule
+        try:
+            Profile.objects.create(
+                rule_id=rule.pk,
+                endpoint=request._profile_endpoint,
+                user_id=request_user_id(request),
+                worker=worker_id(),
+                started_at=request._profile_started_at,
+                duration_ms=round((time.perf_counter() - session.started) * 1000, 1),
+                status_code=response.status_code,
+                interval_ms=round(self.sampler.effective_interval_ms(), 2),
+                samples=session.samples,
+                truncated=session.truncated,
+                stacks=format_collapsed(session.stacks),
+            )
+        except Exception:
+            logger.exception("Failed to store profile for %s", request._profile_endpoint)
+
+
+def format_collapsed(stacks):
+    return '\n'.join(f'{stack} {count}' for stack, count in stacks.most_common())
+
+
+def parse_collapsed(text):
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
@@ -0,0 +1,219 @@
+"""
+Slow-query capture.
+
+An execute wrapper on every database connection times each query. Queries
+slower than SLOW_QUERIES['THRESHOLD_MS'] are kept with their normalized SQL and
+fingerprint (monitoring/sql.py), the endpoint, the call site (the innermost
+frame in our own code, or the view when DRF evaluated the queryset), a hash of
+the parameters and the duration. The first capture of a fingerprint per
+worker and EXPLAIN_INTERVAL also gets an EXPLAIN plan, taken on a backend
+cursor that bypasses the wrappers and inside a savepoint on PostgreSQL, so a
+failing EXPLAIN cannot break the request's transaction.
+
+Captures are buffered in process and written to SlowQuery by
+SlowQueryMiddleware after the response, at most every FLUSH_INTERVAL seconds;
+the admin report aggregates them by fingerprint with counts and p95.
+"""
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from .metrics import worker_id
+from .middleware import endpoint_name
+from .sql import fingerprint, is_savepoint, normalize
+
+logger = logging.getLogger('monitoring.slowqueries')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 100,
+    'EXPLAIN': True,
+    'EXPLAIN_INTERVAL': 3600,
+    'BUFFER': 1000,
+    'FLUSH_INTERVAL': 60,
+}
+
+EXPLAIN_PREFIX = {
+    'postgresql': 'EXPLAIN (ANALYZE off) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'mysql': 'EXPLAIN ',
+}
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+_config = {}
+_view = ContextVar('slow_query_view', default=None)
+_project = str(settings.BASE_DIR) + os.sep
+_own_package = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def load_config(**kwargs):
+    if kwargs.get('setting', 'SLOW_QUERIES') == 'SLOW_QUERIES':
+        _config.clear()
+        _config.update(DEFAULTS, **getattr(settings, 'SLOW_QUERIES', {}))
+
+
+def call_site():
+    """'Qualname (path:line)' of the innermost frame in our own code, skipping this app."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_project) and not filename.startswith(_own_package) and 'site-packages' not in filename:
+            return f"{frame.f_code.co_qualname} ({os.path.relpath(filename, _project)}:{frame.f_lineno})"
+        frame = frame.f_back
+    view = _view.get()
+    return f"{view[1]} (via framework)" if view else ''
+
+
+def params_hash(params):
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+
+
+def explain(connection, sql, params):
+    """The plan as text, or '' when the backend or statement cannot be explained."""
+    prefix = EXPLAIN_PREFIX.get(connection.vendor)
+    if prefix is None or not sql.lstrip()[:6].upper().startswith(EXPLAINABLE):
+        return ''
+    # A backend cursor: no execute wrappers (so no recursion) and no entry in the debug query log
+    cursor = connection.create_cursor()
+    # On PostgreSQL an error aborts the surrounding transaction, so fence the EXPLAIN off
+    savepoint = connection.vendor == 'postgresql' and connection.in_atomic_block
+    try:
+        if savepoint:
+            cursor.execute('SAVEPOINT monitoring_explain')
+        try:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        except connection.Database.Error:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT monitoring_explain')
+            return ''
+        finally:
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT monitoring_explain')
+    finally:
+        cursor.close()
+    # PostgreSQL/MySQL: one line per row; SQLite: (id, parent, notused, detail)
+    return '\n'.join(str(row[-1]) if connection.vendor == 'sqlite' else str(row[0]) for row in rows)
+
+
+class SlowQueryLog:
+    """Bounded buffer of captures plus the per-fingerprint EXPLAIN timestamps, for one worker process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = deque(maxlen=DEFAULTS['BUFFER'])
+        self.explained = {}
+        self.dropped = 0
+        self.last_flush = time.monotonic()
+
+    @property
+    def worker(self):
+        # Not stored: slow_queries is created at import, before gunicorn forks the workers
+        return worker_id()
+
+    def resize(self, size):
+        if self.pending.maxlen != size:
+            with self.lock:
+                self.pending = deque(self.pending, maxlen=size)
+
+    def capture(self, execute, sql, params, many, context):
+        if not _config['ENABLED']:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= _config['THRESHOLD_MS'] and not is_savepoint(sql):
+            try:
+                self.record(context['connection'], sql, params, many, duration_ms)
+            except Exception:
+                logger.exception("Failed to capture slow query")
+        return result
+
+    def record(self, connection, sql, params, many, duration_ms):
+        key = fingerprint(sql)
+        now = time.monotonic()
+        plan = ''
+        if _config['EXPLAIN'] and not many and now - self.explained.get(key, float('-inf')) >= _config['EXPLAIN_INTERVAL']:
+            self.explained[key] = now
+            plan = explain(connection, sql, params)
+        view = _view.get()
+        sample = {
+            'fingerprint': key,
+            'sql': normalize(sql),
+            'endpoint': view[0] if view else '',
+            'call_site': call_site()[:255],
+            'params_hash': params_hash(params),
+            'duration_ms': round(duration_ms, 2),
+            'plan': plan,
+            'captured_at': timezone.now(),
+        }
+        self.resize(_config['BUFFER'])
+        with self.lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(sample)
+        logger.warning("Slow query (%.0f ms) at %s: %s", duration_ms, sample['call_site'], sample['sql'][:300])
+
+    def flush_if_due(self):
+        if not self.pending or time.monotonic() - self.last_flush < _config['FLUSH_INTERVAL']:
+            return
+        with self.lock:
+            samples, self.pending = list(self.pending), deque(maxlen=self.pending.maxlen)
+            dropped, self.dropped = self.dropped, 0
+            self.last_flush = time.monotonic()
+        if dropped:
+            logger.warning("Dropped %d slow-query captures; raise SLOW_QUERIES['BUFFER'] or the threshold", dropped)
+        from .models import SlowQuery
+        try:
+            SlowQuery.objects.bulk_create([SlowQuery(worker=self.worker, **sample) for sample in samples])
+        except Exception:
+            logger.exception("Failed to store %d slow queries", len(samples))
+
+
+slow_queries = SlowQueryLog()
+
+
+def install(connection, **kwargs):
+    # First in the list: execute_wrapper() blocks pop the last entry on exit, so it must not be ours
+    if slow_queries.capture not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_queries.capture)
+
+
+def connect_signals():
+    load_config()
+    setting_changed.connect(load_config)
+    connection_created.connect(install)
+
+
+class SlowQueryMiddleware:
+    """Tags captures with the endpoint and view, and flushes them after the response."""
+
+    def __init__(self, get_response):
+        if not _config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, '_slow_query_view_token', None)
+            if token is not None:
+                _view.reset(token)
+        slow_queries.flush_if_due()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        request._slow_query_view_token = _view.set((endpoint_name(request), view.__qualname__))
@@ -0,0 +1,319 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from psycopg_pool import PoolTimeout
+from rest_framework_simplejwt.tokens import AccessToken
+
+from lms.models import Course, Enrollment
+
+from . import admission, deadlines, memory, metrics, pool, profiler
+from .cache import InstrumentedLocMemCache, InstrumentedRedisCache
+from .models import DeadlineHit, EndpointMetric, MemorySample, SlowQuery
+from .nplusone import NPlusOneError, detect_n_plus_one
+from .slowqueries import slow_queries
+
+User = get_user_model()
+
+
+class RequestMetricsTests(TestCase):
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('course-list'))
+        self.assertEqual(response.status_code, 200)
+        parts = [part.split(';')[0].strip() for part in response['Server-Timing'].split(',')]
+        self.assertEqual(parts, ['db', 'cache', 'ser', 'total'])
+
+    def test_flush_reports_the_pid_at_flush_time(self):
+        # Built before the fork under preload_app; each worker must still report its own pid
+        stats = metrics.EndpointStats(flush_interval=0)
+        with mock.patch('monitoring.metrics.os.getpid', return_value=4242):
+            stats.record('GET test/', 0.01, metrics.RequestMetrics())
+        self.assertTrue(EndpointMetric.objects.get(endpoint='GET test/').worker.endswith(':4242'))
+
+    def count_hits(self, backend, keys):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.activate(request_metrics)
+        try:
+            backend.get_many(keys)
+        finally:
+            metrics.deactivate(token)
+        return request_metrics.cache_hits, request_metrics.cache_misses
+
+    def test_get_many_is_counted_once_per_key(self):
+        locmem = InstrumentedLocMemCache('metrics-test', {})
+        locmem.set('a', 1)
+        self.assertEqual(self.count_hits(locmem, ['a', 'b']), (1, 1))
+        # RedisCache.get_many is one MGET that never calls get()
+        redis = InstrumentedRedisCache('redis://localhost:6379/0', {})
+        redis._cache = SimpleNamespace(get_many=lambda keys: {key: 1 for key in keys if key.endswith(':a')})
+        self.assertEqual(self.count_hits(redis, ['a', 'b', 'c']), (1, 2))
+
+
+class NPlusOneTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(4):
+            course = Course.objects.create(course_name=f'Course {i}', course_description='-', duration='1 Month')
+            student = User.objects.create(email=f's{i}@example.com', username=f's{i}')
+            Enrollment.objects.create(student=student, course=course)
+
+    def test_strict_mode_raises_on_a_lazy_foreign_key(self):
+        with self.assertRaisesMessage(NPlusOneError, "select_related('course')"):
+            with detect_n_plus_one(raise_errors=True):
+                [enrollment.course.course_name for enrollment in Enrollment.objects.all()]
+
+    def test_strict_mode_raises_on_an_unprefetched_reverse_relation(self):
+        with self.assertRaisesMessage(NPlusOneError, "prefetch_related('enrollments')"):
+            with detect_n_plus_one(raise_errors=True):
+                [course.enrollments.count() for course in Course.objects.all()]
+
+    def test_select_and_prefetch_related_pass(self):
+        with detect_n_plus_one(raise_errors=True):
+            [enrollment.course.course_name for enrollment in Enrollment.objects.select_related('course')]
+            [list(course.enrollments.all()) for course in Course.objects.prefetch_related('enrollments')]
+
+    def test_below_the_threshold_passes(self):
+        with detect_n_plus_one(raise_errors=True, threshold=5):
+            [enrollment.course.course_name for enrollment in Enrollment.objects.all()]
+
+
+class ProfilerTests(TestCase):
+    def test_collapsed_stacks_round_trip(self):
+        stacks = Counter({'main;view;query': 3, 'main;view': 1})
+        self.assertEqual(profiler.parse_collapsed(profiler.format_collapsed(stacks)), stacks)
+
+    def test_sampler_records_the_registered_thread(self):
+        def busy():
+            deadline = time.perf_counter() + 0.2
+            while time.perf_counter() < deadline:
+                pass
+
+        thread = threading.Thread(target=busy)
+        thread.start()
+        sampler = profiler.Sampler(interval=0.001, max_overhead=0.5)
+        sampler.start()
+        session = profiler.Session(thread.ident, max_samples=5)
+        sampler.add(session)
+        thread.join()
+        sampler.remove(session)
+        self.assertEqual(session.samples, 5)
+        self.assertTrue(session.truncated)
+        self.assertTrue(all('busy' in stack for stack in session.stacks))
+
+    def test_rules_match_on_endpoint_and_user(self):
+        request = RequestFactory().get('/api/lms/dashboard/')
+        request.user = SimpleNamespace(is_authenticated=True, pk=7)
+        rule = lambda **kw: SimpleNamespace(**{'endpoint': '', 'user_id': None, 'sample_rate': 1.0, **kw})
+        endpoint = 'GET api/lms/dashboard/'
+        self.assertIsNotNone(profiler.match([rule()], request, endpoint))
+        self.assertIsNotNone(profiler.match([rule(endpoint='api/lms/dashboard/', user_id=7)], request, endpoint))
+        self.assertIsNone(profiler.match([rule(endpoint='GET api/lms/courses/')], request, endpoint))
+        self.assertIsNone(profiler.match([rule(user_id=8)], request, endpoint))
+        self.assertIsNone(profiler.match([rule(sample_rate=0.0)], request, endpoint))
+
+    @override_settings(PROFILER={'MAX_PER_MINUTE': 2})
+    def test_admission_is_capped_per_minute(self):
+        middleware = profiler.ProfilerMiddleware(lambda request: None)
+        self.assertEqual([middleware.admit() for _ in range(3)], [True, True, False])
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        slow_queries.pending.clear()
+        slow_queries.explained.clear()
+
+    @contextmanager
+    def capture_everything(self):
+        with self.settings(SLOW_QUERIES={'THRESHOLD_MS': 0, 'FLUSH_INTERVAL': 0}), \
+                self.assertLogs('monitoring.slowqueries', 'WARNING'):
+            yield
+
+    def test_captures_one_plan_per_fingerprint(self):
+        with self.capture_everything():
+            list(Course.objects.filter(course_name='a'))
+            list(Course.objects.filter(course_name='b'))
+        first, second = [s for s in slow_queries.pending if 'lms_course' in s['sql']]
+        self.assertEqual(first['fingerprint'], second['fingerprint'])
+        self.assertNotEqual(first['params_hash'], second['params_hash'])
+        self.assertTrue(first['plan'])
+        self.assertEqual(second['plan'], '')
+        # Frames in the monitoring app itself are skipped
+        self.assertNotIn('monitoring', first['call_site'])
+
+    def test_flush_stores_the_captures(self):
+        with self.capture_everything():
+            Course.objects.count()
+            slow_queries.flush_if_due()
+        stored = SlowQuery.objects.get(sql__contains='COUNT')
+        self.assertEqual(stored.worker, metrics.worker_id())
+
+    def test_fast_queries_are_ignored(self):
+        Course.objects.count()
+        self.assertFalse(slow_queries.pending)
+
+
+class MemoryTests(TestCase):
+    def test_endpoint_accounting(self):
+        tracker = memory.MemoryTracker()
+        for _ in range(2):
+            tracker.end('GET api/lms/dashboard/', tracker.begin())
+        self.assertEqual(tracker.requests, 2)
+        self.assertEqual(tracker.endpoint_table()['GET api/lms/dashboard/']['requests'], 2)
+        self.assertEqual(tracker.in_flight, 0)
+
+    def test_cache_usage_counts_locmem_entries(self):
+        cache.clear()
+        cache.set_many({'a': 'x' * 4096, 'b': 1})
+        entries, size_kb = memory.cache_usage()
+        self.assertEqual(entries, 2)
+        self.assertGreaterEqual(size_kb, 4)
+
+    def test_sample_stores_a_row(self):
+        tracker = memory.MemoryTracker()
+        tracker.end('GET /', tracker.begin())
+        tracker.sample_if_due(0)
+        self.assertEqual(MemorySample.objects.get().endpoints['GET /']['requests'], 1)
+
+    def test_a_failing_sample_is_logged_not_raised(self):
+        tracker = memory.MemoryTracker()
+        with mock.patch('monitoring.memory.cache_usage', side_effect=RuntimeError("dictionary changed size during iteration")), \
+                self.assertLogs('monitoring.memory', 'ERROR'):
+            tracker.sample_if_due(0)
+        self.assertFalse(MemorySample.objects.exists())
+
+
+class PoolTimeoutTests(TestCase):
+    def setUp(self):
+        self.middleware = pool.PoolTimeoutMiddleware(lambda request: None)
+        self.request = RequestFactory().get('/api/lms/dashboard/')
+
+    def test_a_wrapped_pool_timeout_becomes_a_503(self):
+        try:
+            try:
+                raise PoolTimeout("couldn't get a connection after 5.00 sec")
+            except PoolTimeout as exc:
+                raise OperationalError("pool exhausted") from exc
+        except OperationalError as exc:
+            error = exc
+        before = pool.pool_stats()['timeouts_503']
+        with self.assertLogs('monitoring.pool', 'WARNING'):
+            response = self.middleware.process_exception(self.request, error)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(pool.RETRY_AFTER))
+        self.assertEqual(pool.pool_stats()['timeouts_503'], before + 1)
+
+    def test_other_errors_are_left_alone(self):
+        self.assertIsNone(self.middleware.process_exception(self.request, OperationalError("disk full")))
+
+    def test_stats_skip_connections_without_a_pool(self):
+        # SQLite in tests: no pools to report
+        self.assertEqual(pool.pool_stats()['pools'], {})
+
+    def test_size_for_resizes_pooled_aliases_only(self):
+        pooled = SimpleNamespace(settings_dict={'OPTIONS': {'pool': {'min_size': 1, 'max_size': 2}}},
+                                 close_pool=mock.Mock())
+        plain = SimpleNamespace(settings_dict={'OPTIONS': {}}, close_pool=mock.Mock())
+        with mock.patch.object(pool, 'connections', {'default': pooled, 'sqlite': plain}):
+            pool.size_for(4)
+        self.assertEqual(pooled.settings_dict['OPTIONS']['pool'], {'min_size': 1, 'max_size': 4})
+        pooled.close_pool.assert_called_once_with()
+        plain.close_pool.assert_not_called()
+
+
+class DeadlineTests(TestCase):
+    def test_check_raises_once_the_budget_is_spent(self):
+        deadline = deadlines.Deadline('GET /', budget_ms=50)
+        deadline.check()
+        deadline.expires = time.monotonic() - 1
+        with self.assertRaises(deadlines.DeadlineExceeded):
+            deadline.check()
+        self.assertTrue(deadline.tripped)
+
+    def test_sqlite_interrupt_fires_once_after_expiry(self):
+        deadline = deadlines.Deadline('GET /', budget_ms=50)
+        self.assertEqual(deadline.interrupt(), 0)
+        deadline.expires = time.monotonic() - 1
+        self.assertEqual([deadline.interrupt(), deadline.interrupt()], [1, 0])
+
+    def test_an_overrun_answers_503_and_is_recorded(self):
+        token = AccessToken.for_user(User.objects.create(email='d@example.com', username='d'))
+        profiler.rule_cache.get()  # loaded already, as on any warm worker
+        # A microsecond: spent before the view's first query
+        with self.settings(REQUEST_DEADLINES={'ENDPOINTS': {'GET api/lms/competitions/': 0.001}}), \
+                self.assertLogs('monitoring.deadlines', 'WARNING'):
+            response = self.client.get(reverse('competition-list'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(deadlines.RETRY_AFTER))
+        hit = DeadlineHit.objects.get()
+        self.assertEqual((hit.endpoint, hit.kind), ('GET api/lms/competitions/', 'budget'))
+        self.assertIsNone(deadlines.current())
+
+    def test_other_endpoints_keep_the_default(self):
+        with self.settings(REQUEST_DEADLINES={'ENDPOINTS': {'GET api/lms/competitions/': 0.001}}):
+            self.assertEqual(self.client.get(reverse('course-list')).status_code, 200)
+
+
+class AdmissionTests(TestCase):
+    # Slow refill rates, so no token comes back during a test
+    def setUp(self):
+        cache.clear()
+
+    def test_bucket_admits_the_burst_then_refills_at_the_rate(self):
+        with mock.patch.object(admission.time, 'time', return_value=1000.0) as clock:
+            self.assertEqual([admission.take_token('t', rate=1, burst=3) > 0 for _ in range(4)], [False, False, False, True])
+            self.assertAlmostEqual(admission.take_token('t', rate=1, burst=3), 1.0)
+            clock.return_value = 1001.5  # one and a half tokens later
+            self.assertEqual([admission.take_token('t', rate=1, burst=3) > 0 for _ in range(2)], [False, True])
+            clock.return_value = 1100.0  # refilled up to the burst, not beyond
+            self.assertEqual([admission.take_token('t', rate=1, burst=3) > 0 for _ in range(4)], [False, False, False, True])
+
+    def middleware(self, shared_cache=True, **classes):
+        with self.settings(ADMISSION={'CLASSES': {'normal': {}, **classes}, 'DEFAULT_CLASS': 'normal'}), \
+                mock.patch.object(admission, 'cache_is_shared', return_value=shared_cache):
+            return admission.AdmissionMiddleware(lambda request: HttpResponse())
+
+    def request(self, user_id=None, address='10.0.0.1'):
+        request = RequestFactory().get('/api/accounts/login/', REMOTE_ADDR=address)
+        request.user = SimpleNamespace(is_authenticated=user_id is not None, pk=user_id)
+        return request
+
+    def statuses(self, middleware, requests):
+        responses = [middleware.process_view(request, None, (), {}) for request in requests]
+        return [200 if response is None else response.status_code for response in responses]
+
+    def test_anonymous_calls_use_the_per_address_rate(self):
+        middleware = self.middleware(normal={'RATE': (0.001, 1), 'ANON_RATE': (0.001, 3)})
+        with self.assertLogs('monitoring.admission', 'INFO'):
+            self.assertEqual(self.statuses(middleware, [self.request() for _ in range(4)]), [200, 200, 200, 429])
+            self.assertEqual(self.statuses(middleware, [self.request(user_id=1) for _ in range(2)]), [200, 429])
+        # Another address, another bucket
+        self.assertEqual(self.statuses(middleware, [self.request(address='10.0.0.2')]), [200])
+
+    def test_rate_limits_are_off_without_a_shared_cache(self):
+        middleware = self.middleware(shared_cache=False, normal={'RATE': (0.001, 1)})
+        self.assertEqual(self.statuses(middleware, [self.request(user_id=1) for _ in range(3)]), [200, 200, 200])
+        self.assertFalse(admission.controller.stats()['rate_limits'])
+
+    def test_requests_queued_too_long_are_shed(self):
+        middleware = self.middleware(normal={'LIMIT': 1, 'MAX_QUEUE_MS': 10})
+        self.assertEqual(self.statuses(middleware, [self.request(user_id=1)]), [200])
+        with self.assertLogs('monitoring.admission', 'WARNING'):
+            response = middleware.process_view(self.request(user_id=2), None, (), {})
+        self.assertEqual((response.status_code, response['Retry-After']), (503, str(admission.RETRY_AFTER)))
+        stats = admission.controller.stats()['classes']['normal']
+        self.assertEqual((stats['admitted'], stats['queued'], stats['shed_503']), (1, 1, 1))
+
+    def test_upstream_queue_time_units(self):
+        now = time.time()
+        for value in (f't={now - 2:.3f}', str(int((now - 2) * 1e3)), str(int((now - 2) * 1e6))):
+            request = RequestFactory().get('/', HTTP_X_REQUEST_START=value)
+            self.assertAlmostEqual(admission.upstream_queue_ms(request), 2000, delta=100)
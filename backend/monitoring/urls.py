@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('memory/', views.MemoryView.as_view(), name='monitoring-memory'),
+    path('admission/', views.AdmissionView.as_view(), name='monitoring-admission'),
+    path('pool/', views.PoolView.as_view(), name='monitoring-pool'),
+]
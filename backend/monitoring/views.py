@@ -0,0 +1,57 @@
+import tracemalloc
+
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+
+from .admission import controller
+from .memory import config, tracker
+from .pool import pool_stats
+
+
+class MemoryView(generics.GenericAPIView):
+    """
+    Staff-only memory report for the worker that serves the request.
+    GET: RSS, heap, cache size, per-endpoint table and, with tracing on, the top
+    allocation growth since the baseline (?top=25&group=lineno|filename|traceback).
+    POST: take a new baseline snapshot.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        data = tracker.status()
+        data['endpoints'] = dict(sorted(
+            tracker.endpoint_table().items(), key=lambda item: item[1]['rss_growth_kb'], reverse=True,
+        ))
+        if tracemalloc.is_tracing():
+            group_by = request.query_params.get('group', 'lineno')
+            if group_by not in ('lineno', 'filename', 'traceback'):
+                return Response({"detail": "group must be lineno, filename or traceback."}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                top = int(request.query_params.get('top', config()['TOP']))
+            except ValueError:
+                return Response({"detail": "top must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+            data['baseline_at'] = tracker.baseline_at
+            data['top_growth'] = tracker.top_growth(top, group_by)
+        return Response(data)
+
+    def post(self, request):
+        if not tracemalloc.is_tracing():
+            return Response({"detail": "tracemalloc is off; set MEMORY_TRACEMALLOC=True."}, status=status.HTTP_400_BAD_REQUEST)
+        tracker.reset_baseline()
+        return Response({"detail": "Baseline reset.", "baseline_at": tracker.baseline_at})
+
+
+class PoolView(generics.GenericAPIView):
+    """Staff-only connection pool counters (size, waiters, checkouts, waits, lifetime) of the serving worker."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_stats())
+
+
+class AdmissionView(generics.GenericAPIView):
+    """Staff-only admission counters per priority class (admitted, queued, shed, throttled) of the serving worker."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(controller.stats())
@@ -4,13 +4,28 @@ const API = axios.create({
     baseURL: "http://127.0.0.1:8000/api/",
 });
 
+// Read-your-writes: after a write the server answers with a short-lived
+// X-DB-Pin token; sending it back keeps our next reads on the primary database
+let dbPin = null;
+
 // Attach token automatically
 API.interceptors.request.use((config) => {
     const token = localStorage.getItem("token");
     if (token) {
         config.headers.Authorization = `Bearer ${token}`;
     }
+    if (dbPin) {
+        config.headers["X-DB-Pin"] = dbPin;
+    }
     return config;
 });
 
-export default API;
\ No newline at end of file
+API.interceptors.response.use((response) => {
+    const pin = response.headers["x-db-pin"];
+    if (pin) {
+        dbPin = pin;
+    }
+    return response;
+});
+
+export default API;